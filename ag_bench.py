@@ -0,0 +1,1436 @@
+# bench.py
+
+import argparse
+import gc
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import ag_operations
+from ag_operations import (
+    GENRES, books, members, add_book, add_member, borrow_book, return_book, search_books, search_page, update_book,
+    update_member, delete_book, delete_member, get_borrowers, reset_library, enable_thread_safety,
+    disable_thread_safety, enable_quiet_mode, disable_quiet_mode, set_instrumentation, available_books,
+    genre_counts, process_loans, overdue_loans, loans_due_next, fuzzy_search, set_statistics, set_storage,
+    books_by_genre, configure_search_cache, search_cache_stats, iter_search
+)
+from ag_catalog import MappedCatalog, write_catalog
+from ag_data import COPY_WEIGHTS, GENRE_WEIGHTS, TITLE_WORDS, generate_library, misspell, random_author, random_title
+from ag_import import import_books, import_members
+from ag_metrics import Metrics
+from ag_persistence import Persistence
+from ag_records import Book, Member
+from ag_shards import ShardedLibrary
+from ag_sqlite import SQLiteStorage
+from ag_stats import CirculationStats
+from ag_trace import TraceRecorder, generate_trace, print_replay, replay
+
+
+#function to read the current resident set size
+def _rss_bytes():
+    """Returns the process's current resident memory in bytes, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+# Member Lookup Benchmark
+
+def _populate_members(count):
+    """Resets the library and registers `count` members with IDs M0000000.. plus one well-stocked book."""
+    reset_library()
+    for i in range(count):
+        add_member(f"M{i:07d}", f"Member {i}", f"member{i}@lib.com")
+    add_book("BENCH-1", "Benchmark Book", "Bench Author", "Fiction", count)
+
+
+def bench_member_lookup(sizes=(1_000, 10_000, 100_000, 1_000_000), operations=20_000, seed=42):
+    """
+    Times member-keyed operations (lookup, update_member, borrow_book + return_book, delete_member) at
+    several membership sizes. With the member index the per-call cost should stay flat as membership grows.
+
+    :param sizes: Membership sizes to benchmark (iterable of integers).
+    :param operations: Number of calls timed per operation and size (integer).
+    :param seed: Seed for choosing which members are looked up (integer).
+    :return: A list of result dictionaries, one per size, with nanoseconds per call.
+    """
+    rng = random.Random(seed)
+    results = []
+
+    for size in sizes:
+        _populate_members(size)
+        ids = [f"M{rng.randrange(size):07d}" for _ in range(operations)]
+
+        start = time.perf_counter()
+        for member_id in ids:
+            ag_operations._find_member(member_id)
+        lookup_ns = (time.perf_counter() - start) / operations * 1e9
+
+        start = time.perf_counter()
+        for member_id in ids:
+            update_member(member_id, email="bench@lib.com")
+        update_ns = (time.perf_counter() - start) / operations * 1e9
+
+        start = time.perf_counter()
+        for member_id in ids:
+            borrow_book("BENCH-1", member_id)
+            return_book("BENCH-1", member_id)
+        cycle_ns = (time.perf_counter() - start) / operations * 1e9
+
+        doomed = [f"M{i:07d}" for i in rng.sample(range(size), min(size, operations))]
+        start = time.perf_counter()
+        for member_id in doomed:
+            delete_member(member_id)
+        delete_ns = (time.perf_counter() - start) / len(doomed) * 1e9
+
+        results.append({"members": size, "lookup_ns": lookup_ns, "update_ns": update_ns, "borrow_return_ns": cycle_ns,
+                        "delete_ns": delete_ns})
+
+    reset_library()
+    return results
+
+
+def print_member_lookup(results):
+    """Prints the results of bench_member_lookup as a table."""
+    print(f"{'members':>10} | {'lookup ns':>10} | {'update ns':>10} | {'borrow+return ns':>16} | {'delete ns':>10}")
+    print("-" * 69)
+    for row in results:
+        print(f"{row['members']:>10} | {row['lookup_ns']:>10.0f} | {row['update_ns']:>10.0f} | {row['borrow_return_ns']:>16.0f}"
+              f" | {row['delete_ns']:>10.0f}")
+
+
+# Search Benchmark
+
+def _populate_books(count, rng):
+    """Resets the library and adds `count` books with synthetic titles and authors."""
+    reset_library()
+    for i in range(count):
+        add_book(f"ISBN{i:08d}", random_title(rng), random_author(rng), rng.choice(GENRES), rng.randint(1, 5))
+
+
+def _scan_search(query, by="title"):
+    """Reference full-catalog scan equivalent to search_books, used as the baseline."""
+    query = query.strip().lower()
+    return [isbn for isbn, book in books.items() if query in book[by].lower()]
+
+
+def bench_search(sizes=(1_000, 100_000, 1_000_000), seed=42):
+    """
+    Times selective title/author queries through search_books against a full catalog scan,
+    plus one broad query whose cost is dominated by the number of hits, both as a full result list
+    and as the first 20-book page from search_page.
+
+    :param sizes: Catalog sizes to benchmark (iterable of integers).
+    :param seed: Seed for the synthetic catalog (integer).
+    :return: A list of result dictionaries, one per size, with milliseconds per query.
+    """
+    rng = random.Random(seed)
+    results = []
+
+    for size in sizes:
+        _populate_books(size, rng)
+        # Query fragments of existing titles/authors, as a patron looking for a known book would
+        sample = [books[f"ISBN{rng.randrange(size):08d}"] for _ in range(20)]
+        selective = [(book["title"][-12:], "title") for book in sample[:10]]
+        selective += [(book["author"][-8:], "author") for book in sample[10:]]
+
+        start = time.perf_counter()
+        for query, by in selective:
+            search_books(query, by=by)
+        selective_ms = (time.perf_counter() - start) / len(selective) * 1e3
+
+        # A broad single-word query matching a large share of the catalog
+        start = time.perf_counter()
+        broad_hits = len(search_books("night"))
+        broad_ms = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        search_page("night", limit=20)
+        page_ms = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        for query, by in selective:
+            _scan_search(query, by)
+        scan_ms = (time.perf_counter() - start) / len(selective) * 1e3
+
+        results.append({"books": size, "selective_ms": selective_ms, "broad_hits": broad_hits, "broad_ms": broad_ms,
+                        "page_ms": page_ms, "scan_ms": scan_ms})
+
+    reset_library()
+    return results
+
+
+def print_search(results):
+    """Prints the results of bench_search as a table."""
+    print(f"{'books':>10} | {'selective ms':>12} | {'scan ms':>9} | {'broad hits':>10} | {'broad ms':>9} | "
+          f"{'page ms':>8}")
+    print("-" * 74)
+    for row in results:
+        print(f"{row['books']:>10} | {row['selective_ms']:>12.3f} | {row['scan_ms']:>9.2f} | "
+              f"{row['broad_hits']:>10} | {row['broad_ms']:>9.2f} | {row['page_ms']:>8.2f}")
+
+
+# Fuzzy Search Benchmark
+
+def bench_fuzzy(sizes=(10_000, 100_000, 1_000_000), queries=40, seed=42):
+    """
+    Times fuzzy_search (top 10) on misspelled authors and title fragments of existing books, and
+    counts how often the misspelled book's own author/title words are found, i.e. the top result
+    scores as high as the book would.
+
+    :param sizes: Catalog sizes to benchmark (iterable of integers).
+    :param queries: Number of misspelled queries per size (integer).
+    :param seed: Seed for the synthetic catalog and the typos (integer).
+    :return: A list of result dictionaries, one per size, with mean and worst milliseconds per query.
+    """
+    rng = random.Random(seed)
+    results = []
+    for size in sizes:
+        _populate_books(size, rng)
+        sample = [books[f"ISBN{rng.randrange(size):08d}"] for _ in range(queries)]
+        workload = [(misspell(book["author"], rng), "author") if i % 2 else
+                    (misspell(" ".join(book["title"].split()[:3]), rng), "title")
+                    for i, book in enumerate(sample)]
+        timings = []
+        found = 0
+        for book, (query, by) in zip(sample, workload):
+            start = time.perf_counter()
+            ranked = fuzzy_search(query, by=by)
+            timings.append((time.perf_counter() - start) * 1e3)
+            found += bool(ranked) and set(ranked[0][by].lower().split()) >= set(book[by].lower().split()[:3])
+        results.append({"books": size, "mean_ms": sum(timings) / len(timings), "max_ms": max(timings),
+                        "found": found / len(workload)})
+
+    reset_library()
+    return results
+
+
+def print_fuzzy(results):
+    """Prints the results of bench_fuzzy as a table."""
+    print(f"{'books':>10} | {'mean ms':>8} | {'max ms':>8} | {'found':>6}")
+    print("-" * 42)
+    for row in results:
+        print(f"{row['books']:>10} | {row['mean_ms']:>8.2f} | {row['max_ms']:>8.2f} | {row['found']:>6.0%}")
+
+
+# Browse Benchmark
+
+def bench_browse(sizes=(10_000, 100_000, 1_000_000), seed=42):
+    """
+    Times browse queries answered from the genre and availability indexes against scanning the catalog,
+    on generated libraries (see generate_library).
+
+    :param sizes: Catalog sizes to benchmark (iterable of integers).
+    :param seed: Seed for the generated libraries (integer).
+    :return: A list of result dictionaries, one per size, with milliseconds per query.
+    """
+    results = []
+    for size in sizes:
+        generate_library(size, seed)
+        row = {"books": size, "available_biographies": len(available_books("Biography"))}
+        gc.collect()  # don't charge a pending collection of the freshly generated library to the first query
+
+        start = time.perf_counter()
+        available_books("Biography")
+        row["indexed_ms"] = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        [isbn for isbn, book in books.items() if book.genre == "Biography" and book.total_copies > 0]
+        row["scan_ms"] = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        for _ in range(1_000):
+            genre_counts()
+        row["counts_us"] = (time.perf_counter() - start) * 1e3
+        results.append(row)
+
+    reset_library()
+    return results
+
+
+def print_browse(results):
+    """Prints the results of bench_browse as a table."""
+    print(f"{'books':>10} | {'hits':>7} | {'available_books ms':>18} | {'scan ms':>8} | {'genre_counts us':>15}")
+    print("-" * 71)
+    for row in results:
+        print(f"{row['books']:>10} | {row['available_biographies']:>7} | {row['indexed_ms']:>18.2f} | "
+              f"{row['scan_ms']:>8.2f} | {row['counts_us']:>15.1f}")
+
+
+# Search Cache Benchmark
+
+def bench_search_cache(size=100_000, searches=5_000, distinct=300, write_shares=(0.0, 0.001, 0.01), seed=42):
+    """
+    Replays a skewed search workload (Zipf-distributed picks from `distinct` title/author queries)
+    with the search cache disabled and enabled, optionally interleaved with catalog changes (add_book)
+    that invalidate the cache.
+
+    :param size: Catalog size (integer).
+    :param searches: Number of search_books calls per run (integer).
+    :param distinct: Number of distinct queries (integer).
+    :param write_shares: Fractions of the calls that are add_book instead of a search (iterable of floats).
+    :param seed: Seed for the catalog and the workload (integer).
+    :return: A list of result dictionaries with searches/sec without and with the cache, and the hit rate.
+    """
+    rng = random.Random(seed)
+    _populate_books(size, rng)
+    sample = [books[f"ISBN{rng.randrange(size):08d}"] for _ in range(distinct)]
+    # Patrons type the last words of a title, or an author's surname
+    queries = [(" ".join(book["title"].split()[-2:]), "title") if i % 3 else (book["author"].split()[-1], "author")
+               for i, book in enumerate(sample)]
+    popularity = list(itertools.accumulate(1 / rank for rank in range(1, distinct + 1)))
+
+    results = []
+    for write_share in write_shares:
+        row = {"write_share": write_share}
+        for label, capacity in (("uncached", 0), ("cached", 1024)):
+            ag_operations.configure_search_cache(capacity)
+            ag_operations._search_cache.hits = ag_operations._search_cache.misses = 0
+            workload = random.Random(seed)
+            picks = workload.choices(queries, cum_weights=popularity, k=searches)
+            added = 0
+            start = time.perf_counter()
+            for query, by in picks:
+                if write_share and workload.random() < write_share:
+                    added += 1
+                    add_book(f"W{label}{write_share}-{added}", random_title(workload), random_author(workload),
+                             "Fiction", 1)
+                search_books(query, by=by)
+            row[f"{label}_per_sec"] = searches / (time.perf_counter() - start)
+            row["hit_rate"] = ag_operations.search_cache_stats()["hit_rate"]
+        results.append(row)
+
+    ag_operations.configure_search_cache(1024)
+    reset_library()
+    return results
+
+
+def print_search_cache(results):
+    """Prints the results of bench_search_cache as a table."""
+    print(f"{'writes':>8} | {'uncached/s':>10} | {'cached/s':>10} | {'hit rate':>8}")
+    print("-" * 46)
+    for row in results:
+        print(f"{row['write_share']:>8.1%} | {row['uncached_per_sec']:>10,.0f} | {row['cached_per_sec']:>10,.0f} | "
+              f"{row['hit_rate']:>8.1%}")
+
+
+# Sharding Benchmark
+
+def bench_shards(size=200_000, worker_counts=(1, 2, 4), searches=500, seed=42):
+    """
+    Measures search_books throughput on a ShardedLibrary with different numbers of worker processes,
+    against the same searches in this process. Each search runs on all shards at once, so throughput
+    can only scale with the worker count up to the number of CPU cores.
+
+    :param size: Catalog size (integer).
+    :param worker_counts: Numbers of shards to benchmark (iterable of integers).
+    :param searches: Number of search_books calls per run (integer).
+    :param seed: Seed for the catalog and the queries (integer).
+    :return: A list of result dictionaries with searches/sec, the first one (0 workers) in-process.
+    """
+    rng = random.Random(seed)
+    _populate_books(size, rng)
+    rows = [(isbn, book.title, book.author, book.genre, book.total_copies) for isbn, book in books.items()]
+    sample = [books[f"ISBN{rng.randrange(size):08d}"] for _ in range(searches)]
+    queries = [(" ".join(book["title"].split()[-2:]), "title") if i % 3 else (book["author"].split()[-1], "author")
+               for i, book in enumerate(sample)]
+    ag_operations.configure_search_cache(0)  # measure the searches themselves, not cache hits
+
+    start = time.perf_counter()
+    hits = sum(len(search_books(query, by=by)) for query, by in queries)
+    results = [{"workers": 0, "per_sec": searches / (time.perf_counter() - start), "hits": hits}]
+    reset_library()
+
+    for workers in worker_counts:
+        with ShardedLibrary(workers) as library:
+            library.load_books(rows)
+            library.configure_search_cache(0)
+            start = time.perf_counter()
+            hits = sum(len(library.search_books(query, by=by)) for query, by in queries)
+            results.append({"workers": workers, "per_sec": searches / (time.perf_counter() - start), "hits": hits})
+
+    ag_operations.configure_search_cache(1024)
+    return results
+
+
+def print_shards(results):
+    """Prints the results of bench_shards as a table."""
+    print(f"CPU cores: {os.cpu_count()}")
+    print(f"{'workers':>10} | {'searches/s':>10} | {'hits':>8}")
+    print("-" * 34)
+    for row in results:
+        workers = row["workers"] or "in-proc"
+        print(f"{workers:>10} | {row['per_sec']:>10,.0f} | {row['hits']:>8}")
+
+
+# Mapped Catalog Benchmark
+
+#function to read a process's memory split into anonymous (private) and file-backed (shareable) pages
+def _memory_status():
+    """Returns {"rss", "anon", "file"} in bytes from /proc/self/status, or None where it is unavailable."""
+    fields = {"VmRSS:": "rss", "RssAnon:": "anon", "RssFile:": "file"}
+    try:
+        with open("/proc/self/status") as f:
+            values = {fields[line.split()[0]]: int(line.split()[1]) * 1024 for line in f if line.split()[0] in fields}
+    except (OSError, ValueError, IndexError):
+        return None
+    return values if len(values) == len(fields) else None
+
+
+def _catalog_worker(mode, directory, probes_path):
+    """
+    Body of a bench_mapped worker process: loads the catalog from `directory` either from the
+    snapshot into the dictionaries ("dicts") or by mapping catalog.bin ("mapped"), then runs the
+    probe lookups and searches and prints a JSON result line.
+    """
+    with open(probes_path, encoding="utf-8") as f:
+        probes = json.load(f)
+    before = _memory_status()
+    start = time.perf_counter()
+    if mode == "dicts":
+        store = Persistence(directory)
+        store.recover()
+        store.close()
+        lookup, search = books.get, search_books
+    else:
+        catalog = MappedCatalog(os.path.join(directory, "catalog.bin"))
+        lookup, search = catalog.get, catalog.search_books
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = sum(lookup(isbn) is not None for isbn in probes["isbns"])
+    lookup_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    hits = sum(len(search(query, by)) for query, by in probes["queries"])
+    search_seconds = time.perf_counter() - start
+    print(json.dumps({"load_seconds": load_seconds, "before": before, "after": _memory_status(), "found": found,
+                      "lookup_us": lookup_seconds / len(probes["isbns"]) * 1e6,
+                      "search_ms": search_seconds / len(probes["queries"]) * 1e3, "hits": hits}))
+
+
+def bench_mapped(size=1_000_000, lookups=10_000, searches=20, seed=42):
+    """
+    Compares starting a worker process from the snapshot (loading the dictionaries and their search
+    indexes, as Persistence.recover does) with mapping a binary catalog file (MappedCatalog).
+    Each mode runs in a fresh Python process, which reports its load time, its memory once the
+    lookups and searches have run, and their latency. Memory is split into anonymous pages, private
+    to the process, and file-backed pages, which every process mapping the catalog shares.
+
+    :param size: Catalog size (integer).
+    :param lookups: Number of ISBN lookups per process (integer).
+    :param searches: Number of search_books calls per process (integer).
+    :param seed: Seed for the catalog and the probes (integer).
+    :return: A dictionary with the file sizes and a result dictionary per mode.
+    """
+    directory = tempfile.mkdtemp(prefix="ag_bench_")
+    try:
+        generate_library(size, seed, members_per_book=0, loan_load=0)
+        Persistence(directory).snapshot()
+        write_catalog(os.path.join(directory, "catalog.bin"))
+        rng = random.Random(seed)
+        sample = [books[f"G{rng.randrange(size):08d}"] for _ in range(searches)]
+        probes = {"isbns": [f"G{rng.randrange(size):08d}" for _ in range(lookups)],
+                  "queries": [(book.title.split()[-1], "title") if i % 2 else (book.author.split()[-1], "author")
+                              for i, book in enumerate(sample)]}
+        reset_library()
+        probes_path = os.path.join(directory, "probes.json")
+        with open(probes_path, "w", encoding="utf-8") as f:
+            json.dump(probes, f)
+        file_sizes = {name: os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)}
+
+        results = {}
+        for mode in ("dicts", "mapped"):
+            start = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, "-c", f"import ag_bench; ag_bench._catalog_worker({mode!r}, {directory!r}, "
+                                       f"{probes_path!r})"],
+                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout
+            results[mode] = json.loads(output.splitlines()[-1])
+            results[mode]["process_seconds"] = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+    return {"size": size, "snapshot_mb": sum(size for name, size in file_sizes.items()
+                                              if name.startswith("snapshot-")) / 2 ** 20,
+            "catalog_mb": file_sizes["catalog.bin"] / 2 ** 20, "modes": results}
+
+
+def print_mapped(result):
+    """Prints the results of bench_mapped as a table."""
+    print(f"{result['size']:,} books: snapshot {result['snapshot_mb']:.1f} MB, "
+          f"catalog file {result['catalog_mb']:.1f} MB")
+    print(f"{'mode':>8} | {'load s':>7} | {'process s':>9} | {'RSS MB':>7} | {'private MB':>10} | "
+          f"{'shared MB':>9} | {'lookup us':>9} | {'search ms':>9}")
+    print("-" * 90)
+    for mode, row in result["modes"].items():
+        before, after = row["before"], row["after"]
+        if after is None:
+            memory = f"{'n/a':>7} | {'n/a':>10} | {'n/a':>9}"
+        else:
+            memory = (f"{after['rss'] / 2 ** 20:>7.1f} | {(after['anon'] - before['anon']) / 2 ** 20:>10.1f} | "
+                      f"{(after['file'] - before['file']) / 2 ** 20:>9.1f}")
+        print(f"{mode:>8} | {row['load_seconds']:>7.2f} | {row['process_seconds']:>9.2f} | {memory} | "
+              f"{row['lookup_us']:>9.2f} | {row['search_ms']:>9.2f}")
+    print("private/shared: anonymous and file-backed memory added by loading and querying the catalog.")
+
+
+# Batch Loans Benchmark
+
+def bench_batch_loans(size=100_000, batch_size=24, batches=2_000, seed=42):
+    """
+    Times checking out and then returning `batch_size` books (three each for batch_size / 3 members,
+    as at a self-checkout kiosk and the book drop) with process_loans against looping over
+    borrow_book and return_book, in the default and the thread-safe mode.
+
+    :param size: Catalog size (integer).
+    :param batch_size: Items per batch (integer, a multiple of the loan limit).
+    :param batches: Number of checkout + return rounds per mode (integer).
+    :param seed: Seed for the generated library and the batches (integer).
+    :return: A list of result dictionaries, one per mode, with microseconds per item.
+    """
+    generate_library(size, seed, loan_load=0.0)
+    rng = random.Random(seed)
+    for i in range(batch_size // 3):
+        add_member(f"KIOSK{i:03d}", "Kiosk Reader", "kiosk@lib.com")
+    available = available_books()
+    rounds = []
+    for _ in range(batches):
+        picks = rng.sample(available, batch_size)
+        borrows = [("borrow_book", isbn, f"KIOSK{i // 3:03d}") for i, isbn in enumerate(picks)]
+        rounds.append((borrows, [("return_book", isbn, member_id) for _, isbn, member_id in borrows]))
+    items = batches * batch_size * 2
+
+    results = []
+    for mode in ("default", "thread-safe"):
+        if mode == "thread-safe":
+            enable_thread_safety()
+        start = time.perf_counter()
+        for borrows, returns in rounds:
+            for _, isbn, member_id in borrows:
+                borrow_book(isbn, member_id)
+            for _, isbn, member_id in returns:
+                return_book(isbn, member_id)
+        loop_us = (time.perf_counter() - start) / items * 1e6
+
+        start = time.perf_counter()
+        for borrows, returns in rounds:
+            process_loans(borrows)
+            process_loans(returns)
+        batch_us = (time.perf_counter() - start) / items * 1e6
+        results.append({"mode": mode, "loop_us": loop_us, "batch_us": batch_us})
+
+    disable_thread_safety()
+    reset_library()
+    return results
+
+
+def print_batch_loans(results):
+    """Prints the results of bench_batch_loans as a table."""
+    print(f"{'mode':>12} | {'loop us/item':>12} | {'batch us/item':>13} | {'speedup':>7}")
+    print("-" * 54)
+    for row in results:
+        print(f"{row['mode']:>12} | {row['loop_us']:>12.2f} | {row['batch_us']:>13.2f} | "
+              f"{row['loop_us'] / row['batch_us']:>6.1f}x")
+
+
+# Due Dates Benchmark
+
+def bench_due_dates(sizes=(10_000, 100_000, 1_000_000), seed=42):
+    """
+    Times due date queries answered from the due index against scanning every open loan, on generated
+    libraries (see generate_library): the loans that became overdue during the first hour of the
+    generated history, and the next 20 loans to come due.
+
+    :param sizes: Catalog sizes to benchmark (iterable of integers).
+    :param seed: Seed for the generated libraries (integer).
+    :return: A list of result dictionaries, one per size, with milliseconds per query.
+    """
+    results = []
+    for size in sizes:
+        library = generate_library(size, seed)
+        as_of = time.time() - ag_operations.LOAN_PERIOD + 60 * 60
+        gc.collect()
+
+        start = time.perf_counter()
+        overdue = overdue_loans(as_of)
+        indexed_ms = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        [ag_operations._loan_dict(entry)
+         for entry in sorted(entry for entry in ag_operations._loan_dates.values() if entry[0] < as_of)]
+        scan_ms = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        for _ in range(100):
+            loans_due_next(20)
+        next_ms = (time.perf_counter() - start) / 100 * 1e3
+
+        results.append({"books": size, "loans": library["loans"], "overdue": len(overdue), "indexed_ms": indexed_ms,
+                        "scan_ms": scan_ms, "next_ms": next_ms})
+
+    reset_library()
+    return results
+
+
+def print_due_dates(results):
+    """Prints the results of bench_due_dates as a table."""
+    print(f"{'books':>10} | {'loans':>8} | {'overdue':>7} | {'overdue_loans ms':>16} | {'scan ms':>8} | "
+          f"{'next 20 ms':>10}")
+    print("-" * 76)
+    for row in results:
+        print(f"{row['books']:>10} | {row['loans']:>8} | {row['overdue']:>7} | {row['indexed_ms']:>16.2f} | "
+              f"{row['scan_ms']:>8.2f} | {row['next_ms']:>10.3f}")
+
+
+# Circulation Statistics Benchmark
+
+#function to compute the dashboard figures the way a report would without statistics
+def _dashboard_full_pass():
+    """Loans per genre, shelf/loan totals and members at the loan limit from full passes over books and members."""
+    loans_by_genre = {genre: 0 for genre in GENRES}
+    on_shelf = 0
+    for isbn, book in books.items():
+        on_shelf += book.total_copies
+    on_loan = 0
+    at_limit = 0
+    for member in members:
+        on_loan += len(member.borrowed_books)
+        at_limit += len(member.borrowed_books) >= ag_operations.LOAN_LIMIT
+        for isbn in member.borrowed_books:
+            loans_by_genre[books[isbn].genre] += 1
+    return {"on_shelf": on_shelf, "on_loan": on_loan, "members_at_limit": at_limit, "loans_by_genre": loans_by_genre}
+
+
+def bench_stats(sizes=(10_000, 100_000, 1_000_000), pairs=100_000, seed=42):
+    """
+    Compares dashboard queries answered by CirculationStats with the full passes over books and members
+    they replace, measures the cost the statistics add to borrow_book + return_book, and streams the
+    export to /dev/null while tracing its peak memory.
+
+    :param sizes: Library sizes (iterable of integers).
+    :param pairs: Borrow/return pairs timed with and without statistics (integer).
+    :param seed: Seed for the generated libraries (integer).
+    :return: A list of result dictionaries per size.
+    """
+    results = []
+    for size in sizes:
+        generate_library(size, seed)
+        stats = CirculationStats()
+        start = time.perf_counter()
+        set_statistics(stats)
+        rebuild_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _dashboard_full_pass()
+        full_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        repeats = 1_000
+        for _ in range(repeats):
+            stats.summary()
+            stats.most_borrowed(10)
+        stats_seconds = (time.perf_counter() - start) / repeats
+
+        add_book("S-BENCH", "Statistics Bench", "Bench Author", "Fiction", 1)
+        add_member("S-READER", "Bench Reader", "bench@lib.com")
+        timings = {}
+        for mode in ("off", "on"):
+            set_statistics(stats if mode == "on" else None)
+            start = time.perf_counter_ns()
+            for _ in range(pairs):
+                borrow_book("S-BENCH", "S-READER")
+                return_book("S-BENCH", "S-READER")
+            timings[mode] = (time.perf_counter_ns() - start) / pairs
+
+        with open(os.devnull, "w") as devnull:
+            start = time.perf_counter()
+            lines = stats.export(devnull)
+            export_seconds = time.perf_counter() - start
+            tracemalloc.start()
+            stats.export(devnull)
+            export_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        set_statistics(None)
+        results.append({"size": size, "rebuild_seconds": rebuild_seconds, "full_pass_ms": full_seconds * 1e3,
+                        "stats_us": stats_seconds * 1e6, "pair_ns_off": timings["off"], "pair_ns_on": timings["on"],
+                        "export_lines_per_sec": lines / export_seconds, "export_peak_kb": export_peak / 1024})
+    reset_library()
+    return results
+
+
+def print_stats(results):
+    """Prints the results of bench_stats as a table."""
+    print(f"{'books':>10} | {'install ms':>10} | {'full pass ms':>12} | {'stats us':>8} | {'pair ns off':>11} | "
+          f"{'pair ns on':>10} | {'export lines/s':>14} | {'export peak KB':>14}")
+    print("-" * 113)
+    for row in results:
+        print(f"{row['size']:>10,} | {row['rebuild_seconds'] * 1e3:>10.1f} | {row['full_pass_ms']:>12.1f} | "
+              f"{row['stats_us']:>8.1f} | "
+              f"{row['pair_ns_off']:>11,.0f} | {row['pair_ns_on']:>10,.0f} | {row['export_lines_per_sec']:>14,.0f} | "
+              f"{row['export_peak_kb']:>14,.0f}")
+
+
+# Concurrency Benchmark
+
+def bench_concurrency(thread_counts=(1, 2, 4, 8), operations=200_000, catalog=10_000, seed=42):
+    """
+    Runs borrow_book/return_book pairs from several threads in thread-safe mode and reports throughput
+    per thread count, plus single-threaded throughput without locking as the baseline.
+
+    :param thread_counts: Thread counts to benchmark (iterable of integers).
+    :param operations: Total borrow/return calls per run, split across the threads (integer).
+    :param catalog: Number of books and members; each thread works on its own random picks (integer).
+    :param seed: Seed for the random picks (integer).
+    :return: A list of result dictionaries with ops/sec per thread count (threads=0 is the unlocked baseline).
+    """
+    def desk(pairs):
+        for isbn, member_id in pairs:
+            borrow_book(isbn, member_id)
+            return_book(isbn, member_id)
+
+    rng = random.Random(seed)
+    reset_library()
+    for i in range(catalog):
+        add_book(f"C{i:07d}", f"Concurrent {i}", "Bench Author", "Fiction", 100)
+        add_member(f"D{i:07d}", f"Desk Patron {i}", f"d{i}@lib.com")
+    pairs = [(f"C{rng.randrange(catalog):07d}", f"D{rng.randrange(catalog):07d}") for _ in range(operations // 2)]
+
+    start = time.perf_counter()
+    desk(pairs)
+    results = [{"threads": 0, "ops_per_sec": operations / (time.perf_counter() - start)}]
+
+    enable_thread_safety()
+    try:
+        for count in thread_counts:
+            threads = [threading.Thread(target=desk, args=(pairs[i::count],)) for i in range(count)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            results.append({"threads": count, "ops_per_sec": operations / (time.perf_counter() - start)})
+    finally:
+        disable_thread_safety()
+        reset_library()
+    return results
+
+
+def print_concurrency(results):
+    """Prints the results of bench_concurrency as a table."""
+    print(f"{'threads':>16} | {'ops/sec':>10}")
+    print("-" * 29)
+    for row in results:
+        label = "1 (no locking)" if row["threads"] == 0 else row["threads"]
+        print(f"{label:>16} | {row['ops_per_sec']:>10,.0f}")
+
+
+# Storage Backend Benchmark
+
+def bench_storage(size=10_000, operations=5_000, threads=4, seed=42):
+    """
+    Runs the same workload on the in-memory default and on an SQLite database (ag_sqlite.SQLiteStorage,
+    created in a temporary directory) and reports the throughput of each: filling the catalog with add_book
+    and with import_books, borrow_book/return_book pairs from one thread and from several threads in
+    thread-safe mode, process_loans batches, and the read queries. The search cache is disabled, so
+    every search_books call runs its index query.
+
+    :param size: Catalog size (integer); the library gets size / 4 members and about as many open loans.
+    :param operations: Calls per timed operation (integer; reads use fewer for the costlier queries).
+    :param threads: Thread count for the multi-threaded borrow/return run (integer).
+    :param seed: Seed for the generated catalog and picks (integer).
+    :return: A list of (operation, memory ops/sec, SQLite ops/sec) tuples.
+    """
+    rng = random.Random(seed)
+    rows = [{"isbn": f"S{i:08d}", "title": random_title(rng), "author": random_author(rng),
+             "genre": rng.choices(list(GENRE_WEIGHTS), weights=list(GENRE_WEIGHTS.values()))[0],
+             "total_copies": rng.choices(range(1, 6), weights=COPY_WEIGHTS)[0]} for i in range(size)]
+    people = [{"member_id": f"P{i:08d}", "name": f"Patron {i}", "email": f"p{i}@lib.com"}
+              for i in range(max(1, size // 4))]
+    picks = [(rows[rng.randrange(size)]["isbn"], people[rng.randrange(len(people))]["member_id"])
+             for _ in range(operations)]
+    queries = [rng.choice(TITLE_WORDS) for _ in range(operations)]
+
+    rates = {}
+    capacity = search_cache_stats()["capacity"]
+    was_quiet = ag_operations._quiet
+    enable_quiet_mode()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for backend in ("memory", "sqlite"):
+                storage = SQLiteStorage(os.path.join(directory, "bench.db")) if backend == "sqlite" else None
+                set_storage(storage)
+                try:
+                    for operation, ops_per_sec in _storage_workload(rows, people, picks, queries, threads, rng):
+                        rates.setdefault(operation, {})[backend] = ops_per_sec
+                finally:
+                    reset_library()
+                    set_storage(None)
+                    if storage is not None:
+                        storage.close()
+    finally:
+        configure_search_cache(capacity)
+        if not was_quiet:
+            disable_quiet_mode()
+    return [(operation, rate["memory"], rate["sqlite"]) for operation, rate in rates.items()]
+
+
+#function to time the bench_storage workload on the installed backend
+def _storage_workload(rows, people, picks, queries, threads, rng):
+    """Yields (operation, ops/sec) for each step of the bench_storage workload."""
+    def timed(count, run, *args):
+        start = time.perf_counter()
+        run(*args)
+        return count / (time.perf_counter() - start)
+
+    def desk(pairs):
+        for isbn, member_id in pairs:
+            borrow_book(isbn, member_id)
+            return_book(isbn, member_id)
+
+    reset_library()
+    yield "add_book", timed(len(rows), lambda: [add_book(row["isbn"], row["title"], row["author"], row["genre"],
+                                                         row["total_copies"]) for row in rows])
+    reset_library()
+    yield "import_books (rows)", timed(len(rows), import_books, rows)
+    import_members(people)
+
+    yield "borrow + return (calls)", timed(2 * len(picks), desk, picks)
+    enable_thread_safety()
+    try:
+        yield f"borrow + return, {threads} threads", timed(2 * len(picks), _run_threads, desk, picks, threads)
+    finally:
+        disable_thread_safety()
+
+    # Kiosk batches of 6 items (two members borrowing three books each), then the matching returns
+    batches = []
+    isbns = [row["isbn"] for row in rows]
+    for i in range(0, len(picks) // 6 * 6, 6):
+        chosen = rng.sample(isbns, 6)
+        borrows = [("borrow_book", isbn, picks[i + n // 3][1]) for n, isbn in enumerate(chosen)]
+        batches.append(borrows)
+        batches.append([("return_book", isbn, member_id) for _, isbn, member_id in borrows])
+    yield "process_loans (items)", timed(6 * len(batches), lambda: [process_loans(batch) for batch in batches])
+
+    # Open loans for the due date queries, checked out over the last two loan periods
+    now = time.time()
+    for isbn, member_id in picks[:len(people)]:
+        borrow_book(isbn, member_id, now - rng.uniform(0, 2 * ag_operations.LOAN_PERIOD))
+    configure_search_cache(0)
+    reads = max(1, len(picks) // 10)
+    yield "search_books", timed(reads, lambda: [search_books(query) for query in queries[:reads]])
+    yield "get_borrowers", timed(len(picks), lambda: [get_borrowers(isbn) for isbn, _ in picks])
+    genres = list(GENRE_WEIGHTS)
+    yield "books_by_genre (available)", timed(reads, lambda: [books_by_genre(genres[i % len(genres)], True)
+                                                               for i in range(reads)])
+    yield "overdue_loans", timed(reads, lambda: [overdue_loans() for _ in range(reads)])
+
+
+#function to split work across threads and wait for them
+def _run_threads(work, items, count):
+    workers = [threading.Thread(target=work, args=(items[i::count],)) for i in range(count)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def print_storage(results):
+    """Prints the results of bench_storage as a table."""
+    print(f"{'operation':>28} | {'memory ops/sec':>14} | {'SQLite ops/sec':>14} | {'ratio':>6}")
+    print("-" * 71)
+    for operation, memory_rate, sqlite_rate in results:
+        print(f"{operation:>28} | {memory_rate:>14,.0f} | {sqlite_rate:>14,.0f} | {memory_rate / sqlite_rate:>5.1f}x")
+
+
+# Snapshot Benchmark
+
+def bench_snapshots(size=100_000, seconds=3.0, seed=42):
+    """
+    Runs a desk thread of borrow_book/return_book pairs in thread-safe mode while the main thread
+    writes full circulation reports (every book, member and loan) back to back, in three modes:
+    no reports; reports taken with every operation paused (_hold_all), the only consistent way
+    without snapshots; and reports read from open_snapshot(). The generated library is moved out of
+    the garbage collector's reach (gc.freeze) first: otherwise a full collection over it, which any
+    allocating code can trigger, stalls the desk for longer than anything measured here.
+
+    :param size: Catalog size (integer); members and loans come from generate_library.
+    :param seconds: Duration of each mode (float).
+    :param seed: Seed for the library and the desk's picks (integer).
+    :return: A list of result dictionaries per mode: desk ops/sec, p99 and worst borrow/return latency,
+             reports written, mean report time and records copied per snapshot.
+    """
+    generate_library(size, seed)
+    gc.collect()
+    gc.freeze()
+    member_count = len(members)
+    rng = random.Random(seed)
+    pairs = [(f"G{rng.randrange(size):08d}", f"R{rng.randrange(member_count):08d}") for _ in range(100_000)]
+
+    def desk(latencies, stop):
+        clock = time.perf_counter
+        for isbn, member_id in itertools.cycle(pairs):
+            if stop.is_set():
+                break
+            start = clock()
+            if borrow_book(isbn, member_id) is True:
+                return_book(isbn, member_id)
+            latencies.append(clock() - start)
+
+    def paused_report():
+        with ag_operations._hold_all():
+            shelf = sum(book.total_copies for book in books.values())
+            loans = sum(len(member.borrowed_books) for member in members)
+            dated = sum(1 for _ in ag_operations._loan_dates)
+        return shelf, loans, dated, 0
+
+    def snapshot_report():
+        with ag_operations.open_snapshot() as snapshot:
+            shelf = sum(book.total_copies for _, book in snapshot.iter_books())
+            loans = sum(len(member.borrowed_books) for member in snapshot.iter_members())
+            dated = sum(1 for _ in snapshot.iter_loans())
+            return shelf, loans, dated, snapshot.copied
+
+    results = []
+    enable_quiet_mode()  # picks of unavailable books fail quietly
+    enable_thread_safety()
+    try:
+        for mode, report in (("no reports", None), ("paused", paused_report), ("snapshot", snapshot_report)):
+            latencies = []
+            stop = threading.Event()
+            thread = threading.Thread(target=desk, args=(latencies, stop))
+            thread.start()
+            start = time.perf_counter()
+            report_seconds = []
+            copied = []
+            while time.perf_counter() - start < seconds:
+                if report is None:
+                    time.sleep(0.05)
+                    continue
+                report_start = time.perf_counter()
+                copied.append(report()[3])
+                report_seconds.append(time.perf_counter() - report_start)
+            stop.set()
+            thread.join()
+            elapsed = time.perf_counter() - start
+            latencies.sort()
+            results.append({"mode": mode, "ops_per_sec": len(latencies) / elapsed,
+                            "p99_ms": latencies[int(len(latencies) * 0.99)] * 1e3, "max_ms": latencies[-1] * 1e3,
+                            "reports": len(report_seconds),
+                            "report_ms": sum(report_seconds) / len(report_seconds) * 1e3 if report_seconds else 0.0,
+                            "copied": sum(copied) / len(copied) if copied else 0})
+    finally:
+        disable_thread_safety()
+        disable_quiet_mode()
+        reset_library()
+        gc.unfreeze()
+    return results
+
+
+def print_snapshots(results):
+    """Prints the results of bench_snapshots as a table."""
+    print(f"{'mode':>10} | {'desk ops/s':>10} | {'p99 ms':>7} | {'max ms':>7} | {'reports':>7} | "
+          f"{'report ms':>9} | {'copied':>7}")
+    print("-" * 75)
+    for row in results:
+        print(f"{row['mode']:>10} | {row['ops_per_sec']:>10,.0f} | {row['p99_ms']:>7.2f} | {row['max_ms']:>7.1f} | "
+              f"{row['reports']:>7} | {row['report_ms']:>9.1f} | {row['copied']:>7,.0f}")
+
+
+# Memory Benchmark
+
+def _measure(build):
+    """Returns the bytes still allocated by build() (its result is kept alive during the measurement)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return allocated
+
+
+def bench_memory(count=100_000, seed=42):
+    """
+    Measures the memory of book and member records in the previous dictionary layout and as
+    Book/Member records, for the same field values. Field strings are created before measuring,
+    except genres: the dictionary layout allocated a fresh normalized genre string per book.
+
+    :param count: Number of books and members to build (integer).
+    :param seed: Seed for the synthetic field values (integer).
+    :return: A dictionary with bytes per book and per member (with one loan), before and after.
+    """
+    rng = random.Random(seed)
+    rows = [(random_title(rng), random_author(rng), " " + rng.choice(GENRES).lower(), 3) for _ in range(count)]
+    people = [(f"M{i:07d}", f"Member {i}", f"member{i}@lib.com") for i in range(count)]
+    genres = {genre: genre for genre in GENRES}
+
+    dict_books = _measure(lambda: [{"title": title, "author": author, "genre": genre.strip().title(),
+                                    "total_copies": copies} for title, author, genre, copies in rows])
+    record_books = _measure(lambda: [Book(title, author, genres[genre.strip().title()], copies)
+                                     for title, author, genre, copies in rows])
+    dict_members = _measure(lambda: [{"member_id": member_id, "name": name, "email": email, "borrowed_books": ["B1"]}
+                                     for member_id, name, email in people])
+    record_members = _measure(lambda: [Member(member_id, name, email, ["B1"]) for member_id, name, email in people])
+
+    return {"book_dict": dict_books / count, "book_record": record_books / count,
+            "member_dict": dict_members / count, "member_record": record_members / count}
+
+
+def print_memory(result):
+    """Prints the result of bench_memory."""
+    print(f"{'record':>8} | {'dict bytes':>10} | {'slots bytes':>11}")
+    print("-" * 36)
+    print(f"{'book':>8} | {result['book_dict']:>10.0f} | {result['book_record']:>11.0f}")
+    print(f"{'member':>8} | {result['member_dict']:>10.0f} | {result['member_record']:>11.0f}")
+
+
+# Persistence Benchmark
+
+def circulation_workload(operations, rng, book_share=0.05, member_share=0.02, update_share=0.03):
+    """
+    Yields (function, args) pairs for a synthetic circulation history: catalog and member growth,
+    title updates, and borrows/returns against the books and members created so far.
+
+    :param operations: Number of operations to yield (integer).
+    :param rng: random.Random instance driving the workload.
+    :return: An iterator of (function, args) pairs.
+    """
+    book_count = member_count = 0
+    loans = []
+    for _ in range(operations):
+        roll = rng.random()
+        if roll < book_share or book_count == 0:
+            yield add_book, (f"W{book_count:09d}", random_title(rng), random_author(rng), rng.choice(GENRES), 3)
+            book_count += 1
+        elif roll < book_share + member_share or member_count == 0:
+            yield add_member, (f"P{member_count:09d}", f"Patron {member_count}", f"p{member_count}@lib.com")
+            member_count += 1
+        elif roll < book_share + member_share + update_share:
+            yield update_book, (f"W{rng.randrange(book_count):09d}", random_title(rng))
+        elif loans and (len(loans) > member_count or rng.random() < 0.5):
+            i = rng.randrange(len(loans))
+            loans[i], loans[-1] = loans[-1], loans[i]
+            yield return_book, loans.pop()
+        else:
+            loan = (f"W{rng.randrange(book_count):09d}", f"P{rng.randrange(member_count):09d}")
+            loans.append(loan)
+            yield borrow_book, loan
+
+
+def bench_persistence(operations=1_000_000, snapshot_every=1_000_000, seed=42):
+    """
+    Runs a circulation workload with the operation log attached, then recovers from disk.
+    Rejected borrows/returns in the workload are not logged, so the history is the number of logged operations.
+
+    :param operations: Number of workload operations to run (integer).
+    :param snapshot_every: Snapshot interval passed to Persistence (integer).
+    :param seed: Seed for the workload (integer).
+    :return: A result dictionary with write throughput (with and without the log), disk usage and recovery time.
+    """
+    directory = tempfile.mkdtemp(prefix="ag_bench_")
+    devnull = open(os.devnull, "w")
+    stdout = sys.stdout
+    try:
+        # Baseline: the same workload without logging
+        reset_library()
+        sys.stdout = devnull  # silence rejected borrows/returns
+        start = time.perf_counter()
+        for function, args in circulation_workload(operations, random.Random(seed)):
+            function(*args)
+        baseline_seconds = time.perf_counter() - start
+        sys.stdout = stdout
+
+        reset_library()
+        store = Persistence(directory, snapshot_every=snapshot_every)
+        store.recover()
+        sys.stdout = devnull
+        start = time.perf_counter()
+        for function, args in circulation_workload(operations, random.Random(seed)):
+            function(*args)
+        store.close()
+        write_seconds = time.perf_counter() - start
+        sys.stdout = stdout
+        logged = store.seq
+        disk_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+        reset_library()
+        store = Persistence(directory, snapshot_every=snapshot_every)
+        info = store.recover()
+        store.close()
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+        shutil.rmtree(directory)
+        reset_library()
+
+    return {"operations": operations, "logged": logged, "write_seconds": write_seconds,
+            "ops_per_sec": operations / write_seconds, "baseline_ops_per_sec": operations / baseline_seconds,
+            "disk_mb": disk_bytes / 2 ** 20,
+            "recovery_seconds": info["seconds"], "replayed": info["replayed"]}
+
+
+def print_persistence(result):
+    """Prints the result of bench_persistence."""
+    print(f"{result['operations']:,} operations ({result['logged']:,} logged) in {result['write_seconds']:.1f}s: "
+          f"{result['ops_per_sec']:,.0f} ops/sec ({result['baseline_ops_per_sec']:,.0f} without the log), "
+          f"{result['disk_mb']:.0f} MB on disk")
+    print(f"recovery: {result['recovery_seconds']:.1f}s (snapshot + {result['replayed']:,} replayed operations)")
+
+
+# Instrumentation Benchmark
+
+def bench_instrumentation(operations=200_000):
+    """
+    Measures the cost of borrow_book + return_book with no instrumentation hook and with a Metrics hook,
+    and of a failing borrow_book that prints its error versus one that returns a Failure in quiet mode.
+
+    :param operations: Number of borrow/return pairs (and failing calls) per measurement (integer).
+    :return: A dictionary of nanoseconds per borrow/return pair ("off", "metrics") and per failing call
+             ("printed", "quiet").
+    """
+    reset_library()
+    add_book("I001", "Instrumented", "Bench Author", "Fiction", 1)
+    add_member("J001", "Bench Reader", "bench@lib.com")
+    add_member("J002", "Other Reader", "other@lib.com")
+
+    def pairs():
+        start = time.perf_counter_ns()
+        for _ in range(operations):
+            borrow_book("I001", "J001")
+            return_book("I001", "J001")
+        return (time.perf_counter_ns() - start) / operations
+
+    def failures():
+        start = time.perf_counter_ns()
+        for _ in range(operations):
+            borrow_book("I001", "J002")  # J001 holds the only copy
+        return (time.perf_counter_ns() - start) / operations
+
+    result = {"off": pairs()}
+    set_instrumentation(Metrics())
+    try:
+        result["metrics"] = pairs()
+    finally:
+        set_instrumentation(None)
+
+    borrow_book("I001", "J001")
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull  # the printed errors still go through print(), just not to the terminal
+        try:
+            result["printed"] = failures()
+        finally:
+            sys.stdout = stdout
+    enable_quiet_mode()
+    try:
+        result["quiet"] = failures()
+    finally:
+        disable_quiet_mode()
+    reset_library()
+    return result
+
+
+def print_instrumentation(result):
+    """Prints the result of bench_instrumentation."""
+    print(f"borrow+return, no hook:      {result['off']:>8,.0f} ns")
+    print(f"borrow+return, Metrics hook: {result['metrics']:>8,.0f} ns")
+    print(f"failed borrow, printed:      {result['printed']:>8,.0f} ns")
+    print(f"failed borrow, quiet mode:   {result['quiet']:>8,.0f} ns")
+
+
+# Trace Benchmark
+
+def bench_trace(calls=100_000, books=10_000, members=2_500, operations=100_000, seed=42):
+    """
+    Measures the cost of recording borrow_book + return_book pairs with a TraceRecorder, to a plain and to
+    a gzip-compressed file, and the size of each recorded call. Then generates a synthetic trace
+    (ag_trace.generate_trace) and replays it as fast as possible, with and without verifying results.
+
+    :param calls: Calls in the synthetic trace after its books and members are added (integer).
+    :param books: Books added by the synthetic trace (integer).
+    :param members: Members added by the synthetic trace (integer).
+    :param operations: Number of recorded borrow/return pairs (integer).
+    :param seed: Seed for the synthetic trace (integer).
+    :return: A dictionary with nanoseconds per pair ("off", "plain", "gzip"), bytes per recorded call
+             ("plain_bytes", "gzip_bytes"), "generate_seconds", the verified replay report ("replay")
+             and the calls/sec of the unverified replay ("unverified_per_sec").
+    """
+    reset_library()
+    add_book("I001", "Traced", "Bench Author", "Fiction", 1)
+    add_member("J001", "Bench Reader", "bench@lib.com")
+
+    def pairs():
+        start = time.perf_counter_ns()
+        for _ in range(operations):
+            borrow_book("I001", "J001", 0.0)
+            return_book("I001", "J001")
+        return (time.perf_counter_ns() - start) / operations
+
+    result = {"off": pairs()}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("plain", "gzip"):
+            path = os.path.join(directory, "pairs.jsonl" + (".gz" if name == "gzip" else ""))
+            recorder = TraceRecorder(path)
+            set_instrumentation(recorder)
+            try:
+                result[name] = pairs()
+            finally:
+                set_instrumentation(None)
+                recorder.close()
+            result[f"{name}_bytes"] = os.path.getsize(path) / (2 * operations)
+
+        path = os.path.join(directory, "synthetic.jsonl.gz")
+        reset_library()
+        start = time.perf_counter()
+        generate_trace(path, calls, books, members, seed=seed)
+        result["generate_seconds"] = time.perf_counter() - start
+        reset_library()
+        result["replay"] = replay(path)
+        reset_library()
+        result["unverified_per_sec"] = replay(path, verify=False)["calls_per_sec"]
+    reset_library()
+    return result
+
+
+def print_trace(result):
+    """Prints the result of bench_trace."""
+    print(f"borrow+return, not recorded:      {result['off']:>8,.0f} ns")
+    print(f"borrow+return, recorded (plain):  {result['plain']:>8,.0f} ns, {result['plain_bytes']:.1f} bytes/call")
+    print(f"borrow+return, recorded (gzip):   {result['gzip']:>8,.0f} ns, {result['gzip_bytes']:.1f} bytes/call")
+    print(f"synthetic trace generated in {result['generate_seconds']:.1f}s; "
+          f"unverified replay {result['unverified_per_sec']:,.0f} calls/sec")
+    print_replay(result["replay"])
+
+
+# Operation Suite
+
+#function to run iter_search to the end, so the suite times the search and not only the generator's creation
+def _drain_search(query, by="title"):
+    """Returns the number of books iter_search yields for a query."""
+    return sum(1 for _ in iter_search(query, by))
+
+
+#function to build the arguments for one round of timed calls of every public function
+def _suite_cases(round_id, calls, rng):
+    """
+    Returns [(name, function, [(args, kwargs), ...])] in an order where every call is valid:
+    the books/members each round adds are updated, borrowed, returned and finally deleted.
+    """
+    new_books = [f"T{round_id}-{i:06d}" for i in range(calls)]
+    new_members = [f"U{round_id}-{i:06d}" for i in range(calls)]
+    sample = [books[isbn] for isbn in rng.sample(list(books), min(calls, len(books)))]
+    pairs = list(zip(new_books, new_members))
+    genres = rng.choices(GENRES, k=calls)
+    # Loans that became overdue during the first hour of the generated history (see bench_due_dates)
+    as_of = time.time() - ag_operations.LOAN_PERIOD + 60 * 60
+    return [
+        ("add_book", add_book, [((isbn, random_title(rng), random_author(rng), "Fiction", 2), {}) for isbn in new_books]),
+        ("add_member", add_member, [((member_id, "Suite Reader", "suite@lib.com"), {}) for member_id in new_members]),
+        ("search_books[title]", search_books, [((book["title"][-10:],), {}) for book in sample]),
+        ("search_books[author]", search_books, [((book["author"],), {"by": "author"}) for book in sample]),
+        ("iter_search", _drain_search, [((book["title"][-10:],), {}) for book in sample]),
+        ("search_page", search_page, [((book["title"][-10:],), {"limit": 10}) for book in sample]),
+        ("fuzzy_search", fuzzy_search, [((misspell(book["author"], rng),), {"by": "author"}) for book in sample]),
+        ("books_by_genre", books_by_genre, [((genre,), {"available_only": True}) for genre in genres]),
+        ("available_books", available_books, [((genre,), {}) for genre in genres]),
+        ("genre_counts", genre_counts, [((), {})] * calls),
+        ("overdue_loans", overdue_loans, [((as_of,), {})] * calls),
+        ("loans_due_next", loans_due_next, [((20,), {})] * calls),
+        ("update_book", update_book, [((isbn,), {"title": random_title(rng)}) for isbn in new_books]),
+        ("update_member", update_member, [((member_id,), {"email": "moved@lib.com"}) for member_id in new_members]),
+        ("borrow_book", borrow_book, [(pair, {}) for pair in pairs]),
+        ("get_borrowers", get_borrowers, [((isbn,), {}) for isbn in new_books]),
+        ("return_book", return_book, [(pair, {}) for pair in pairs]),
+        ("process_loans", process_loans, [(([("borrow_book", *pair), ("return_book", *pair)],), {}) for pair in pairs]),
+        ("delete_book", delete_book, [((isbn,), {}) for isbn in new_books]),
+        ("delete_member", delete_member, [((member_id,), {}) for member_id in new_members]),
+    ]
+
+
+def bench_operations(size, calls=1_000, seed=42):
+    """
+    Generates a library of `size` books and times every public function in ag_operations twice:
+    each call timed on its own (median ns per call) and a bulk loop of the same number of calls
+    (mean ns per call). Also reports generation time and resident memory per book.
+
+    :param size: Number of books in the generated library (integer).
+    :param calls: Calls per function and timing mode (integer).
+    :param seed: Seed for the generated data and call arguments (integer).
+    :return: A dictionary with "size", "library", "build_seconds", "rss_bytes_per_book" (None if unknown)
+             and "operations": {name: {"per_call_ns", "bulk_ns"}}.
+    """
+    reset_library()
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    library = generate_library(size, seed)
+    build_seconds = time.perf_counter() - start
+    rss_after = _rss_bytes()
+
+    rng = random.Random(seed)
+    operations = {}
+    for name, function, arguments in _suite_cases("each", calls, rng):
+        timings = []
+        for args, kwargs in arguments:
+            start = time.perf_counter_ns()
+            function(*args, **kwargs)
+            timings.append(time.perf_counter_ns() - start)
+        timings.sort()
+        operations[name] = {"per_call_ns": timings[len(timings) // 2]}
+    for name, function, arguments in _suite_cases("bulk", calls, rng):
+        start = time.perf_counter_ns()
+        for args, kwargs in arguments:
+            function(*args, **kwargs)
+        operations[name]["bulk_ns"] = (time.perf_counter_ns() - start) / len(arguments)
+
+    reset_library()
+    return {"size": size, "library": library, "build_seconds": build_seconds,
+            "rss_bytes_per_book": (rss_after - rss_before) / size if rss_before is not None else None,
+            "operations": operations}
+
+
+def print_operations(result):
+    """Prints the result of bench_operations as a table."""
+    library = result["library"]
+    memory = result["rss_bytes_per_book"]
+    print(f"library: {library['books']:,} books, {library['members']:,} members, {library['loans']:,} loans, "
+          f"built in {result['build_seconds']:.1f}s"
+          + (f", {memory:,.0f} bytes RSS per book" if memory is not None else ""))
+    print(f"{'operation':>22} | {'per call ns':>11} | {'bulk ns':>9}")
+    print("-" * 48)
+    for name, row in result["operations"].items():
+        print(f"{name:>22} | {row['per_call_ns']:>11,.0f} | {row['bulk_ns']:>9,.0f}")
+
+
+# Baselines
+
+def save_baseline(results, path):
+    """
+    Stores suite results as a JSON baseline: {size: {operation: bulk ns, ..., "rss_bytes_per_book": ...}}.
+
+    :param results: List of bench_operations results.
+    :param path: File to write (string).
+    """
+    baseline = {}
+    for result in results:
+        metrics = {name: row["bulk_ns"] for name, row in result["operations"].items()}
+        metrics["rss_bytes_per_book"] = result["rss_bytes_per_book"]
+        baseline[str(result["size"])] = metrics
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def check_baseline(results, path, tolerance=0.25):
+    """
+    Compares suite results with a stored baseline. A metric regresses when it exceeds its baseline
+    value by more than `tolerance` (0.25 = 25% slower or larger). Sizes missing from the baseline are skipped.
+
+    :param results: List of bench_operations results.
+    :param path: Baseline file written by save_baseline (string).
+    :param tolerance: Allowed relative increase (float).
+    :return: A list of regression descriptions (empty if none).
+    """
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for result in results:
+        expected = baseline.get(str(result["size"]))
+        if expected is None:
+            continue
+        measured = {name: row["bulk_ns"] for name, row in result["operations"].items()}
+        measured["rss_bytes_per_book"] = result["rss_bytes_per_book"]
+        for metric, value in measured.items():
+            limit = expected.get(metric)
+            if value is None or not limit:
+                continue
+            if value > limit * (1 + tolerance):
+                regressions.append(f"size {result['size']}: {metric} {value:,.0f} > baseline {limit:,.0f} "
+                                   f"(+{value / limit - 1:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    """
+    Command-line entry point. Runs the operation suite by default, or one of the focused benchmarks.
+
+    :param argv: Argument list (defaults to sys.argv[1:]).
+    :return: Process exit code: 1 if --check found regressions, else 0.
+    """
+    parser = argparse.ArgumentParser(description="Library performance benchmarks.")
+    parser.add_argument("benchmark", nargs="?", default="suite",
+                        choices=("suite", "members", "search", "search-cache", "browse", "memory", "concurrency",
+                                 "persistence", "instrumentation", "shards", "batch", "due", "fuzzy", "mapped",
+                                 "snapshots", "stats", "storage", "trace"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="library sizes for the suite (up to 10_000_000), or the largest size for other benchmarks")
+    parser.add_argument("--calls", type=int, default=1_000, help="calls per function and timing mode in the suite")
+    parser.add_argument("--save-baseline", metavar="FILE", help="store the suite results as a baseline")
+    parser.add_argument("--check", metavar="FILE", help="fail if the suite regresses beyond this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression for --check (0.25 = 25%%)")
+    options = parser.parse_args(argv)
+    max_size = max(options.sizes)
+
+    if options.benchmark == "members":
+        print_member_lookup(bench_member_lookup([size for size in (1_000, 10_000, 100_000, 1_000_000)
+                                                 if size <= max_size]))
+    elif options.benchmark == "search":
+        print_search(bench_search([size for size in (1_000, 100_000, 1_000_000) if size <= max_size]))
+    elif options.benchmark == "search-cache":
+        print_search_cache(bench_search_cache(min(max_size, 100_000)))
+    elif options.benchmark == "fuzzy":
+        print_fuzzy(bench_fuzzy([size for size in (10_000, 100_000, 1_000_000) if size <= max_size]))
+    elif options.benchmark == "due":
+        print_due_dates(bench_due_dates([size for size in (10_000, 100_000, 1_000_000) if size <= max_size]))
+    elif options.benchmark == "batch":
+        print_batch_loans(bench_batch_loans(min(max_size, 100_000)))
+    elif options.benchmark == "mapped":
+        print_mapped(bench_mapped(min(max_size, 1_000_000)))
+    elif options.benchmark == "shards":
+        print_shards(bench_shards(min(max_size, 1_000_000)))
+    elif options.benchmark == "browse":
+        print_browse(bench_browse([size for size in (10_000, 100_000, 1_000_000) if size <= max_size]))
+    elif options.benchmark == "memory":
+        print_memory(bench_memory(max_size))
+    elif options.benchmark == "stats":
+        print_stats(bench_stats([size for size in (10_000, 100_000, 1_000_000) if size <= max_size]))
+    elif options.benchmark == "snapshots":
+        print_snapshots(bench_snapshots(min(max_size, 1_000_000)))
+    elif options.benchmark == "concurrency":
+        print_concurrency(bench_concurrency())
+    elif options.benchmark == "storage":
+        print_storage(bench_storage(min(max_size, 100_000)))
+    elif options.benchmark == "persistence":
+        print_persistence(bench_persistence(max_size))
+    elif options.benchmark == "instrumentation":
+        print_instrumentation(bench_instrumentation())
+    elif options.benchmark == "trace":
+        print_trace(bench_trace())
+    else:
+        results = []
+        for size in options.sizes:
+            results.append(bench_operations(size, options.calls))
+            print_operations(results[-1])
+            print()
+        if options.save_baseline:
+            save_baseline(results, options.save_baseline)
+            print(f"Baseline saved to {options.save_baseline}.")
+        if options.check:
+            regressions = check_baseline(results, options.check, options.tolerance)
+            for regression in regressions:
+                print(f"REGRESSION {regression}")
+            if regressions:
+                return 1
+            print(f"No regressions beyond {options.tolerance:.0%} of {options.check}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# cache.py
+
+from collections import OrderedDict
+
+
+class VersionedLRUCache:
+    """
+    Bounded least-recently-used cache whose entries are tagged with the version of the data they
+    were computed from. get() only returns an entry whose version matches the caller's current
+    version, so bumping the version invalidates every older entry without touching the cache.
+
+    Used by operations.py to cache search results; callers provide their own locking.
+    """
+
+    def __init__(self, capacity=1024):
+        """
+        :param capacity: Maximum number of entries (integer). 0 disables caching.
+        """
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        """
+        Returns the value cached for key at the given version, or None (a miss).
+
+        :param key: Cache key (hashable).
+        :param version: Current version of the underlying data (integer).
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            # Computed from an older version: drop it so it cannot be served later
+            del self._entries[key]
+            self.stale += 1
+        self.misses += 1
+        return None
+
+    def put(self, key, version, value):
+        """
+        Caches a value computed at the given version, evicting the least recently used entry if full.
+
+        :param key: Cache key (hashable).
+        :param version: Version of the data the value was computed from (integer).
+        :param value: Value to cache (not None).
+        """
+        if not self.capacity:
+            return
+        self._entries[key] = (version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, capacity):
+        """Changes the capacity, evicting least recently used entries if needed."""
+        self.capacity = capacity
+        while len(self._entries) > capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drops every entry (statistics are kept)."""
+        self._entries.clear()
+
+    def stats(self):
+        """
+        :return: A dictionary with "entries", "capacity", "hits", "misses" (including "stale" entries
+                 found for an older version), "evictions" and "hit_rate" (0.0 if there were no lookups).
+        """
+        lookups = self.hits + self.misses
+        return {"entries": len(self._entries), "capacity": self.capacity, "hits": self.hits,
+                "misses": self.misses, "stale": self.stale, "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,354 @@
+# catalog.py
+
+import bisect
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+from array import array
+from collections.abc import Mapping
+
+import ag_operations
+from ag_records import Book
+
+# Binary Catalog File
+# A read-only catalog that processes memory-map instead of loading. The operating system keeps one
+# copy of the file's pages in its page cache and shares them between every process mapping it.
+# All integers are little-endian. Sections, each starting on an 8-byte boundary:
+#   header          MAGIC, book count, hash slot count, then the offset of every following section
+#   genres          Genre names, "\n"-separated (a record stores the index of its genre)
+#   records         One per book, in catalog order: RECORD header, then the ISBN, title and author (UTF-8)
+#   record offsets  File offset of each record (u64 per book)
+#   hash slots      Open-addressing table of record numbers keyed by crc32(ISBN), EMPTY if unused (u32)
+#   title text      Lowercased titles in catalog order, each followed by a NUL byte
+#   title starts    File offset of each book's lowercased title, plus the end of the text (u64)
+#   author text     Lowercased authors, laid out like the titles
+#   author starts   As title starts
+MAGIC = b"AGCATLG1"
+HEADER = struct.Struct("<8sII8Q")
+RECORD = struct.Struct("<HHHBI")  # ISBN, title and author byte lengths, genre index, total copies
+ISBN_LENGTH = struct.Struct("<H")  # The first field of RECORD
+EMPTY = 0xFFFFFFFF
+
+# Loans File
+# The open loans of a catalog, in an SQLite database next to it (path + ".loans" by default) that every
+# process opening the catalog shares. Loans are keyed by ISBN, so they survive write_catalog replacing
+# the catalog file. Borrows and returns run in BEGIN IMMEDIATE transactions, one process at a time.
+CREATE_LOANS = ("CREATE TABLE IF NOT EXISTS loans (isbn TEXT NOT NULL, member_id TEXT NOT NULL, "
+                "PRIMARY KEY (isbn, member_id)) WITHOUT ROWID",
+                "CREATE INDEX IF NOT EXISTS loans_by_member ON loans (member_id)")
+COUNT_LOANS = "SELECT COUNT(*) FROM loans WHERE isbn = ?"
+COUNT_LOANS_OF = ("SELECT isbn, COUNT(*) FROM loans WHERE isbn IN (SELECT value FROM json_each(?)) "
+                  "GROUP BY isbn")
+MEMBER_LOANS = "SELECT isbn FROM loans WHERE member_id = ?"
+BOOK_BORROWERS = "SELECT member_id FROM loans WHERE isbn = ? ORDER BY member_id"
+INSERT_LOAN = "INSERT INTO loans (isbn, member_id) VALUES (?, ?)"
+DELETE_LOAN = "DELETE FROM loans WHERE isbn = ? AND member_id = ?"
+
+
+def write_catalog(path, book_items=None):
+    """
+    Writes a binary catalog file for MappedCatalog. The file is written to a temporary name and
+    renamed into place, so processes mapping the old file keep a consistent view.
+
+    The copy counts stored are the books' current total_copies. Write the file from a catalog
+    without open loans (or accept that lent copies are missing from the shelf count).
+
+    :param path: File to write (string).
+    :param book_items: Iterable of (isbn, book) pairs in catalog order (defaults to the books in operations.py).
+    :return: The number of books written (integer).
+    """
+    if book_items is None:
+        book_items = list(ag_operations.books.items())
+
+    genres = list(ag_operations.GENRES)
+    genre_numbers = {genre: number for number, genre in enumerate(genres)}
+    records = bytearray()
+    offsets = array("Q")
+    isbns = []
+    titles = bytearray()
+    title_starts = array("Q")
+    authors = bytearray()
+    author_starts = array("Q")
+    for isbn, book in book_items:
+        key = isbn.encode()
+        title = book.title.encode()
+        author = book.author.encode()
+        if max(len(key), len(title), len(author)) > 0xFFFF:
+            raise ValueError(f"Book {isbn} has a field longer than 65535 bytes.")
+        genre = genre_numbers.get(book.genre)
+        if genre is None:
+            genre = genre_numbers[book.genre] = len(genres)
+            genres.append(book.genre)
+        offsets.append(len(records))
+        records += RECORD.pack(len(key), len(title), len(author), genre, book.total_copies)
+        records += key + title + author
+        isbns.append(key)
+        title_starts.append(len(titles))
+        titles += book.title.lower().encode() + b"\0"
+        author_starts.append(len(authors))
+        authors += book.author.lower().encode() + b"\0"
+    title_starts.append(len(titles))
+    author_starts.append(len(authors))
+
+    # At most half the slots are used, so a lookup probes one or two slots on average
+    slot_count = 8
+    while slot_count < 2 * len(isbns):
+        slot_count *= 2
+    slots = array("I", [EMPTY]) * slot_count
+    mask = slot_count - 1
+    for number, key in enumerate(isbns):
+        slot = zlib.crc32(key) & mask
+        while slots[slot] != EMPTY:
+            if isbns[slots[slot]] == key:
+                raise ValueError(f"Duplicate ISBN {key.decode()}.")
+            slot = (slot + 1) & mask
+        slots[slot] = number
+
+    # Place the sections after the header, then store absolute offsets in the arrays
+    genre_text = "\n".join(genres).encode()
+    sizes = (len(genre_text), len(records), 8 * len(offsets), 4 * slot_count,
+             len(titles), 8 * len(title_starts), len(authors), 8 * len(author_starts))
+    sections = []
+    position = HEADER.size
+    for size in sizes:
+        sections.append(position)
+        position += size + -size % 8
+    records_at, titles_at, authors_at = sections[1], sections[4], sections[6]
+    contents = (genre_text, records, array("Q", (records_at + offset for offset in offsets)), slots,
+                titles, array("Q", (titles_at + start for start in title_starts)),
+                authors, array("Q", (authors_at + start for start in author_starts)))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(isbns), slot_count, *sections))
+        for content in contents:
+            size = memoryview(content).nbytes
+            f.write(content)
+            f.write(bytes(-size % 8))
+    os.replace(tmp_path, path)
+    return len(isbns)
+
+
+class MappedCatalog(Mapping):
+    """
+    A catalog file written by write_catalog, memory-mapped read-only.
+
+    Opening it reads only the header: lookups by ISBN hash straight into the mapped file, and
+    search_books scans the mapped lowercased text with mmap.find, so nothing is deserialized
+    up front and every process mapping the same file shares one copy of it in memory.
+
+    Books are immutable; circulation lives in a small overlay holding the open loans: the loans file
+    (see above), shared by every process and every MappedCatalog opening the same catalog, so two
+    workers cannot lend the same last copy and the loan limit holds across them. Live copy counts
+    are the file's counts minus the open loans. borrow_book/return_book follow the rules and error
+    codes of operations.py, except that members are not part of the catalog: any member_id is accepted.
+    Open the catalog in each process (the loans file connection must not cross a fork).
+
+    Works as a read-only mapping of ISBN -> Book (like operations.books, with Book.seq the catalog
+    position), so the catalog can be iterated, searched and counted with the usual dict idioms.
+    """
+
+    def __init__(self, path, loans_path=None, timeout=30.0):
+        """
+        :param path: Catalog file written by write_catalog (string).
+        :param loans_path: Loans file shared by the processes using the catalog (string); created if
+                           missing. Defaults to path + ".loans".
+        :param timeout: Seconds a borrow or return waits for another process's one (float).
+        """
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self._count, slot_count, genres, records, offsets, slots,
+         titles, title_starts, authors, author_starts) = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a catalog file.")
+        self._view = memoryview(self._map)
+        self._offsets = self._view[offsets:slots].cast("Q")[:self._count]
+        self._slots = self._view[slots:titles].cast("I")[:slot_count]
+        self._mask = slot_count - 1
+        self._text = {"title": self._view[title_starts:authors].cast("Q")[:self._count + 1],
+                      "author": self._view[author_starts:].cast("Q")[:self._count + 1]}
+        canonical = {genre: genre for genre in ag_operations.GENRES}
+        names = self._map[genres:records].rstrip(b"\0").decode().split("\n")
+        self._genres = [canonical.get(name, name) for name in names]
+        self._db = sqlite3.connect(path + ".loans" if loans_path is None else loans_path, timeout=timeout,
+                                   isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        for statement in CREATE_LOANS:
+            self._db.execute(statement)
+        self._lock = threading.Lock()  # one statement or transaction at a time on the shared connection
+
+    def close(self):
+        """Unmaps the file and closes the loans file. Books read from it stay valid."""
+        for view in (self._offsets, self._slots, *self._text.values(), self._view):
+            view.release()
+        self._map.close()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    # Reading the mapped file
+
+    def _find(self, isbn):
+        """Returns the record number of an ISBN, or None."""
+        key = isbn.encode()
+        slots = self._slots
+        slot = zlib.crc32(key) & self._mask
+        while True:
+            number = slots[slot]
+            if number == EMPTY:
+                return None
+            if self._isbn(number) == key:
+                return number
+            slot = (slot + 1) & self._mask
+
+    def _isbn(self, number):
+        """Returns the ISBN of a record, as UTF-8 bytes."""
+        offset = self._offsets[number]
+        start = offset + RECORD.size
+        return self._map[start:start + ISBN_LENGTH.unpack_from(self._map, offset)[0]]
+
+    def _record(self, number):
+        """Returns (isbn, title, author, genre, copies in the file) of a record."""
+        offset = self._offsets[number]
+        isbn_length, title_length, author_length, genre, copies = RECORD.unpack_from(self._map, offset)
+        offset += RECORD.size
+        isbn = self._map[offset:offset + isbn_length].decode()
+        offset += isbn_length
+        title = self._map[offset:offset + title_length].decode()
+        offset += title_length
+        author = self._map[offset:offset + author_length].decode()
+        return isbn, title, author, self._genres[genre], copies
+
+    # Reading the loans file
+
+    def _on_loan(self, isbn):
+        """Returns the number of open loans of a book."""
+        with self._lock:
+            return self._db.execute(COUNT_LOANS, (isbn,)).fetchone()[0]
+
+    def _on_loan_of(self, isbns):
+        """Returns {isbn: open loans} for the books in isbns that are on loan, in one query."""
+        with self._lock:
+            return dict(self._db.execute(COUNT_LOANS_OF, (json.dumps(isbns),)))
+
+    # Mapping interface
+
+    def __getitem__(self, isbn):
+        number = self._find(isbn)
+        if number is None:
+            raise KeyError(isbn)
+        _, title, author, genre, copies = self._record(number)
+        return Book(title, author, genre, copies - self._on_loan(isbn), number)
+
+    def __contains__(self, isbn):
+        return self._find(isbn) is not None
+
+    def __iter__(self):
+        for number in range(self._count):
+            yield self._isbn(number).decode()
+
+    def __len__(self):
+        return self._count
+
+    # Queries
+
+    def search_books(self, query, by="title"):
+        """
+        Searches the mapped catalog like operations.search_books: case-insensitive substring match,
+        results in catalog order, with live copy counts.
+
+        :param query: Search term (string).
+        :param by: Field to search in ('title' or 'author').
+        :return: A list of book dictionaries (with "isbn"); empty if none match.
+        """
+        needle = query.strip().lower().encode()
+        if b"\0" in needle:
+            return []
+        starts = self._text[ag_operations._search_field(by)]
+        find = self._map.find
+        end = starts[self._count]
+        position = starts[0]
+        matching_books = []
+        while position < end:
+            hit = find(needle, position, end)
+            if hit < 0:
+                break
+            number = bisect.bisect_right(starts, hit) - 1
+            isbn, title, author, genre, copies = self._record(number)
+            matching_books.append({"isbn": isbn, "title": title, "author": author, "genre": genre,
+                                   "total_copies": copies})
+            position = starts[number + 1]  # one result per book
+        if matching_books:
+            on_loan = self._on_loan_of([book["isbn"] for book in matching_books])
+            if on_loan:
+                for book in matching_books:
+                    book["total_copies"] -= on_loan.get(book["isbn"], 0)
+        return matching_books
+
+    def get_borrowers(self, isbn):
+        """Returns the sorted IDs of the members currently borrowing a book (like operations.get_borrowers)."""
+        with self._lock:
+            return [member_id for member_id, in self._db.execute(BOOK_BORROWERS, (isbn,))]
+
+    # Circulation (the shared loans file)
+
+    def _circulate(self, change, isbn, member_id):
+        """Runs change(db, number, isbn, member_id) in a write transaction, committing only if it returns True."""
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")  # waits for borrows and returns in other processes
+            try:
+                number = self._find(isbn)
+                if number is None:
+                    result = ag_operations._fail("book_not_found", f"Error: Book with ISBN {isbn} not found.")
+                else:
+                    result = change(db, number, isbn, member_id)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT" if result is True else "ROLLBACK")
+            return result
+
+    def borrow_book(self, isbn, member_id):
+        """
+        Lends a copy of a book, recording the loan in the loans file.
+
+        :return: True if successful, False (a Failure in quiet mode) otherwise (book not found,
+                 unavailable, loan limit reached, or already borrowed by the member).
+        """
+        return self._circulate(self._borrow, isbn, member_id)
+
+    def _borrow(self, db, number, isbn, member_id):
+        """borrow_book's checks and change, inside the write transaction."""
+        _, title, _, _, copies = self._record(number)
+        copies -= db.execute(COUNT_LOANS, (isbn,)).fetchone()[0]
+        loans = tuple(loan for loan, in db.execute(MEMBER_LOANS, (member_id,)))
+        error = ag_operations._borrow_error(isbn, member_id, title, copies, loans)
+        if error is not None:
+            return error
+        db.execute(INSERT_LOAN, (isbn, member_id))
+        return True
+
+    def return_book(self, isbn, member_id):
+        """
+        Returns a borrowed copy, removing the loan from the loans file.
+
+        :return: True if successful, False (a Failure in quiet mode) otherwise (book not found, or not borrowed by the member).
+        """
+        return self._circulate(self._return, isbn, member_id)
+
+    def _return(self, db, number, isbn, member_id):
+        """return_book's check and change, inside the write transaction."""
+        if db.execute(DELETE_LOAN, (isbn, member_id)).rowcount == 0:
+            return ag_operations._fail("not_borrowed", f"Error: Book {isbn} was not borrowed by member {member_id}.")
+        return True
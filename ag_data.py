@@ -0,0 +1,117 @@
+# data.py
+
+import itertools
+import random
+import time
+
+import ag_operations
+from ag_operations import add_book, add_member, borrow_book, reset_library, enable_quiet_mode, disable_quiet_mode
+
+# Word lists for synthetic catalogs
+TITLE_WORDS = (
+    "the", "of", "and", "night", "shadow", "river", "house", "garden", "winter", "empire", "secret", "last",
+    "silent", "city", "stars", "war", "dream", "glass", "iron", "memory", "ocean", "queen", "storm", "road",
+    "history", "stone", "fire", "letters", "children", "kingdom", "machine", "journey", "mountain", "light",
+)
+FIRST_NAMES = (
+    "Ada", "Alan", "Grace", "Frank", "Mary", "Ursula", "Isaac", "Agatha", "Jane", "George", "Toni", "Yuval",
+    "Paulo", "Octavia", "Neil", "Margaret", "Haruki", "Chinua", "Virginia", "Gabriel",
+)
+LAST_NAMES = (
+    "Herbert", "Lovelace", "Turing", "Hopper", "Shelley", "Le Guin", "Asimov", "Christie", "Austen", "Orwell",
+    "Morrison", "Harari", "Coelho", "Butler", "Gaiman", "Atwood", "Murakami", "Achebe", "Woolf", "Marquez",
+)
+SYLLABLES = ("ka", "lo", "mer", "tan", "vi", "sol", "dra", "en", "qui", "rho", "bel", "zor", "ith", "un", "pa", "gor")
+
+# Share of the catalog in each genre, and of books with 1..5 copies, in generated libraries
+GENRE_WEIGHTS = {"Fiction": 35, "Non-Fiction": 20, "Thriller": 15, "Fantasy": 12, "Sci-Fi": 10, "Biography": 8}
+COPY_WEIGHTS = (40, 30, 15, 10, 5)
+
+
+# Synthetic Data
+
+#function to build a deterministic vocabulary of made-up words so titles are not all alike
+def _build_vocabulary(size=4_000, seed=7):
+    """Returns TITLE_WORDS plus `size` pseudo-words built from SYLLABLES."""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return TITLE_WORDS + tuple(sorted(words))
+
+
+VOCABULARY = _build_vocabulary()
+
+
+def random_title(rng):
+    """Returns a synthetic title of 1-5 words mixing common words and rarer pseudo-words."""
+    return " ".join(
+        rng.choice(TITLE_WORDS) if rng.random() < 0.4 else rng.choice(VOCABULARY)
+        for _ in range(rng.randint(1, 5))
+    ).capitalize()
+
+
+def random_author(rng):
+    """Returns a synthetic 'First Last' author name."""
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}-{rng.choice(VOCABULARY).capitalize()}"
+
+
+def misspell(text, rng):
+    """Returns text with one typo in one of its longer words: two adjacent letters swapped, or one dropped."""
+    words = text.split()
+    candidates = [i for i, word in enumerate(words) if len(word) >= 5] or [0]
+    i = rng.choice(candidates)
+    word = words[i]
+    if len(word) >= 3:
+        k = rng.randrange(1, len(word) - 1)
+        if rng.random() < 0.5:
+            word = word[:k] + word[k + 1] + word[k] + word[k + 2:]
+        else:
+            word = word[:k] + word[k + 1:]
+    words[i] = word
+    return " ".join(words)
+
+
+def generate_library(size, seed=42, members_per_book=0.25, loan_load=0.5):
+    """
+    Resets the library and fills it with a synthetic one through the public functions:
+    `size` books whose authors follow a long-tailed popularity distribution (a few prolific authors,
+    many with one or two titles), genres and copy counts drawn from GENRE_WEIGHTS/COPY_WEIGHTS, and
+    size * members_per_book members. About loan_load of the members' loan capacity is then borrowed,
+    with checkout times spread over the last two loan periods (so about half the loans are overdue).
+
+    :param size: Number of books (integer).
+    :param seed: Seed for the generated data (integer).
+    :param members_per_book: Members per book (float).
+    :param loan_load: Share of the members' total loan capacity (LOAN_LIMIT each) to borrow (float).
+    :return: A dictionary with the number of books, members and loans created.
+    """
+    reset_library()
+    rng = random.Random(seed)
+    # Zipf-distributed authorship: the k-th most prolific author writes ~1/k as many books as the first
+    authors = [random_author(rng) for _ in range(max(1, size // 4))]
+    popularity = list(itertools.accumulate(1 / rank for rank in range(1, len(authors) + 1)))
+    book_authors = rng.choices(authors, cum_weights=popularity, k=size)
+    genres = rng.choices(list(GENRE_WEIGHTS), weights=list(GENRE_WEIGHTS.values()), k=size)
+    copies = rng.choices(range(1, 6), weights=COPY_WEIGHTS, k=size)
+    for i in range(size):
+        add_book(f"G{i:08d}", random_title(rng), book_authors[i], genres[i], copies[i])
+
+    member_count = max(1, int(size * members_per_book))
+    for i in range(member_count):
+        add_member(f"R{i:08d}", f"Reader {i}", f"reader{i}@lib.com")
+
+    loans = 0
+    attempts = int(member_count * ag_operations.LOAN_LIMIT * loan_load)
+    now = time.time()
+    history = random.Random(seed + 1)  # checkout times, drawn separately so they do not change the loans
+    was_quiet = ag_operations._quiet
+    enable_quiet_mode()  # some picks hit unavailable books; skip them quietly
+    try:
+        for _ in range(attempts):
+            loans += bool(borrow_book(f"G{rng.randrange(size):08d}", f"R{rng.randrange(member_count):08d}",
+                                      now - history.uniform(0, 2 * ag_operations.LOAN_PERIOD)))
+    finally:
+        if not was_quiet:
+            disable_quiet_mode()
+    return {"books": size, "members": member_count, "loans": loans}
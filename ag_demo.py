@@ -1,31 +1,37 @@
 # demo.py
 
-from ag_operations import GENRES, books, members, add_book, add_member, search_books, update_book, update_member, \
-    delete_book, delete_member, borrow_book, return_book
+from ag_operations import GENRES, add_book, add_member, search_books, update_book, update_member, \
+    delete_book, delete_member, borrow_book, return_book, open_snapshot
 
 
 def print_system_state(header):
-    """Prints the current state of books and members with clear formatting."""
+    """
+    Prints the current state of books and members with clear formatting.
+    Reads a snapshot, so the report stays consistent even if other threads borrow or return meanwhile.
+    """
     print("\n" + "=" * 50)
     print(f"SYSTEM STATE: {header}")
     print("=" * 50)
 
-    print("\n--- BOOKS CATALOG ---")
-    if books:
-        for isbn, book in books.items():
-            print(
-                f"ISBN: {isbn} | Title: {book['title']:<20} | Author: {book['author']:<15} | Copies: {book['total_copies']}")
-    else:
-        print("The books catalog is empty.")
-
-    print("\n--- MEMBERS LIST ---")
-    if members:
-        for member in members:
-            borrowed_titles = [books[isbn]['title'] for isbn in member['borrowed_books'] if isbn in books]
-            print(
-                f"ID: {member['member_id']} | Name: {member['name']:<15} | Email: {member['email']:<20} | Borrowed: {', '.join(borrowed_titles) if borrowed_titles else 'None'} ({len(member['borrowed_books'])})")
-    else:
-        print("The members list is empty.")
+    with open_snapshot() as snapshot:
+        titles = {}
+        print("\n--- BOOKS CATALOG ---")
+        if snapshot.book_count:
+            for isbn, book in snapshot.iter_books():
+                titles[isbn] = book['title']
+                print(
+                    f"ISBN: {isbn} | Title: {book['title']:<20} | Author: {book['author']:<15} | Copies: {book['total_copies']}")
+        else:
+            print("The books catalog is empty.")
+
+        print("\n--- MEMBERS LIST ---")
+        if snapshot.member_count:
+            for member in snapshot.iter_members():
+                borrowed_titles = [titles[isbn] for isbn in member['borrowed_books'] if isbn in titles]
+                print(
+                    f"ID: {member['member_id']} | Name: {member['name']:<15} | Email: {member['email']:<20} | Borrowed: {', '.join(borrowed_titles) if borrowed_titles else 'None'} ({len(member['borrowed_books'])})")
+        else:
+            print("The members list is empty.")
     print("-" * 50)
 
 
@@ -0,0 +1,274 @@
+# import.py
+
+import csv
+import itertools
+import json
+import sys
+import time
+from collections.abc import Mapping
+
+import ag_operations
+from ag_records import Book, Member
+
+BOOK_FIELDS = ("isbn", "title", "author", "genre", "total_copies")
+MEMBER_FIELDS = ("member_id", "name", "email")
+
+
+# Reading Records
+
+def read_records(path):
+    """
+    Streams records from a CSV file (with a header row) or a JSON Lines file, one dictionary at a time.
+    The format is chosen by file extension: '.csv' for CSV, anything else is read as JSON Lines.
+    A JSON Lines line that does not parse is yielded as its json.JSONDecodeError, so importers can
+    reject that row and go on.
+
+    :param path: Path of the file to read (string).
+    :return: An iterator of record dictionaries (or decoding errors).
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as error:
+                        yield error
+
+
+#function to turn a path or an iterable of dictionaries into a record stream
+def _records(source):
+    """Returns an iterator of records for a file path or an iterable of dictionaries."""
+    if isinstance(source, str):
+        return read_records(source)
+    return iter(source)
+
+
+# Validation
+
+#function to check that a row is a record at all
+def _malformed(record):
+    """Returns why a row is not a record (a JSON decoding error or a value that is not an object), or None."""
+    if isinstance(record, json.JSONDecodeError):
+        return f"Malformed JSON: {record.msg} (column {record.colno})."
+    if not isinstance(record, Mapping):
+        return f"Row is a {type(record).__name__}, not an object."
+    return None
+
+
+#function to check that every required text field is present and is a string
+def _bad_field(record, fields):
+    """Returns the first field that is missing or not a string, or None if all are present."""
+    for field in fields:
+        if not isinstance(record.get(field), str):
+            return field
+    return None
+
+
+def _validate_books(batch, genre_cache, report):
+    """
+    Validates a batch of (row number, record) pairs with the same rules as add_book.
+    Rejects are appended to report["rejected"]; valid rows are returned as (row, isbn, Book) triples.
+    Genres are normalized once per distinct spelling through genre_cache.
+    """
+    books = ag_operations.books
+    valid = []
+    seen = set()
+    for row, record in batch:
+        problem = _malformed(record)
+        if problem is not None:
+            _reject(report, row, None, "malformed_row", problem)
+            continue
+
+        field = _bad_field(record, BOOK_FIELDS[:4])
+        if field is not None or record.get("total_copies") is None:
+            _reject(report, row, record.get("isbn"), "missing_field", f"Missing or invalid field '{field or 'total_copies'}'.")
+            continue
+
+        isbn = record["isbn"]
+        if isbn in books or isbn in seen:
+            _reject(report, row, isbn, "duplicate_isbn", f"Book with ISBN {isbn} already exists.")
+            continue
+
+        raw_genre = record["genre"]
+        if raw_genre in genre_cache:
+            genre = genre_cache[raw_genre]
+        else:
+            genre = genre_cache[raw_genre] = ag_operations._canonical_genre(raw_genre)
+        if genre is None:
+            _reject(report, row, isbn, "invalid_genre", f"Invalid genre '{raw_genre}'.")
+            continue
+
+        total_copies = record["total_copies"]
+        if isinstance(total_copies, str):
+            try:
+                total_copies = int(total_copies)
+            except ValueError:
+                pass
+        if not isinstance(total_copies, int) or total_copies < 1:
+            _reject(report, row, isbn, "invalid_copies", "Total copies must be a positive integer.")
+            continue
+
+        seen.add(isbn)
+        valid.append((row, isbn, Book(record["title"].strip(), record["author"].strip(), genre, total_copies)))
+    return valid
+
+
+def _validate_members(batch, report):
+    """
+    Validates a batch of (row number, record) pairs with the same rules as add_member.
+    Rejects are appended to report["rejected"]; valid rows are returned as (row, Member) pairs.
+    """
+    valid = []
+    seen = set()
+    for row, record in batch:
+        problem = _malformed(record)
+        if problem is not None:
+            _reject(report, row, None, "malformed_row", problem)
+            continue
+
+        field = _bad_field(record, MEMBER_FIELDS)
+        if field is not None:
+            _reject(report, row, record.get("member_id"), "missing_field", f"Missing or invalid field '{field}'.")
+            continue
+
+        member_id = record["member_id"].strip()
+        if ag_operations._find_member(member_id) is not None or member_id in seen:
+            _reject(report, row, member_id, "duplicate_member", f"Member with ID {member_id} already exists.")
+            continue
+
+        seen.add(member_id)
+        valid.append((row, Member(member_id, record["name"].strip(), record["email"].strip())))
+    return valid
+
+
+#function to record a rejected row in the report
+def _reject(report, row, key, error, message):
+    """Appends a structured reject entry to the report."""
+    report["rejected"].append({"row": row, "key": key, "error": error, "message": message})
+
+
+#function to order rejects by row
+def _row(reject):
+    return reject["row"]
+
+
+# Committing
+
+#function to commit validated books, rejecting ISBNs added since they were validated
+def _commit_books(valid, report):
+    """
+    Stores validated (row, isbn, Book) triples and returns how many were stored. The batch's book locks
+    are held while the ISBNs are checked again and the books are inserted, so a concurrent add_book
+    cannot add the same ISBN in between (thread-safe mode).
+    """
+    with ag_operations._hold_many([isbn for _, isbn, _ in valid], ()):
+        books = ag_operations.books
+        fresh = []
+        for row, isbn, book in valid:
+            if isbn in books:
+                _reject(report, row, isbn, "duplicate_isbn", f"Book with ISBN {isbn} already exists.")
+            else:
+                fresh.append((isbn, book))
+        ag_operations._insert_books(fresh)
+    return len(fresh)
+
+
+#function to commit validated members, rejecting member IDs added since they were validated
+def _commit_members(valid, report):
+    """Stores validated (row, Member) pairs like _commit_books, holding the batch's member locks."""
+    with ag_operations._hold_many((), [member.member_id for _, member in valid]):
+        fresh = []
+        for row, member in valid:
+            if ag_operations._find_member(member.member_id) is not None:
+                _reject(report, row, member.member_id, "duplicate_member",
+                        f"Member with ID {member.member_id} already exists.")
+            else:
+                fresh.append(member)
+        ag_operations._insert_members(fresh)
+    return len(fresh)
+
+
+# Bulk Loaders
+
+def _new_report():
+    """Returns an empty import report."""
+    return {"rows": 0, "accepted": 0, "rejected": [], "seconds": 0.0, "rows_per_sec": 0.0}
+
+
+def _finish_report(report, start):
+    """Puts the rejects in row order and fills in the timing fields of an import report."""
+    report["rejected"].sort(key=_row)  # rejects found while committing come after the batch's other rejects
+    report["seconds"] = time.perf_counter() - start
+    report["rows_per_sec"] = report["rows"] / report["seconds"] if report["seconds"] > 0 else 0.0
+    return report
+
+
+def import_books(source, batch_size=10_000):
+    """
+    Streams book records into the catalog, validating them in batches with the same rules as add_book.
+    Invalid rows are collected in the report instead of being printed.
+
+    :param source: Path of a CSV/JSONL file, or an iterable of dictionaries with the keys
+                   isbn, title, author, genre and total_copies.
+    :param batch_size: Number of rows validated and committed together (integer).
+    :return: A report dictionary: rows, accepted, rejected (list of {"row", "key", "error", "message"}, in
+             row order), seconds and rows_per_sec. Row numbers start at 1. Rows that are not objects,
+             including JSON Lines that do not parse, are rejected as "malformed_row" (key None).
+    """
+    report = _new_report()
+    start = time.perf_counter()
+    genre_cache = {}
+    rows = enumerate(_records(source), 1)
+
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        report["rows"] += len(batch)
+        valid = _validate_books(batch, genre_cache, report)
+        report["accepted"] += _commit_books(valid, report)
+
+    return _finish_report(report, start)
+
+
+def import_members(source, batch_size=10_000):
+    """
+    Streams member records into the member store, validating them in batches with the same rules as add_member.
+    Invalid rows are collected in the report instead of being printed.
+
+    :param source: Path of a CSV/JSONL file, or an iterable of dictionaries with the keys member_id, name and email.
+    :param batch_size: Number of rows validated and committed together (integer).
+    :return: A report dictionary, as returned by import_books.
+    """
+    report = _new_report()
+    start = time.perf_counter()
+    rows = enumerate(_records(source), 1)
+
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        report["rows"] += len(batch)
+        valid = _validate_members(batch, report)
+        report["accepted"] += _commit_members(valid, report)
+
+    return _finish_report(report, start)
+
+
+def print_import_report(report, limit=10):
+    """Prints a summary of an import report and the first `limit` rejected rows."""
+    print(f"Imported {report['accepted']} of {report['rows']} rows in {report['seconds']:.2f}s "
+          f"({report['rows_per_sec']:,.0f} rows/sec), {len(report['rejected'])} rejected.")
+    for reject in report["rejected"][:limit]:
+        print(f"  row {reject['row']}: [{reject['error']}] {reject['message']}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("books", "members"):
+        print("Usage: python ag_import.py books|members <file.csv|file.jsonl>")
+        sys.exit(2)
+    loader = import_books if sys.argv[1] == "books" else import_members
+    print_import_report(loader(sys.argv[2]))
@@ -0,0 +1,240 @@
+# index.py
+
+import re
+
+# Search Index Structures used by operations.py
+
+_WORD = re.compile(r"\w+")
+
+
+#function to split normalized text into words
+def words(text):
+    """Returns the words (runs of letters, digits and underscores) of text, in order."""
+    return _WORD.findall(text)
+
+
+#function to get the trigrams of a single word, padded so its start and end count too
+def _word_trigrams(word):
+    """Returns the set of trigrams of "  word " (two leading blanks and one trailing blank)."""
+    return _trigrams(f"  {word} ")
+
+
+#function to split text into its distinct character trigrams
+def _trigrams(text):
+    """Returns the set of distinct 3-character substrings of text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """
+    Inverted index from character trigrams to the keys (e.g. ISBNs) whose text contains them.
+
+    Text is expected to be normalized by the caller (operations.py lowercases it). The index only
+    narrows down candidates: every key whose text contains the query is returned, but callers must
+    still confirm each candidate with a substring test.
+    """
+
+    def __init__(self):
+        self._postings = {}
+
+    def add(self, key, text):
+        """
+        Indexes a key under every trigram of its text.
+
+        :param key: Identifier to index (hashable).
+        :param text: Normalized text of the key (string).
+        """
+        postings = self._postings
+        for gram in _trigrams(text):
+            keys = postings.get(gram)
+            if keys is None:
+                postings[gram] = {key}
+            else:
+                keys.add(key)
+
+    def remove(self, key, text):
+        """
+        Removes a key that was indexed with the given text.
+
+        :param key: Identifier to remove (hashable).
+        :param text: The same normalized text the key was added with (string).
+        """
+        postings = self._postings
+        for gram in _trigrams(text):
+            keys = postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del postings[gram]
+
+    def candidates(self, query):
+        """
+        Returns the keys whose text contains every trigram of the query.
+
+        :param query: Normalized search string (string).
+        :return: A set of candidate keys (must not be modified), or None if the query is
+                 shorter than a trigram and cannot be answered from the index.
+        """
+        grams = _trigrams(query)
+        if not grams:
+            return None
+
+        postings = self._postings
+        sets = []
+        for gram in grams:
+            keys = postings.get(gram)
+            if keys is None:
+                return set()
+            sets.append(keys)
+
+        # Intersect smallest-first so each step iterates as few keys as possible
+        sets.sort(key=len)
+        result = sets[0]
+        for keys in sets[1:]:
+            result = result & keys
+            if not result:
+                break
+        return result
+
+    def clear(self):
+        """Removes all keys from the index."""
+        self._postings.clear()
+
+
+class WordIndex:
+    """
+    Inverted index from the distinct words of a field to the keys (e.g. ISBNs) using them, with a
+    trigram index over the words themselves for typo-tolerant search: similar() finds the vocabulary
+    words within a few edits of a possibly misspelled query word, e.g. "herbert" for "herbet".
+
+    Text is expected to be normalized by the caller (operations.py lowercases it).
+    """
+
+    def __init__(self):
+        self._keys = {}      # word -> set of keys whose text contains the word
+        self._postings = {}  # padded trigram -> set of vocabulary words containing it
+
+    def add(self, key, text):
+        """
+        Indexes a key under every word of its text.
+
+        :param key: Identifier to index (hashable).
+        :param text: Normalized text of the key (string).
+        """
+        for word in set(words(text)):
+            keys = self._keys.get(word)
+            if keys is not None:
+                keys.add(key)
+                continue
+            self._keys[word] = {key}
+            for gram in _word_trigrams(word):
+                vocabulary = self._postings.get(gram)
+                if vocabulary is None:
+                    self._postings[gram] = {word}
+                else:
+                    vocabulary.add(word)
+
+    def remove(self, key, text):
+        """
+        Removes a key that was indexed with the given text; words no key uses any more leave the vocabulary.
+
+        :param key: Identifier to remove (hashable).
+        :param text: The same normalized text the key was added with (string).
+        """
+        for word in set(words(text)):
+            keys = self._keys.get(word)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if keys:
+                continue
+            del self._keys[word]
+            for gram in _word_trigrams(word):
+                vocabulary = self._postings.get(gram)
+                if vocabulary is not None:
+                    vocabulary.discard(word)
+                    if not vocabulary:
+                        del self._postings[gram]
+
+    def keys(self, word):
+        """
+        Returns the keys whose text contains a word.
+
+        :param word: Normalized vocabulary word (string).
+        :return: A set of keys (must not be modified), empty if no key uses the word.
+        """
+        return self._keys.get(word, frozenset())
+
+    def similar(self, word, max_edits=None):
+        """
+        Returns the vocabulary words within max_edits edits of a query word, most similar first.
+
+        Edits are insertions, deletions, substitutions and swaps of adjacent letters (optimal string
+        alignment distance). Only words sharing enough padded trigrams with the query word to be within
+        max_edits, and differing in length by at most max_edits, are compared, and each comparison stops
+        once max_edits is exceeded.
+        Similarity is 1 - edits / length of the longer word (1.0 for the same word).
+
+        :param word: Normalized query word (string).
+        :param max_edits: Maximum number of edits (integer). Defaults to 1 for words of up to 5 letters,
+                          2 for up to 8 letters and 3 for longer words.
+        :return: A list of (similarity, word) pairs.
+        """
+        if max_edits is None:
+            max_edits = 1 if len(word) <= 5 else 2 if len(word) <= 8 else 3
+        grams = _word_trigrams(word)
+        shared = {}
+        for gram in grams:
+            for other in self._postings.get(gram, ()):
+                shared[other] = shared.get(other, 0) + 1
+
+        # One edit changes at most 4 of a word's padded trigrams
+        required = len(grams) - 4 * max_edits
+        found = []
+        for other, count in shared.items():
+            if count < required or abs(len(other) - len(word)) > max_edits:
+                continue
+            edits = edit_distance(word, other, max_edits)
+            if edits <= max_edits:
+                found.append((1 - edits / max(len(word), len(other)), other))
+        found.sort(reverse=True)
+        return found
+
+    def clear(self):
+        """Removes all words from the index."""
+        self._keys.clear()
+        self._postings.clear()
+
+
+#function to count the edits between two words, giving up past a limit
+def edit_distance(first, second, limit):
+    """
+    Returns the optimal string alignment distance between two strings (insertions, deletions,
+    substitutions and adjacent swaps), or limit + 1 as soon as it is known to exceed limit.
+    Only the band of cells within `limit` of the diagonal is computed.
+    """
+    over = limit + 1
+    if abs(len(first) - len(second)) > limit:
+        return over
+    width = len(second)
+    before = None
+    previous = [j if j <= limit else over for j in range(width + 1)]
+    for i in range(1, len(first) + 1):
+        char = first[i - 1]
+        row = [over] * (width + 1)
+        if i <= limit:
+            row[0] = i
+        lowest = row[0]
+        for j in range(max(1, i - limit), min(width, i + limit) + 1):
+            other = second[j - 1]
+            cost = char != other
+            value = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+            if cost and i > 1 and j > 1 and char == second[j - 2] and first[i - 2] == other:
+                value = min(value, before[j - 2] + 1)
+            row[j] = value
+            if value < lowest:
+                lowest = value
+        if lowest > limit:
+            return over
+        before, previous = previous, row
+    return min(previous[width], over)
@@ -0,0 +1,97 @@
+# locks.py
+
+import threading
+
+
+class LockTable:
+    """
+    Fine-grained locks for operations.py's thread-safe mode.
+
+    Books and members are protected by striped locks: a record's lock is chosen by hashing its ISBN
+    or member_id into a fixed array, so memory stays bounded and different books/members almost
+    always get different locks. A separate `index` lock guards the shared lookup structures (search
+    indexes, members list) for the short moment they are modified.
+
+    Deadlock avoidance: locks are always taken in one global order, all book stripes (ascending)
+    before all member stripes (ascending), and `index` is a leaf lock that is never held while
+    acquiring another one.
+    """
+
+    def __init__(self, stripes=1024):
+        """
+        :param stripes: Number of lock stripes for books and for members (integer).
+        """
+        self.stripes = stripes
+        self._book_locks = [threading.Lock() for _ in range(stripes)]
+        self._member_locks = [threading.Lock() for _ in range(stripes)]
+        self.index = threading.Lock()
+
+    def hold(self, isbn=None, member_id=None):
+        """
+        Returns a context manager holding the locks of one book and/or one member.
+
+        :param isbn: ISBN of the book to lock (string, optional).
+        :param member_id: ID of the member to lock (string, optional).
+        """
+        stripes = self.stripes
+        if member_id is None:
+            return self._book_locks[hash(isbn) % stripes]
+        member_lock = self._member_locks[hash(member_id) % stripes]
+        if isbn is None:
+            return member_lock
+        return _Pair(self._book_locks[hash(isbn) % stripes], member_lock)
+
+    def hold_many(self, isbns=(), member_ids=()):
+        """
+        Returns a context manager holding the locks of several books and members.
+
+        :param isbns: ISBNs of the books to lock (iterable of strings).
+        :param member_ids: IDs of the members to lock (iterable of strings).
+        """
+        stripes = self.stripes
+        book_slots = sorted({hash(isbn) % stripes for isbn in isbns})
+        member_slots = sorted({hash(member_id) % stripes for member_id in member_ids})
+        return _Held([self._book_locks[i] for i in book_slots] + [self._member_locks[i] for i in member_slots])
+
+    def hold_all(self):
+        """Returns a context manager holding every book and member lock, pausing all operations."""
+        return _Held(self._book_locks + self._member_locks)
+
+
+class _Pair:
+    """Context manager for a book lock followed by a member lock (the order hold() guarantees)."""
+
+    __slots__ = ("_first", "_second")
+
+    def __init__(self, first, second):
+        self._first = first
+        self._second = second
+
+    def __enter__(self):
+        self._first.acquire()
+        self._second.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._second.release()
+        self._first.release()
+        return False
+
+
+class _Held:
+    """Context manager that acquires a list of locks in order and releases them in reverse."""
+
+    __slots__ = ("_locks",)
+
+    def __init__(self, locks):
+        self._locks = locks
+
+    def __enter__(self):
+        for lock in self._locks:
+            lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        for lock in reversed(self._locks):
+            lock.release()
+        return False
@@ -0,0 +1,103 @@
+# metrics.py
+
+import bisect
+import os
+import threading
+
+# Upper bounds (seconds) of the latency histogram buckets; slower calls fall into the implicit +Inf bucket
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2, 1e-1, 1.0)
+
+
+class Metrics:
+    """
+    Instrumentation hook for operations.py: counts calls and failures (by error code) per operation
+    and keeps a latency histogram for each. Install it with ag_operations.set_instrumentation(Metrics()).
+
+    Any object with a record(operation, seconds, error) method can be installed instead.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        :param buckets: Ascending upper bounds of the latency histogram buckets, in seconds (tuple of floats).
+        """
+        self.buckets = tuple(buckets)
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, seconds, error):
+        """
+        Records one completed call.
+
+        :param operation: Name of the public function called (string).
+        :param seconds: Time the call took (float).
+        :param error: Error code of a failed call, or None if it succeeded (string or None).
+        """
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                # [calls, total seconds, per-bucket counts, {error code: failures}]
+                stats = self._operations[operation] = [0, 0.0, [0] * (len(self.buckets) + 1), {}]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2][bisect.bisect_left(self.buckets, seconds)] += 1
+            if error is not None:
+                stats[3][error] = stats[3].get(error, 0) + 1
+
+    def snapshot(self):
+        """
+        Returns a copy of the metrics collected so far.
+
+        :return: {operation: {"calls", "failures": {error code: count}, "seconds" (total latency),
+                 "latency": per-bucket call counts, the last one for calls slower than every bucket}}.
+        """
+        with self._lock:
+            return {operation: {"calls": calls, "failures": dict(failures), "seconds": seconds,
+                                "latency": list(latency)}
+                    for operation, (calls, seconds, latency, failures) in self._operations.items()}
+
+    def reset(self):
+        """Discards everything collected so far."""
+        with self._lock:
+            self._operations.clear()
+
+    def prometheus_text(self, prefix="library"):
+        """
+        Renders the metrics in the Prometheus text exposition format.
+
+        :param prefix: Prefix of every metric name (string).
+        :return: The exposition text (string).
+        """
+        snapshot = self.snapshot()
+        lines = [f"# HELP {prefix}_operation_calls_total Calls per operation.",
+                 f"# TYPE {prefix}_operation_calls_total counter"]
+        for operation, stats in sorted(snapshot.items()):
+            lines.append(f'{prefix}_operation_calls_total{{operation="{operation}"}} {stats["calls"]}')
+
+        lines += [f"# HELP {prefix}_operation_failures_total Failed calls per operation and error code.",
+                  f"# TYPE {prefix}_operation_failures_total counter"]
+        for operation, stats in sorted(snapshot.items()):
+            for error, count in sorted(stats["failures"].items()):
+                lines.append(f'{prefix}_operation_failures_total{{operation="{operation}",error="{error}"}} {count}')
+
+        lines += [f"# HELP {prefix}_operation_seconds Operation latency.",
+                  f"# TYPE {prefix}_operation_seconds histogram"]
+        for operation, stats in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), stats["latency"]):
+                cumulative += count
+                lines.append(f'{prefix}_operation_seconds_bucket{{operation="{operation}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_operation_seconds_sum{{operation="{operation}"}} {stats["seconds"]!r}')
+            lines.append(f'{prefix}_operation_seconds_count{{operation="{operation}"}} {stats["calls"]}')
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path, prefix="library"):
+        """
+        Writes prometheus_text() to a file atomically (e.g. for the node_exporter textfile collector).
+
+        :param path: File to write (string).
+        :param prefix: Prefix of every metric name (string).
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text(prefix))
+        os.replace(tmp_path, path)
@@ -1,23 +1,553 @@
 # operations.py
 
+import bisect
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+from ag_cache import VersionedLRUCache
+from ag_index import TrigramIndex, WordIndex, words
+from ag_locks import LockTable
+from ag_records import Book, BookView, Member, MemberList
+from ag_snapshot import Snapshot
+
 # 2. Data Storage
 # Genres Tuple set of valid categories
 GENRES = ("Fiction", "Non-Fiction", "Sci-Fi", "Biography", "Thriller", "Fantasy")
 
-# Books Dictionary: ISBN (string) -> Book Details (dictionary)
+# Canonical Genres: normalized genre -> the string object in GENRES, shared by every book of that genre
+_CANONICAL_GENRES = {genre: genre for genre in GENRES}
+
+# Maximum number of books a member may hold at once
+LOAN_LIMIT = 3
+
+# Loan period: a book is due this many seconds after it is checked out (14 days)
+LOAN_PERIOD = 14 * 24 * 60 * 60
+
+# Books Dictionary: ISBN (string) -> Book Details (Book record, with dict-style access)
 books = {}
 
-# Members List: List of Member Details (dictionaries)
-members = []
+# Search Indexes: searchable field -> trigram index over the lowercased field of every book
+# Kept in sync by add_book/update_book/delete_book so search_books does not scan the catalog.
+_search_indexes = {"title": TrigramIndex(), "author": TrigramIndex()}
+
+# Word Indexes: searchable field -> index from the lowercased words of that field to the ISBNs using them,
+# with a trigram index over the words for typo-tolerant fuzzy_search. Kept in sync with the search indexes.
+_word_indexes = {"title": WordIndex(), "author": WordIndex()}
+
+# Catalog Version: bumped whenever a title or author is added, changed or removed (i.e. whenever search
+# results may change), so cached search results computed from an older catalog are never served
+_catalog_version = 0
+
+# Search Cache: (field, normalized query) -> ISBNs of the matching books in catalog order, tagged with the
+# catalog version they were computed from. Results are rebuilt from the live books on every hit, so
+# changes that do not affect matching (copies, genre) need no invalidation.
+_search_cache = VersionedLRUCache(1024)
+
+# Genre Index: genre (the GENRES string) -> set of ISBNs of the books in that genre
+# Availability Index: genre -> set of ISBNs of the books in that genre with at least one copy on the shelf
+# Kept in sync by add_book/update_book/delete_book and borrow_book/return_book so browsing by genre
+# or availability does not scan the catalog.
+_isbns_by_genre = {genre: set() for genre in GENRES}
+_available_by_genre = {genre: set() for genre in GENRES}
+
+# Book Order: every book's seq is taken from this counter, so indexed search results keep catalog order
+_book_sequence = itertools.count()
+
+# Member Index: member_id (string) -> Member Details, in the order the members were added
+# Members List: List of Member Details (Member records, with dict-style access), read from the index
+# Kept in sync by add_member/delete_member so lookups and deletions do not scan the members list.
+_members_by_id = {}
+members = MemberList(_members_by_id)
+
+# Loan Index: ISBN (string) -> set of member_ids currently borrowing that book
+# Kept in sync by borrow_book/return_book/delete_member so delete_book does not scan every member.
+_borrowers_by_isbn = {}
+
+# Loan Dates: (isbn, member_id) -> (due, isbn, member_id, checked_out) for every open loan, with times in
+# seconds since the epoch
+# Due Index: due hour (due // _DUE_BUCKET) -> set of the entries of the loans falling due in that hour
+# Due Hours: the hours of the due index in ascending order, so queries visit only the hours they need
+# Kept in sync by borrow_book/return_book/process_loans so overdue queries do not scan every loan.
+_loan_dates = {}
+_due_buckets = {}
+_due_hours = []
+_DUE_BUCKET = 60 * 60
+
+# Open Snapshots: the Snapshot objects returned by open_snapshot() and not yet closed. Before changing or
+# deleting a record, operations save its current state in each of them (see _save_book). Replaced as a
+# whole (never modified in place) so operations can loop over it without a lock.
+_snapshots = ()
+
+# Mutation Listeners: callables invoked as listener(operation, args) after every successful mutation,
+# where operation is the public function name and args the positional arguments that replay it.
+_listeners = []
+
+# Record Locks: None in the default single-threaded mode, or the LockTable installed by enable_thread_safety()
+_locks = None
+_NO_LOCK = contextlib.nullcontext()
+
+# Quiet Mode: when enabled, failed operations return a Failure with an error code instead of printing
+_quiet = False
+
+# Instrumentation Hook: None, or an object whose record(operation, seconds, error) is called after every
+# public operation (see ag_metrics.Metrics). While it is None, operations pay for one global lookup.
+# _record_calls is True if the hook takes record_call(...) instead, with each call's arguments and result.
+_instrumentation = None
+_record_calls = False
+
+# Statistics: None, or an object (see ag_stats.CirculationStats) whose counters operations update as books
+# are added, changed and deleted and loans are opened and closed. Installed with set_statistics().
+_statistics = None
+
+# Storage Backend: None while the library lives in the dictionaries, lists and indexes above (the default), or
+# the backend installed by set_storage() (see ag_sqlite.SQLiteStorage), to which every operation is delegated.
+# While it is None, operations pay for one global lookup.
+_storage = None
+_in_memory = (books, members)
+
+# Error code of the failure in the operation being timed on the current thread (used only while instrumented)
+_timing = threading.local()
+
+
+class Failure:
+    """
+    Result of a failed operation in quiet mode. It is falsy like the False returned otherwise, and carries:
+        code     Machine-readable reason, e.g. "book_not_found", "unavailable", "loan_limit".
+        message  The error text that is printed when quiet mode is off.
+    """
+
+    __slots__ = ("code", "message")
+
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return f"Failure({self.code!r}, {self.message!r})"
+
+
+def enable_quiet_mode():
+    """
+    Stops operations from printing: a failed call returns a falsy Failure (with .code and .message)
+    instead of printing an error and returning False.
+    """
+    global _quiet
+    _quiet = True
+
+
+def disable_quiet_mode():
+    """Returns to the default mode, where a failed call prints an error and returns False."""
+    global _quiet
+    _quiet = False
+
+
+def set_instrumentation(hook):
+    """
+    Installs an instrumentation hook that is called after every public operation, or removes it.
+
+    :param hook: Object with a record(operation, seconds, error) method, e.g. ag_metrics.Metrics(), where
+                 error is the failure's error code, or None on success. A hook with a
+                 record_call(operation, args, result, start, seconds, error) method (e.g. ag_trace.TraceRecorder)
+                 gets that called instead, with the call's arguments (a tuple, defaults filled in), its result and
+                 its start time (time.perf_counter()). Pass None to disable instrumentation.
+    """
+    global _instrumentation, _record_calls
+    _record_calls = hasattr(hook, "record_call")
+    _instrumentation = hook
+
+
+def set_statistics(stats):
+    """
+    Installs a statistics object that every add, update, delete, borrow and return keeps up to date,
+    or removes it. Its counters are first rebuilt from the current library, pausing operations.
+
+    :param stats: Object with the update methods of ag_stats.CirculationStats (e.g. an instance of it).
+                  Pass None to stop collecting statistics.
+    """
+    global _statistics
+    with _hold_all():
+        if stats is not None:
+            _rebuild_statistics(stats)
+        _statistics = stats
 
 
-#function to find a member's index by member_id
-def _find_member_index(member_id):
-    """Finds the index of a member in the members list by their member_id."""
-    for i, member in enumerate(members):
-        if member["member_id"] == member_id:
-            return i
-    return -1
+def set_storage(storage):
+    """
+    Moves the library to a storage backend, or back to the default in-memory dictionaries and lists.
+    Every operation is then delegated to the backend, and `books` and `members` in this module name its
+    read-only views of the stored books and members (modules that imported them by name keep the in-memory
+    ones). Data is not copied between backends. Call this before starting threads that use the library.
+
+    :param storage: Backend object with the operations of ag_sqlite.SQLiteStorage (e.g. an instance of it).
+                    Pass None to return to the in-memory default.
+    """
+    global _storage, books, members
+    with _hold_all():
+        _storage = storage
+        books, members = _in_memory if storage is None else (storage.books, storage.members)
+        if _statistics is not None:
+            _rebuild_statistics(_statistics)
+
+
+#function to recompute the statistics counters from the current library
+def _rebuild_statistics(stats):
+    """Rebuilds a statistics object from the books, members and open loans (callers hold every record lock)."""
+    borrowers = _borrowers_by_isbn if _storage is None else _storage.borrowers()
+    stats.rebuild(books.items(), members, borrowers)
+
+
+#function to report a failed operation
+def _fail(code, message):
+    """Prints the error and returns False, or returns a Failure in quiet mode."""
+    if _instrumentation is not None:
+        _timing.error = code
+    if _quiet:
+        return Failure(code, message)
+    print(message)
+    return False
+
+
+#function to time an operation for the instrumentation hook
+def _timed(operation, function, *args):
+    """Calls function(*args) and records its latency and failure code (if any) under the operation name."""
+    _timing.error = None
+    start = time.perf_counter()
+    result = function(*args)
+    if _record_calls:
+        _instrumentation.record_call(operation, args, result, start, time.perf_counter() - start, _timing.error)
+    else:
+        _instrumentation.record(operation, time.perf_counter() - start, _timing.error)
+    return result
+
+
+def enable_thread_safety(stripes=1024):
+    """
+    Switches to thread-safe mode: every operation locks the books and members it touches (per-ISBN and
+    per-member striped locks, always acquired in the same order), so checkout desks running in separate
+    threads cannot both take the last copy, while operations on different books do not wait for each other.
+    Call this before starting the threads; listeners must be thread-safe themselves.
+
+    :param stripes: Number of lock stripes for books and for members (integer).
+    """
+    global _locks
+    _locks = LockTable(stripes)
+
+
+def disable_thread_safety():
+    """Returns to the default single-threaded mode without locking."""
+    global _locks
+    _locks = None
+
+
+#function to lock the records an operation touches (a no-op unless thread safety is enabled)
+def _hold(isbn=None, member_id=None):
+    """Returns a context manager holding the locks of one book and/or one member."""
+    return _NO_LOCK if _locks is None else _locks.hold(isbn, member_id)
+
+
+#function to lock the records a batch of operations touches
+def _hold_many(isbns, member_ids):
+    """Returns a context manager holding the locks of several books and members."""
+    return _NO_LOCK if _locks is None else _locks.hold_many(isbns, member_ids)
+
+
+#function to pause all operations, e.g. to take a consistent snapshot
+def _hold_all():
+    """Returns a context manager holding every record lock (a no-op unless thread safety is enabled)."""
+    return _NO_LOCK if _locks is None else _locks.hold_all()
+
+
+#function to guard the shared lookup structures while they are read or modified
+def _index_guard():
+    """Returns a context manager holding the index lock (a no-op unless thread safety is enabled)."""
+    return _NO_LOCK if _locks is None else _locks.index
+
+
+def add_listener(listener):
+    """
+    Registers a callable to be notified after every successful mutating call
+    (add/update/delete of books and members, borrow and return).
+
+    :param listener: Callable taking (operation, args), e.g. ("borrow_book", ("B001", "M001")).
+    """
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """
+    Unregisters a callable previously passed to add_listener.
+
+    :param listener: The callable to remove.
+    """
+    _listeners.remove(listener)
+
+
+#function to notify listeners of a successful mutation
+def _notify(operation, *args):
+    """Calls every registered listener with the operation name and its arguments."""
+    for listener in _listeners:
+        listener(operation, args)
+
+
+#function to find a member by member_id
+def _find_member(member_id):
+    """Returns the member record for member_id, or None if there is no such member."""
+    if _storage is not None:
+        return _storage.find_member(member_id)
+    return _members_by_id.get(member_id)
+
+
+#function to count the open loans of a book
+def _loan_count(isbn):
+    """Returns the number of members currently borrowing a book (callers hold the book's lock)."""
+    if _storage is not None:
+        return _storage.loan_count(isbn)
+    return len(_borrowers_by_isbn.get(isbn, ()))
+
+
+#function to clear all data
+def reset_library():
+    """
+    Clears all books and members together with the lookup indexes kept alongside them.
+    Use this instead of clearing `books`/`members` directly so the indexes stay consistent.
+    """
+    global _catalog_version, _snapshots
+    if _storage is not None:
+        _storage.reset()
+        if _statistics is not None:
+            _statistics.clear()
+        return
+    for snapshot in _snapshots:
+        snapshot.valid = False
+    _snapshots = ()
+    books.clear()
+    for index in (*_search_indexes.values(), *_word_indexes.values()):
+        index.clear()
+    _catalog_version += 1
+    _search_cache.clear()
+    for index in (*_isbns_by_genre.values(), *_available_by_genre.values()):
+        index.clear()
+    members.clear()  # and _members_by_id
+    _borrowers_by_isbn.clear()
+    _loan_dates.clear()
+    _due_buckets.clear()
+    _due_hours.clear()
+    if _statistics is not None:
+        _statistics.clear()
+
+
+def open_snapshot():
+    """
+    Takes a consistent, point-in-time view of the books, members and loan dates, e.g. for a report
+    or an export that runs while other threads keep borrowing and returning. In thread-safe mode,
+    operations pause only while the lists of ISBNs and members are copied; afterwards the snapshot
+    is read without locks. Records changed later are copied into the snapshot first (copy-on-write).
+
+    :return: An ag_snapshot.Snapshot with iter_books(), iter_members() and iter_loans(). Close it
+             when done (or use it in a with statement): open snapshots make changes slower.
+    """
+    with _hold_all():
+        return _open_snapshot()
+
+
+def _open_snapshot():
+    """open_snapshot for callers that already hold every record lock."""
+    global _snapshots
+    if _storage is not None:
+        return _storage.open_snapshot()
+    with _index_guard():
+        snapshot = Snapshot(books, _loan_dates, list(books), list(members), next(_book_sequence), _close_snapshot)
+        _snapshots += (snapshot,)
+    return snapshot
+
+
+def _close_snapshot(snapshot):
+    """Stops saving copies for a snapshot."""
+    global _snapshots
+    with _index_guard():
+        _snapshots = tuple(other for other in _snapshots if other is not snapshot)
+
+
+#function to add/remove a book to/from the search, genre and availability indexes
+def _index_book(isbn, book):
+    """Adds a book's title and author to the search indexes and shelves it under its genre."""
+    global _catalog_version
+    _catalog_version += 1
+    for field, index in _search_indexes.items():
+        text = getattr(book, field).lower()
+        index.add(isbn, text)
+        _word_indexes[field].add(isbn, text)
+    _shelve(isbn, book)
+
+
+def _unindex_book(isbn, book):
+    """Removes a book's title and author from the search indexes and takes it off the genre shelves."""
+    global _catalog_version
+    _catalog_version += 1
+    for field, index in _search_indexes.items():
+        text = getattr(book, field).lower()
+        index.remove(isbn, text)
+        _word_indexes[field].remove(isbn, text)
+    _unshelve(isbn, book)
+
+
+def _reindex_field(isbn, field, old, new):
+    """Moves a book's title or author from its old to its new text in the search and word indexes."""
+    _search_indexes[field].remove(isbn, old.lower())
+    _word_indexes[field].remove(isbn, old.lower())
+    _search_indexes[field].add(isbn, new.lower())
+    _word_indexes[field].add(isbn, new.lower())
+
+
+def _shelve(isbn, book):
+    """Adds a book to the genre index, and to the availability index if it has a copy on the shelf."""
+    _isbns_by_genre[book.genre].add(isbn)
+    if book.total_copies > 0:
+        _available_by_genre[book.genre].add(isbn)
+
+
+def _unshelve(isbn, book):
+    """Removes a book from the genre and availability indexes."""
+    _isbns_by_genre[book.genre].discard(isbn)
+    _available_by_genre[book.genre].discard(isbn)
+
+
+#function to insert an already validated book/member into the data stores and their indexes
+def _insert_book(isbn, book):
+    """Stores a validated Book under its ISBN and indexes it for search."""
+    with _index_guard():
+        books[isbn] = book
+        book.seq = next(_book_sequence)
+        _index_book(isbn, book)
+    if _statistics is not None:
+        _statistics.book_added(isbn, book.genre, book.total_copies)
+    if _listeners:
+        _notify("add_book", isbn, book.title, book.author, book.genre, book.total_copies)
+
+
+def _insert_books(book_items):
+    """Stores validated (isbn, Book) pairs, in one transaction if the storage backend supports it."""
+    if _storage is not None:
+        _storage.insert_books(book_items)
+        return
+    for isbn, book in book_items:
+        _insert_book(isbn, book)
+
+
+def _insert_member(member):
+    """Appends a validated Member to the members list and the member index."""
+    with _index_guard():
+        members.append(member)  # and _members_by_id
+    if _listeners:
+        _notify("add_member", member.member_id, member.name, member.email)
+
+
+def _insert_members(member_items):
+    """Stores validated Member records, in one transaction if the storage backend supports it."""
+    if _storage is not None:
+        _storage.insert_members(member_items)
+        return
+    for member in member_items:
+        _insert_member(member)
+
+
+#function to load a complete state, e.g. from a snapshot
+def _load_state(book_items, member_items, loan_dates=()):
+    """
+    Replaces all data with the given books and members and rebuilds every index.
+
+    :param book_items: Iterable of (isbn, Book) pairs in catalog order.
+    :param member_items: Iterable of Member records (including borrowed_books) in list order.
+    :param loan_dates: Iterable of (isbn, member_id, checked_out, due) for the loans in borrowed_books.
+                       Loans missing from it are dated as checked out now.
+    """
+    if _storage is not None:
+        _storage.load_state(book_items, member_items, loan_dates)
+        if _statistics is not None:
+            _rebuild_statistics(_statistics)
+        return
+    reset_library()
+    for isbn, book in book_items:
+        books[isbn] = book
+        book.seq = next(_book_sequence)
+        _index_book(isbn, book)
+    for member in member_items:
+        members.append(member)
+        for isbn in member.borrowed_books:
+            _borrowers_by_isbn.setdefault(isbn, set()).add(member.member_id)
+
+    now = time.time()
+    dates = {(isbn, member_id): checked_out for isbn, member_id, checked_out, _ in loan_dates}
+    for member in members:
+        for isbn in member.borrowed_books:
+            _open_loan(isbn, member.member_id, dates.get((isbn, member.member_id), now))
+    if _statistics is not None:
+        _rebuild_statistics(_statistics)
+
+
+#function to add/remove a loan to/from the due index (callers hold the index guard)
+def _open_loan(isbn, member_id, checked_out):
+    """Records a loan's checkout and due dates and files it under its due hour."""
+    if _snapshots:
+        _save_loan(isbn, member_id)
+    due = checked_out + LOAN_PERIOD
+    entry = _loan_dates[isbn, member_id] = (due, isbn, member_id, checked_out)
+    hour = due // _DUE_BUCKET
+    bucket = _due_buckets.get(hour)
+    if bucket is None:
+        bucket = _due_buckets[hour] = set()
+        bisect.insort(_due_hours, hour)
+    bucket.add(entry)
+
+
+def _close_loan(isbn, member_id):
+    """Forgets a loan's dates and removes it from its due hour."""
+    if _snapshots:
+        _save_loan(isbn, member_id)
+    entry = _loan_dates.pop((isbn, member_id))
+    hour = entry[0] // _DUE_BUCKET
+    bucket = _due_buckets[hour]
+    bucket.discard(entry)
+    if not bucket:
+        del _due_buckets[hour]
+        del _due_hours[bisect.bisect_left(_due_hours, hour)]
+
+
+#function to remove a member from the members list and the member index
+def _remove_member(member):
+    """Deletes a Member from the members list and the member index in constant time, keeping the list order."""
+    with _index_guard():
+        members.remove(member)  # and _members_by_id
+
+
+#function to save records in the open snapshots before they change (callers hold the record's lock)
+def _save_book(isbn, book):
+    """Saves a copy of a book in every open snapshot that contains it and has no copy yet."""
+    for snapshot in _snapshots:
+        if book.seq < snapshot.boundary and isbn not in snapshot.saved_books:
+            snapshot.saved_books[isbn] = Book(book.title, book.author, book.genre, book.total_copies, book.seq)
+
+
+def _save_member(member):
+    """Saves a copy of a member in every open snapshot that has no copy yet."""
+    for snapshot in _snapshots:
+        if member.member_id not in snapshot.saved_members:
+            snapshot.saved_members[member.member_id] = Member(member.member_id, member.name, member.email,
+                                                              member.borrowed_books)
+
+
+def _save_loan(isbn, member_id):
+    """Saves a loan's due date entry (None if it is not open) in every open snapshot that has none yet."""
+    key = (isbn, member_id)
+    for snapshot in _snapshots:
+        if key not in snapshot.saved_loans:
+            snapshot.saved_loans[key] = _loan_dates.get(key)
 
 
 #function to validate genre
@@ -26,6 +556,12 @@ def _is_valid_genre(genre):
     return genre.strip().title() in GENRES
 
 
+#function to normalize a genre to its shared GENRES string
+def _canonical_genre(genre):
+    """Returns the GENRES entry matching genre (case-insensitive), or None if the genre is invalid."""
+    return _CANONICAL_GENRES.get(genre.strip().title())
+
+
 # 3. Core Functionality (CRUD Operations)
 
 #Create
@@ -39,51 +575,59 @@ def add_book(isbn, title, author, genre, total_copies):
     :param author: Author of the book (string).
     :param genre: Genre of the book (string). Must be in GENRES.
     :param total_copies: Total number of copies available (integer).
-    :return: True if successful, False otherwise (ISBN exists or genre is invalid).
+    :return: True if successful, False (a Failure in quiet mode) otherwise (ISBN exists or genre is invalid).
     """
-    if isbn in books:
-        print(f"Error: Book with ISBN {isbn} already exists.")
-        return False
+    if _instrumentation is not None:
+        return _timed("add_book", _add_book, isbn, title, author, genre, total_copies)
+    return _add_book(isbn, title, author, genre, total_copies)
 
-    if not _is_valid_genre(genre):
-        print(f"Error: Invalid genre '{genre}'. Valid genres are {', '.join(GENRES)}.")
-        return False
 
-    if not isinstance(total_copies, int) or total_copies < 1:
-        print("Error: Total copies must be a positive integer.")
-        return False
+def _add_book(isbn, title, author, genre, total_copies):
+    """add_book without instrumentation."""
+    if _storage is not None:
+        return _storage.add_book(isbn, title, author, genre, total_copies)
+    with _hold(isbn):
+        if isbn in books:
+            return _fail("duplicate_isbn", f"Error: Book with ISBN {isbn} already exists.")
+
+        if not _is_valid_genre(genre):
+            return _fail("invalid_genre", f"Error: Invalid genre '{genre}'. Valid genres are {', '.join(GENRES)}.")
 
-    books[isbn] = {
-        "title": title.strip(),
-        "author": author.strip(),
-        "genre": genre.strip().title(),
-        "total_copies": total_copies,
-    }
-    return True
+        if not isinstance(total_copies, int) or total_copies < 1:
+            return _fail("invalid_copies", "Error: Total copies must be a positive integer.")
+
+        book = Book(title.strip(), author.strip(), _canonical_genre(genre), total_copies)
+        _insert_book(isbn, book)
+        return True
 
 
 def add_member(member_id, name, email):
     """
     Adds a new member to the members list if the member_id is unique.
-    Initializes borrowed_books as an empty list.
+    Initializes borrowed_books as empty.
 
     :param member_id: Unique identifier for the member (string).
     :param name: Name of the member (string).
     :param email: Email of the member (string).
-    :return: True if successful, False otherwise (member_id exists).
+    :return: True if successful, False (a Failure in quiet mode) otherwise (member_id exists).
     """
-    if _find_member_index(member_id) != -1:
-        print(f"Error: Member with ID {member_id} already exists.")
-        return False
+    if _instrumentation is not None:
+        return _timed("add_member", _add_member, member_id, name, email)
+    return _add_member(member_id, name, email)
+
 
-    new_member = {
-        "member_id": member_id.strip(),
-        "name": name.strip(),
-        "email": email.strip(),
-        "borrowed_books": [],
-    }
-    members.append(new_member)
-    return True
+def _add_member(member_id, name, email):
+    """add_member without instrumentation."""
+    if _storage is not None:
+        return _storage.add_member(member_id, name, email)
+    member_id = member_id.strip()
+    with _hold(member_id=member_id):
+        if member_id in _members_by_id:
+            return _fail("duplicate_member", f"Error: Member with ID {member_id} already exists.")
+
+        new_member = Member(member_id, name.strip(), email.strip())
+        _insert_member(new_member)
+        return True
 
 
 ## Read
@@ -96,22 +640,420 @@ def search_books(query, by="title"):
     :param by: Field to search ('title' or 'author'). Default is 'title'.
     :return: A list of matching book dictionaries.
     """
+    if _instrumentation is not None:
+        return _timed("search_books", _search_books, query, by)
+    return _search_books(query, by)
+
+
+def _search_books(query, by):
+    """search_books without instrumentation."""
+    if _storage is not None:
+        return _storage.search_books(query, by)
     matching_books = []
-    query = query.strip().lower()
-    search_key = by.lower()
+    for isbn in _matching_isbns(query.strip().lower(), _search_field(by)):
+        book = books.get(isbn)
+        if book is None:
+            continue  # deleted by another thread since the match
+        # Include ISBN in the returned dictionary for easy reference
+        book_with_isbn = {"isbn": isbn, "title": book.title, "author": book.author,
+                          "genre": book.genre, "total_copies": book.total_copies}
+        matching_books.append(book_with_isbn)
+
+    return matching_books
 
+
+#function to validate the field a search runs on
+def _search_field(by):
+    """Returns the lowercased search field, warning and falling back to 'title' if it is not searchable."""
+    search_key = by.lower()
     if search_key not in ["title", "author"]:
-        print(f"Warning: Invalid search field '{by}'. Searching by 'title' instead.")
+        if not _quiet:
+            print(f"Warning: Invalid search field '{by}'. Searching by 'title' instead.")
         search_key = "title"
+    return search_key
 
-    for isbn, book in books.items():
-        if query in book.get(search_key, "").lower():
-            # Include ISBN in the returned dictionary for easy reference
-            book_with_isbn = {"isbn": isbn}
-            book_with_isbn.update(book)
-            matching_books.append(book_with_isbn)
 
-    return matching_books
+#function to find the books that may match a search
+def _candidates(query, search_key, in_order=True):
+    """
+    Returns the ISBNs of the books whose search_key field may contain query (normalized): every book
+    containing all of the query's trigrams, or the whole catalog for queries shorter than a trigram.
+    With in_order they are sorted into catalog order, otherwise they come in no particular order.
+    """
+    with _index_guard():
+        candidates = _search_indexes[search_key].candidates(query)
+        if candidates is None:
+            return list(books)
+        if in_order:
+            return sorted(candidates, key=lambda isbn: books[isbn].seq)
+        return list(candidates)
+
+
+#function to find the books matching a search, in catalog order
+def _matches(query, search_key):
+    """
+    Returns a generator of (isbn, book) for every book whose search_key field contains query (normalized),
+    in catalog order. The candidates are looked up right away; each is confirmed as the generator reaches it.
+    """
+    candidates = _candidates(query, search_key)
+    return ((isbn, book) for isbn in candidates
+            if (book := books.get(isbn)) is not None and query in getattr(book, search_key).lower())
+
+
+#function to find the books matching a search, using the search cache
+def _matching_isbns(query, search_key):
+    """
+    Returns the ISBNs of the books whose search_key field contains query (normalized), in catalog order.
+    The list may be shared with the search cache and must not be modified.
+    """
+    if not _search_cache.capacity:
+        return [isbn for isbn, _ in _matches(query, search_key)]
+
+    key = (search_key, query)
+    with _index_guard():
+        version = _catalog_version
+        isbns = _search_cache.get(key, version)
+    if isbns is None:
+        isbns = [isbn for isbn, _ in _matches(query, search_key)]
+        # Tagged with the version read before matching: if the catalog changed meanwhile, it is never served
+        with _index_guard():
+            _search_cache.put(key, version, isbns)
+    return isbns
+
+
+def fuzzy_search(query, by="title", limit=10):
+    """
+    Typo-tolerant search: ranks books by how closely the words of their title or author match the
+    words of the query, e.g. "Frank Herbet" finds books by Frank Herbert. Each query word is matched
+    against the catalog words within a few edits of it (see ag_index.WordIndex.similar), and a book
+    scores the average, over the query words, of its best word similarity. Query words shorter than
+    3 letters are ignored.
+
+    Books are ranked from the word index without scoring every candidate: books are grouped by which
+    catalog word they best match for each query word, and the groups are visited best total first, so
+    only the groups needed to fill `limit` results are built. Ties are returned in catalog order.
+
+    :param query: Search string (string).
+    :param by: The field to search ("title" or "author").
+    :param limit: Maximum number of books to return (integer).
+    :return: A list of book dictionaries, each with an added "score" between 0 and 1, best match first.
+    """
+    if _instrumentation is not None:
+        return _timed("fuzzy_search", _fuzzy_search, query, by, limit)
+    return _fuzzy_search(query, by, limit)
+
+
+def _fuzzy_search(query, by, limit):
+    """fuzzy_search without instrumentation."""
+    if _storage is not None:
+        return _storage.fuzzy_search(query, by, limit)
+    search_key = _search_field(by)
+    query_words = [word for word in words(query.lower()) if len(word) >= 3]
+    if not query_words or limit <= 0:
+        return []
+
+    results = []
+    with _index_guard():
+        for isbn, score in _rank_fuzzy(_word_indexes[search_key], query_words, limit, _book_seq):
+            book = books[isbn]
+            results.append({"isbn": isbn, "title": book.title, "author": book.author, "genre": book.genre,
+                            "total_copies": book.total_copies, "score": score})
+    return results
+
+
+#function to rank the keys of a word index against the words of a fuzzy_search query
+def _rank_fuzzy(index, query_words, limit, order):
+    """
+    Returns up to `limit` (key, score) pairs of the keys in a WordIndex that best match the query words,
+    best score first, and by order(key) among equal scores (catalog order for ISBNs). Callers hold the
+    index guard, or whatever else keeps the index from changing.
+    """
+    # For each query word: its levels, i.e. (similarity, keys whose best matching word has that
+    # similarity) best first, ending with (0.0, None) for the keys matching none of its words;
+    # and the keys matching any of its words
+    levels = []
+    for query_word in query_words:
+        word_levels = []
+        matched = set()
+        for similarity, word in index.similar(query_word):
+            keys = index.keys(word) - matched
+            if keys:
+                word_levels.append((similarity, keys))
+                matched |= keys
+        word_levels.append((0.0, None))
+        levels.append((word_levels, matched))
+
+    # Visit level combinations in decreasing total similarity (a lazily expanded heap over the
+    # grid of levels), collecting the keys of combinations with equal totals before ranking them
+    ranked = []
+    first = (0,) * len(levels)
+    pending = [(-_combination_total(levels, first), first)]
+    seen = {first}
+    group, group_total = set(), None
+    while pending and len(ranked) < limit:
+        negative_total, combination = heapq.heappop(pending)
+        if group_total is not None and -negative_total < group_total - 1e-9:
+            _rank_group(group, group_total / len(levels), limit, ranked, order)
+            group = set()
+        group_total = -negative_total
+        if group_total <= 0:
+            break
+        group |= _combination_books(levels, combination)
+        for position, level in enumerate(combination):
+            if level + 1 < len(levels[position][0]):
+                following = combination[:position] + (level + 1,) + combination[position + 1:]
+                if following not in seen:
+                    seen.add(following)
+                    heapq.heappush(pending, (-_combination_total(levels, following), following))
+    if group and group_total > 0:
+        _rank_group(group, group_total / len(levels), limit, ranked, order)
+    return ranked
+
+
+#function to score a combination of levels in fuzzy_search
+def _combination_total(levels, combination):
+    """Returns the sum of the similarities of one level per query word."""
+    return sum(levels[position][0][level][0] for position, level in enumerate(combination))
+
+
+#function to find the books of a combination of levels in fuzzy_search
+def _combination_books(levels, combination):
+    """Returns the keys whose best match for every query word is the chosen level."""
+    chosen = []
+    excluded = []
+    for (word_levels, matched), level in zip(levels, combination):
+        keys = word_levels[level][1]
+        if keys is None:
+            excluded.append(matched)
+        else:
+            chosen.append(keys)
+    chosen.sort(key=len)
+    found = chosen[0].intersection(*chosen[1:])
+    for matched in excluded:
+        if not found:
+            break
+        found -= matched
+    return found
+
+
+#function to append the best keys of an equally scored group to the fuzzy_search ranking
+def _rank_group(group, score, limit, ranked, order):
+    """Appends the group's first keys by order(key), up to limit entries, as (key, score) pairs."""
+    for key in heapq.nsmallest(limit - len(ranked), group, key=order):
+        ranked.append((key, score))
+
+
+#function to get a book's position in the catalog order
+def _book_seq(isbn):
+    """Returns the seq of the book with this ISBN, or -1 if it has been deleted."""
+    book = books.get(isbn)
+    return -1 if book is None else book.seq
+
+
+def configure_search_cache(capacity):
+    """
+    Sets the number of distinct (query, field) results kept by the search cache.
+    The cache is used by search_books and search_page; its entries hold ISBNs, not book copies.
+
+    :param capacity: Maximum number of cached results (integer). 0 disables the cache.
+    """
+    if _storage is not None:
+        _storage.configure_search_cache(capacity)
+        return
+    with _index_guard():
+        _search_cache.resize(capacity)
+
+
+def search_cache_stats():
+    """
+    Returns the search cache statistics.
+
+    :return: A dictionary with "entries", "capacity", "hits", "misses", "stale" (misses on results
+             invalidated by a catalog change), "evictions" and "hit_rate".
+    """
+    if _storage is not None:
+        return _storage.search_cache_stats()
+    with _index_guard():
+        return _search_cache.stats()
+
+
+def iter_search(query, by="title"):
+    """
+    Lazily searches books by title or author (case-insensitive, partial matches), in the same order
+    as search_books, without building a result list or copying any book.
+
+    :param query: Search string (string).
+    :param by: Field to search ('title' or 'author'). Default is 'title'.
+    :return: A generator of read-only BookView objects (live views of the matching books).
+    """
+    if _instrumentation is not None:
+        return _timed("iter_search", _iter_search, query, by)
+    return _iter_search(query, by)
+
+
+def _iter_search(query, by):
+    """iter_search without instrumentation. The index lookup runs now, the matching as the generator is read."""
+    if _storage is not None:
+        return _storage.iter_search(query, by)
+    query = query.strip().lower()
+    search_key = _search_field(by)
+    return (BookView(isbn, book) for isbn, book in _matches(query, search_key))
+
+
+def search_page(query, by="title", limit=20, offset=0, after=None):
+    """
+    Returns one page of search_books results as read-only views, plus the total number of matches.
+    Pages can be addressed by offset, or by keyset: pass the previous page's "cursor" as `after`
+    to continue from there even if books were added or deleted in between.
+
+    :param query: Search string (string).
+    :param by: Field to search ('title' or 'author'). Default is 'title'.
+    :param limit: Maximum number of books on the page (integer).
+    :param offset: Number of matches to skip (integer).
+    :param after: Cursor of the previous page (integer, optional); counts only matches after it.
+    :return: {"total": number of matches (after the cursor, if given), "books": list of BookView,
+             "cursor": value to pass as `after` for the next page, or None if this was the last page},
+             or False (a Failure in quiet mode) if limit or offset is negative.
+    """
+    if _instrumentation is not None:
+        return _timed("search_page", _search_page, query, by, limit, offset, after)
+    return _search_page(query, by, limit, offset, after)
+
+
+def _search_page(query, by, limit, offset, after):
+    """search_page without instrumentation."""
+    if limit < 0 or offset < 0:
+        return _fail("invalid_page", "Error: Page limit and offset must be non-negative integers.")
+    if _storage is not None:
+        return _storage.search_page(query, by, limit, offset, after)
+    query = query.strip().lower()
+    search_key = _search_field(by)
+    end = offset + limit
+
+    if _search_cache.capacity:
+        # Page through the (cached) full list of matches
+        isbns = _matching_isbns(query, search_key)
+        start = 0
+        if after is not None:
+            with _index_guard():
+                start = bisect.bisect_right(isbns, after, key=_book_seq)
+        page = [BookView(isbn, book) for isbn in isbns[start + offset:start + end]
+                if (book := books.get(isbn)) is not None]
+        total = len(isbns) - start
+        cursor = page[-1].seq if page and total > end else None
+        return {"total": total, "books": page, "cursor": cursor}
+
+    if end == 0:
+        # An empty page: only count the matches
+        total = sum(1 for _, book in _matches(query, search_key) if after is None or book.seq > after)
+        return {"total": total, "books": [], "cursor": None}
+
+    # Count every match, but keep only the `end` earliest ones (a heap with the latest on top)
+    # instead of sorting all matches into catalog order and building a view for each
+    total = 0
+    earliest = []
+    for isbn in _candidates(query, search_key, in_order=False):
+        book = books.get(isbn)
+        if book is None or (after is not None and book.seq <= after) or query not in getattr(book, search_key).lower():
+            continue
+        total += 1
+        if len(earliest) < end:
+            heapq.heappush(earliest, (-book.seq, isbn, book))
+        elif book.seq < -earliest[0][0]:
+            heapq.heapreplace(earliest, (-book.seq, isbn, book))
+
+    page = [BookView(isbn, book) for _, isbn, book in sorted(earliest, reverse=True)[offset:]]
+    cursor = page[-1].seq if page and total > end else None
+    return {"total": total, "books": page, "cursor": cursor}
+
+
+def books_by_genre(genre, available_only=False):
+    """
+    Lists the books in a genre, from the genre index (time proportional to the number of results).
+
+    :param genre: Genre to list (string, case-insensitive). Must be in GENRES.
+    :param available_only: Only list books with at least one copy on the shelf (boolean).
+    :return: A list of ISBNs in no particular order, or False (a Failure in quiet mode) if the genre is invalid.
+    """
+    if _instrumentation is not None:
+        return _timed("books_by_genre", _books_by_genre, genre, available_only)
+    return _books_by_genre(genre, available_only)
+
+
+def _books_by_genre(genre, available_only):
+    """books_by_genre without instrumentation."""
+    if _storage is not None:
+        return _storage.books_by_genre(genre, available_only)
+    canonical = _canonical_genre(genre)
+    if canonical is None:
+        return _fail("invalid_genre", f"Error: Invalid genre '{genre}'. Valid genres are {', '.join(GENRES)}.")
+    index = _available_by_genre if available_only else _isbns_by_genre
+    with _index_guard():
+        return list(index[canonical])
+
+
+def available_books(genre=None):
+    """
+    Lists the books with at least one copy on the shelf, from the availability index
+    (time proportional to the number of results).
+
+    :param genre: Only list books of this genre (string, optional, case-insensitive). Must be in GENRES.
+    :return: A list of ISBNs in no particular order, or False (a Failure in quiet mode) if the genre is invalid.
+    """
+    if genre is not None:
+        return books_by_genre(genre, available_only=True)
+    if _instrumentation is not None:
+        return _timed("available_books", _available_books)
+    return _available_books()
+
+
+def _available_books():
+    """available_books (all genres) without instrumentation."""
+    if _storage is not None:
+        return _storage.available_books()
+    with _index_guard():
+        return [isbn for index in _available_by_genre.values() for isbn in index]
+
+
+def genre_counts():
+    """
+    Counts the books in each genre, from the genre and availability indexes (independent of catalog size).
+
+    :return: A dictionary {genre: {"books": number of books, "available": number with a copy on the shelf}}
+             with an entry for every genre in GENRES.
+    """
+    if _instrumentation is not None:
+        return _timed("genre_counts", _genre_counts)
+    return _genre_counts()
+
+
+def _genre_counts():
+    """genre_counts without instrumentation."""
+    if _storage is not None:
+        return _storage.genre_counts()
+    with _index_guard():
+        return {genre: {"books": len(_isbns_by_genre[genre]), "available": len(_available_by_genre[genre])}
+                for genre in GENRES}
+
+
+def get_borrowers(isbn):
+    """
+    Returns the members currently holding a copy of a book.
+
+    :param isbn: ISBN of the book (string).
+    :return: A sorted list of member_ids that have the book borrowed (empty if none).
+    """
+    if _instrumentation is not None:
+        return _timed("get_borrowers", _get_borrowers, isbn)
+    return _get_borrowers(isbn)
+
+
+def _get_borrowers(isbn):
+    """get_borrowers without instrumentation."""
+    if _storage is not None:
+        return _storage.get_borrowers(isbn)
+    with _hold(isbn):
+        return sorted(_borrowers_by_isbn.get(isbn, ()))
 
 
 #Update
@@ -125,31 +1067,57 @@ def update_book(isbn, title=None, author=None, genre=None, total_copies=None):
     :param author: New author (string, optional).
     :param genre: New genre (string, optional).
     :param total_copies: New total number of copies (integer, optional).
-    :return: True if successful, False otherwise (book not found, or invalid genre/copies).
+    :return: True if successful, False (a Failure in quiet mode) otherwise (book not found, or invalid genre/copies).
     """
-    if isbn not in books:
-        print(f"Error: Book with ISBN {isbn} not found.")
-        return False
-
-    book = books[isbn]
-
-    if title is not None:
-        book["title"] = title.strip()
-    if author is not None:
-        book["author"] = author.strip()
-    if genre is not None:
-        if _is_valid_genre(genre):
-            book["genre"] = genre.strip().title()
-        else:
-            print(f"Error: Invalid genre '{genre}'. Update failed.")
-            return False
-    if total_copies is not None:
-        if not isinstance(total_copies, int) or total_copies < 0:
-            print("Error: Total copies must be a non-negative integer. Update failed.")
-            return False
-        book["total_copies"] = total_copies
-
-    return True
+    if _instrumentation is not None:
+        return _timed("update_book", _update_book, isbn, title, author, genre, total_copies)
+    return _update_book(isbn, title, author, genre, total_copies)
+
+
+def _update_book(isbn, title, author, genre, total_copies):
+    """update_book without instrumentation."""
+    if _storage is not None:
+        return _storage.update_book(isbn, title, author, genre, total_copies)
+    global _catalog_version
+    with _hold(isbn):
+        if isbn not in books:
+            return _fail("book_not_found", f"Error: Book with ISBN {isbn} not found.")
+
+        # Validate everything first so a failed update leaves the book unchanged
+        if genre is not None and not _is_valid_genre(genre):
+            return _fail("invalid_genre", f"Error: Invalid genre '{genre}'. Update failed.")
+        if total_copies is not None and (not isinstance(total_copies, int) or total_copies < 0):
+            return _fail("invalid_copies", "Error: Total copies must be a non-negative integer. Update failed.")
+
+        book = books[isbn]
+        if _snapshots:
+            _save_book(isbn, book)
+        old_genre, old_copies = book.genre, book.total_copies
+
+        if title is not None or author is not None:
+            with _index_guard():
+                _catalog_version += 1
+                if title is not None:
+                    _reindex_field(isbn, "title", book.title, title.strip())
+                    book.title = title.strip()
+                if author is not None:
+                    _reindex_field(isbn, "author", book.author, author.strip())
+                    book.author = author.strip()
+        if genre is not None or total_copies is not None:
+            with _index_guard():
+                _unshelve(isbn, book)
+                if genre is not None:
+                    book.genre = _canonical_genre(genre)
+                if total_copies is not None:
+                    book.total_copies = total_copies
+                _shelve(isbn, book)
+            if _statistics is not None:
+                _statistics.book_changed(old_genre, old_copies, book.genre, book.total_copies,
+                                         len(_borrowers_by_isbn.get(isbn, ())))
+
+        if _listeners:
+            _notify("update_book", isbn, title, author, genre, total_copies)
+        return True
 
 
 def update_member(member_id, name=None, email=None):
@@ -159,20 +1127,32 @@ def update_member(member_id, name=None, email=None):
     :param member_id: ID of the member to update (string).
     :param name: New name (string, optional).
     :param email: New email (string, optional).
-    :return: True if successful, False otherwise (member not found).
+    :return: True if successful, False (a Failure in quiet mode) otherwise (member not found).
     """
-    index = _find_member_index(member_id)
-    if index == -1:
-        print(f"Error: Member with ID {member_id} not found.")
-        return False
+    if _instrumentation is not None:
+        return _timed("update_member", _update_member, member_id, name, email)
+    return _update_member(member_id, name, email)
 
-    member = members[index]
-    if name is not None:
-        member["name"] = name.strip()
-    if email is not None:
-        member["email"] = email.strip()
 
-    return True
+def _update_member(member_id, name, email):
+    """update_member without instrumentation."""
+    if _storage is not None:
+        return _storage.update_member(member_id, name, email)
+    with _hold(member_id=member_id):
+        member = _find_member(member_id)
+        if member is None:
+            return _fail("member_not_found", f"Error: Member with ID {member_id} not found.")
+
+        if _snapshots:
+            _save_member(member)
+        if name is not None:
+            member.name = name.strip()
+        if email is not None:
+            member.email = email.strip()
+
+        if _listeners:
+            _notify("update_member", member_id, name, email)
+        return True
 
 
 #Delete
@@ -182,30 +1162,37 @@ def delete_book(isbn):
     Removes a book from the books dictionary if it exists and has no borrowed copies.
 
     :param isbn: ISBN of the book to delete (string).
-    :return: True if successful, False otherwise (book not found or has borrowed copies).
+    :return: True if successful, False (a Failure in quiet mode) otherwise (book not found or has borrowed copies).
     """
-    if isbn not in books:
-        print(f"Error: Book with ISBN {isbn} not found.")
-        return False
-
-    # Check for borrowed copies
-    # We assume 'total_copies' is the currently available copies, and we need to check if ANY member has borrowed it.
-    # The requirement is "total_copies equals the original number of copies".
-    # Since we don't store the original number, we check if total_copies is less than the max number of times it was borrowed (which is tricky).
-    # A simpler, and more robust check, is to see if any *member* currently holds this book.
-
-    for member in members:
-        if isbn in member["borrowed_books"]:
-            print(f"Error: Cannot delete book {isbn}. It is currently borrowed by at least one member.")
-            return False
-
-    # A simpler check based on the prompt's ambiguity:
-    # If a book is borrowed, its total_copies will be less than the initial quantity.
-    # To properly enforce "no borrowed copies", we must check the members' list.
-
-    # If no member has it, delete it.
-    del books[isbn]
-    return True
+    if _instrumentation is not None:
+        return _timed("delete_book", _delete_book, isbn)
+    return _delete_book(isbn)
+
+
+def _delete_book(isbn):
+    """delete_book without instrumentation."""
+    if _storage is not None:
+        return _storage.delete_book(isbn)
+    with _hold(isbn):
+        if isbn not in books:
+            return _fail("book_not_found", f"Error: Book with ISBN {isbn} not found.")
+
+        # Check the loan index for any member currently holding this book
+        if _borrowers_by_isbn.get(isbn):
+            return _fail("book_on_loan",
+                         f"Error: Cannot delete book {isbn}. It is currently borrowed by at least one member.")
+
+        # If no member has it, delete it.
+        if _snapshots:
+            _save_book(isbn, books[isbn])
+        with _index_guard():
+            book = books.pop(isbn)
+            _unindex_book(isbn, book)
+        if _statistics is not None:
+            _statistics.book_removed(isbn, book.genre, book.total_copies)
+        if _listeners:
+            _notify("delete_book", isbn)
+        return True
 
 
 def delete_member(member_id):
@@ -213,64 +1200,105 @@ def delete_member(member_id):
     Removes a member from the members list if they exist and have no borrowed books.
 
     :param member_id: ID of the member to delete (string).
-    :return: True if successful, False otherwise (member not found or has borrowed books).
+    :return: True if successful, False (a Failure in quiet mode) otherwise (member not found or has borrowed books).
     """
-    index = _find_member_index(member_id)
-    if index == -1:
-        print(f"Error: Member with ID {member_id} not found.")
-        return False
-
-    member = members[index]
-    if member["borrowed_books"]:
-        print(
-            f"Error: Cannot delete member {member_id}. They currently have {len(member['borrowed_books'])} book(s) borrowed.")
-        return False
-
-    # If no borrowed books, delete the member by index
-    members.pop(index)
-    return True
+    if _instrumentation is not None:
+        return _timed("delete_member", _delete_member, member_id)
+    return _delete_member(member_id)
+
+
+def _delete_member(member_id):
+    """delete_member without instrumentation."""
+    if _storage is not None:
+        return _storage.delete_member(member_id)
+    with _hold(member_id=member_id):
+        member = _find_member(member_id)
+        if member is None:
+            return _fail("member_not_found", f"Error: Member with ID {member_id} not found.")
+
+        if member.borrowed_books:
+            return _fail(
+                "member_has_loans",
+                f"Error: Cannot delete member {member_id}. They currently have {len(member.borrowed_books)} book(s) borrowed.")
+
+        # If no borrowed books, delete the member from the list and the index.
+        # The loan index needs no update: a member holding books cannot be deleted.
+        if _snapshots:
+            _save_member(member)  # a new member may reuse the ID while a snapshot still lists this one
+        _remove_member(member)
+        if _listeners:
+            _notify("delete_member", member_id)
+        return True
 
 
 ## Borrow/Return
 
-def borrow_book(isbn, member_id):
+def borrow_book(isbn, member_id, checked_out=None):
     """
     Handles the borrowing of a book by a member. Checks for availability and loan limits.
+    The loan is due LOAN_PERIOD seconds after it is checked out.
 
     :param isbn: ISBN of the book to borrow (string).
     :param member_id: ID of the member borrowing the book (string).
-    :return: True if successful, False otherwise (e.g., book/member not found, unavailable, or loan limit exceeded).
+    :param checked_out: Checkout time in seconds since the epoch (float, optional). Defaults to now.
+    :return: True if successful, False (a Failure in quiet mode) otherwise (e.g., book/member not found, unavailable, or loan limit exceeded).
     """
-    if isbn not in books:
-        print(f"Error: Book with ISBN {isbn} not found.")
-        return False
-
-    book = books[isbn]
-
-    member_index = _find_member_index(member_id)
-    if member_index == -1:
-        print(f"Error: Member with ID {member_id} not found.")
-        return False
-
-    member = members[member_index]
-
-    if book["total_copies"] <= 0:
-        print(f"Error: Book '{book['title']}' is currently unavailable (0 copies).")
-        return False
-
-    if len(member["borrowed_books"]) >= 3:
-        print(f"Error: Member {member_id} has reached the loan limit (3 books).")
-        return False
-
-    if isbn in member["borrowed_books"]:
+    if _instrumentation is not None:
+        return _timed("borrow_book", _borrow_book, isbn, member_id, checked_out)
+    return _borrow_book(isbn, member_id, checked_out)
+
+
+def _borrow_book(isbn, member_id, checked_out):
+    """borrow_book without instrumentation."""
+    if _storage is not None:
+        return _storage.borrow_book(isbn, member_id, checked_out)
+    with _hold(isbn, member_id):
+        if isbn not in books:
+            return _fail("book_not_found", f"Error: Book with ISBN {isbn} not found.")
+
+        book = books[isbn]
+
+        member = _find_member(member_id)
+        if member is None:
+            return _fail("member_not_found", f"Error: Member with ID {member_id} not found.")
+
+        error = _borrow_error(isbn, member_id, book.title, book.total_copies, member.borrowed_books)
+        if error is not None:
+            return error
+
+        # Valid: Decrement copies and add ISBN to member's loans
+        if checked_out is None:
+            checked_out = time.time()
+        if _snapshots:
+            _save_book(isbn, book)
+            _save_member(member)
+        book.total_copies -= 1
+        with _index_guard():
+            if book.total_copies == 0:
+                _available_by_genre[book.genre].discard(isbn)
+            _open_loan(isbn, member.member_id, checked_out)
+        member.borrowed_books += (isbn,)
+        _borrowers_by_isbn.setdefault(isbn, set()).add(member.member_id)
+        if _statistics is not None:
+            _statistics.loan_opened(isbn, book.genre, member.member_id, len(member.borrowed_books))
+        if _listeners:
+            _notify("borrow_book", isbn, member_id, checked_out)
+        return True
+
+
+#function to check the copies and loans a borrow depends on
+def _borrow_error(isbn, member_id, title, copies, loans):
+    """Returns the failure result if the member cannot borrow the book, or None if the borrow is allowed."""
+    if copies <= 0:
+        return _fail("unavailable", f"Error: Book '{title}' is currently unavailable (0 copies).")
+
+    if len(loans) >= LOAN_LIMIT:
+        return _fail("loan_limit", f"Error: Member {member_id} has reached the loan limit ({LOAN_LIMIT} books).")
+
+    if isbn in loans:
         # Prevent borrowing the same copy multiple times
-        print(f"Error: Member {member_id} has already borrowed book {isbn}.")
-        return False
-
-    # Valid: Decrement copies and add ISBN to member's list
-    book["total_copies"] -= 1
-    member["borrowed_books"].append(isbn)
-    return True
+        return _fail("already_borrowed", f"Error: Member {member_id} has already borrowed book {isbn}.")
+    return None
 
 
 def return_book(isbn, member_id):
@@ -279,24 +1307,237 @@ def return_book(isbn, member_id):
 
     :param isbn: ISBN of the book to return (string).
     :param member_id: ID of the member returning the book (string).
-    :return: True if successful, False otherwise (e.g., book/member not found, or book wasn't borrowed by the member).
+    :return: True if successful, False (a Failure in quiet mode) otherwise (e.g., book/member not found, or book wasn't borrowed by the member).
     """
-    if isbn not in books:
-        print(f"Error: Book with ISBN {isbn} not found.")
-        return False
-
-    member_index = _find_member_index(member_id)
-    if member_index == -1:
-        print(f"Error: Member with ID {member_id} not found.")
-        return False
-
-    member = members[member_index]
+    if _instrumentation is not None:
+        return _timed("return_book", _return_book, isbn, member_id)
+    return _return_book(isbn, member_id)
+
+
+def _return_book(isbn, member_id):
+    """return_book without instrumentation."""
+    if _storage is not None:
+        return _storage.return_book(isbn, member_id)
+    with _hold(isbn, member_id):
+        if isbn not in books:
+            return _fail("book_not_found", f"Error: Book with ISBN {isbn} not found.")
+
+        member = _find_member(member_id)
+        if member is None:
+            return _fail("member_not_found", f"Error: Member with ID {member_id} not found.")
+
+        loans = member.borrowed_books
+        if isbn not in loans:
+            return _fail("not_borrowed", f"Error: Book {isbn} was not borrowed by member {member_id}.")
+
+        # Valid: Increment copies and remove ISBN from member's loans
+        book = books[isbn]
+        if _snapshots:
+            _save_book(isbn, book)
+            _save_member(member)
+        book.total_copies += 1
+        with _index_guard():
+            if book.total_copies == 1:
+                _available_by_genre[book.genre].add(isbn)
+            _close_loan(isbn, member.member_id)
+        position = loans.index(isbn)
+        member.borrowed_books = loans[:position] + loans[position + 1:]
+        borrowers = _borrowers_by_isbn[isbn]
+        borrowers.discard(member.member_id)
+        if not borrowers:
+            del _borrowers_by_isbn[isbn]
+        if _statistics is not None:
+            _statistics.loan_closed(isbn, book.genre, member.member_id, len(member.borrowed_books))
+        if _listeners:
+            _notify("return_book", isbn, member_id)
+        return True
+
+
+def process_loans(transactions):
+    """
+    Applies a batch of borrows and returns (e.g. from a self-checkout kiosk or the book drop) all or nothing.
+
+    The whole batch is validated in order, in one pass, with each item checked against the copies and
+    loans left by the items before it (the same checks as borrow_book and return_book). If every item is
+    valid, the batch is applied as a whole; if any item fails, nothing is changed. Listeners are notified
+    of each item as a borrow_book/return_book call, so the operation log replays the batch exactly.
+    Every borrow in the batch is checked out at the same time.
+
+    :param transactions: Iterable of (operation, isbn, member_id) tuples, where operation is "borrow_book"
+                         or "return_book".
+    :return: A dictionary with "applied" (True if the batch was applied) and "results": one entry per item,
+             True if the item is valid, else its failure result (False, or a Failure in quiet mode).
+    """
+    if _instrumentation is not None:
+        # A list, so the hook can still read the items after the batch consumed them
+        return _timed("process_loans", _process_loans, list(transactions))
+    return _process_loans(transactions)
+
+
+def _process_loans(transactions):
+    """process_loans without instrumentation."""
+    if _storage is not None:
+        return _storage.process_loans(transactions)
+    transactions = list(transactions)
+    with _hold_many([item[1] for item in transactions], [item[2] for item in transactions]):
+        copies = {}  # isbn -> copies left after the items validated so far
+        loans = {}   # member_id -> loans held after the items validated so far
+        results = []
+        applied = True
+        for operation, isbn, member_id in transactions:
+            book = books.get(isbn)
+            if book is None:
+                results.append(_fail("book_not_found", f"Error: Book with ISBN {isbn} not found."))
+                applied = False
+                continue
+
+            member_loans = loans.get(member_id)
+            if member_loans is None:
+                member = _members_by_id.get(member_id)
+                if member is None:
+                    results.append(_fail("member_not_found", f"Error: Member with ID {member_id} not found."))
+                    applied = False
+                    continue
+                member_loans = loans[member_id] = list(member.borrowed_books)
+
+            available = copies.get(isbn, book.total_copies)
+            if operation == "borrow_book":
+                if available > 0 and len(member_loans) < LOAN_LIMIT and isbn not in member_loans:
+                    copies[isbn] = available - 1
+                    member_loans.append(isbn)
+                    results.append(True)
+                    continue
+                error = _borrow_error(isbn, member_id, book.title, available, member_loans)
+            elif operation == "return_book":
+                if isbn in member_loans:
+                    copies[isbn] = available + 1
+                    member_loans.remove(isbn)
+                    results.append(True)
+                    continue
+                error = _fail("not_borrowed", f"Error: Book {isbn} was not borrowed by member {member_id}.")
+            else:
+                error = _fail("invalid_operation", f"Error: Unknown batch operation '{operation}'.")
+            results.append(error)
+            applied = False
+
+        if applied:
+            _apply_loans(transactions, copies, loans)
+        return {"applied": applied, "results": results}
+
+
+#function to commit a validated batch of borrows and returns
+def _apply_loans(transactions, copies, loans):
+    """Writes the final copies and loans of a validated batch, then updates the loan and availability indexes."""
+    if _snapshots:
+        for isbn in copies:
+            _save_book(isbn, books[isbn])
+        for member_id in loans:
+            _save_member(_members_by_id[member_id])
+    shelved = []
+    for isbn, count in copies.items():
+        book = books[isbn]
+        if (book.total_copies > 0) != (count > 0):
+            shelved.append((book, isbn, count > 0))
+        book.total_copies = count
+    if shelved:
+        with _index_guard():
+            for book, isbn, available in shelved:
+                if available:
+                    _available_by_genre[book.genre].add(isbn)
+                else:
+                    _available_by_genre[book.genre].discard(isbn)
+    for member_id, held in loans.items():
+        _members_by_id[member_id].borrowed_books = tuple(held)
+
+    checked_out = time.time()
+    with _index_guard():
+        for operation, isbn, member_id in transactions:
+            if operation == "borrow_book":
+                _borrowers_by_isbn.setdefault(isbn, set()).add(member_id)
+                _open_loan(isbn, member_id, checked_out)
+            else:
+                borrowers = _borrowers_by_isbn[isbn]
+                borrowers.discard(member_id)
+                if not borrowers:
+                    del _borrowers_by_isbn[isbn]
+                _close_loan(isbn, member_id)
+    if _statistics is not None:
+        for operation, isbn, member_id in transactions:
+            update = _statistics.loan_opened if operation == "borrow_book" else _statistics.loan_closed
+            update(isbn, books[isbn].genre, member_id, len(loans[member_id]))
+    if _listeners:
+        for operation, isbn, member_id in transactions:
+            if operation == "borrow_book":
+                _notify(operation, isbn, member_id, checked_out)
+            else:
+                _notify(operation, isbn, member_id)
+
+
+## Due Dates
+
+def overdue_loans(as_of=None):
+    """
+    Lists the loans that are overdue, i.e. due before a given time, most overdue first.
+    Answered from the due index: the due hours up to as_of are found by bisection, whole hours of loans
+    are collected at once and only the loans due in the hour of as_of are compared, so the cost grows
+    with the number of overdue loans, not all loans or all due hours.
 
-    if isbn not in member["borrowed_books"]:
-        print(f"Error: Book {isbn} was not borrowed by member {member_id}.")
-        return False
+    :param as_of: Time to check against, in seconds since the epoch (float, optional). Defaults to now.
+    :return: A list of loan dictionaries {"isbn", "member_id", "checked_out", "due"}.
+    """
+    if _instrumentation is not None:
+        return _timed("overdue_loans", _overdue_loans, as_of)
+    return _overdue_loans(as_of)
+
+
+def _overdue_loans(as_of):
+    """overdue_loans without instrumentation."""
+    if _storage is not None:
+        return _storage.overdue_loans(as_of)
+    if as_of is None:
+        as_of = time.time()
+    last_hour = as_of // _DUE_BUCKET
+    overdue = []
+    with _index_guard():
+        hours = _due_hours[:bisect.bisect_right(_due_hours, last_hour)]
+        for hour in hours:
+            bucket = _due_buckets[hour]
+            if hour < last_hour:
+                overdue.extend(bucket)
+            else:
+                overdue.extend(entry for entry in bucket if entry[0] < as_of)
+    overdue.sort()
+    return [_loan_dict(entry) for entry in overdue]
+
+
+def loans_due_next(count):
+    """
+    Lists the `count` open loans that fall due first, earliest due date first (overdue loans included).
+    Only the earliest due hours are read, until they hold `count` loans.
 
-    # Valid: Increment copies and remove ISBN from member's list
-    books[isbn]["total_copies"] += 1
-    member["borrowed_books"].remove(isbn)
-    return True
\ No newline at end of file
+    :param count: Maximum number of loans to return (integer).
+    :return: A list of loan dictionaries {"isbn", "member_id", "checked_out", "due"}.
+    """
+    if _instrumentation is not None:
+        return _timed("loans_due_next", _loans_due_next, count)
+    return _loans_due_next(count)
+
+
+def _loans_due_next(count):
+    """loans_due_next without instrumentation."""
+    if _storage is not None:
+        return _storage.loans_due_next(count)
+    upcoming = []
+    with _index_guard():
+        for hour in _due_hours:
+            if len(upcoming) >= count:
+                break
+            upcoming.extend(heapq.nsmallest(count - len(upcoming), _due_buckets[hour]))
+    return [_loan_dict(entry) for entry in upcoming]
+
+
+#function to turn a due index entry into a loan dictionary
+def _loan_dict(entry):
+    """Returns the loan dictionary for a (due, isbn, member_id, checked_out) entry."""
+    due, isbn, member_id, checked_out = entry
+    return {"isbn": isbn, "member_id": member_id, "checked_out": checked_out, "due": due}
@@ -0,0 +1,251 @@
+# persistence.py
+
+import glob
+import json
+import os
+import threading
+import time
+
+import ag_operations
+from ag_records import Book, Member
+
+# Operations that can appear in the log, mapped to the functions that replay them
+REPLAY_FUNCTIONS = {
+    "add_book": ag_operations.add_book,
+    "update_book": ag_operations.update_book,
+    "delete_book": ag_operations.delete_book,
+    "add_member": ag_operations.add_member,
+    "update_member": ag_operations.update_member,
+    "delete_member": ag_operations.delete_member,
+    "borrow_book": ag_operations.borrow_book,
+    "return_book": ag_operations.return_book,
+}
+
+
+class Persistence:
+    """
+    Durable storage for the library: every successful mutation is appended to an operation log,
+    and the full state is periodically written to a snapshot, after which older log segments are
+    deleted (compaction). On startup, recover() loads the latest snapshot and replays the log tail.
+
+    Files in the directory:
+        snapshot-<seq>.json  State after operation number <seq>.
+        log-<seq>.jsonl      Operations numbered from <seq> onwards, one JSON array [seq, operation, args] per line.
+
+    Log writes are buffered and fsync'ed in groups: after `fsync_every` operations, or on the first
+    operation logged more than `fsync_interval` seconds after the previous fsync. A crash can lose the
+    operations logged since the last fsync; call sync() to force one (e.g. before acknowledging a batch).
+    """
+
+    def __init__(self, directory, fsync_every=1000, fsync_interval=0.05, snapshot_every=1_000_000):
+        """
+        :param directory: Directory holding snapshots and log segments (string). Created if missing.
+        :param fsync_every: Maximum number of logged operations between fsyncs (integer).
+        :param fsync_interval: Maximum number of seconds between fsyncs (float).
+        :param snapshot_every: Take a snapshot after this many logged operations (integer, None to disable).
+        """
+        self.directory = directory
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.seq = 0
+        self._log = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._since_snapshot = 0
+        self._lock = threading.RLock()
+        self._snapshot_pending = False
+        os.makedirs(directory, exist_ok=True)
+
+    # Recovery
+
+    def recover(self):
+        """
+        Rebuilds the library from the latest snapshot plus the log operations recorded after it,
+        then starts logging new mutations. Replaces any data currently in memory.
+
+        :return: A dictionary with the snapshot seq, the number of replayed operations and the seconds taken.
+        """
+        start = time.perf_counter()
+        self.close()
+
+        snapshot_seq = 0
+        snapshots = self._files("snapshot-", ".json")
+        if snapshots:
+            snapshot_seq, path = snapshots[-1]
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            genres = {genre: genre for genre in ag_operations.GENRES}
+            ag_operations._load_state(
+                ((isbn, Book(title, author, genres[genre], copies))
+                 for isbn, title, author, genre, copies in state["books"]),
+                (Member(member_id, name, email, loans) for member_id, name, email, loans in state["members"]),
+                state.get("loans", ()),
+            )
+        else:
+            ag_operations.reset_library()
+
+        self.seq = snapshot_seq
+        replayed = 0
+        segments = self._files("log-", ".jsonl")
+        for _, path in segments:
+            for seq, operation, args in _read_log(path):
+                if seq <= self.seq:
+                    continue
+                REPLAY_FUNCTIONS[operation](*args)
+                self.seq = seq
+                replayed += 1
+        if segments:
+            # New entries may be appended to the last segment: drop a torn line left by a crash first
+            _truncate_torn_tail(segments[-1][1])
+
+        self._since_snapshot = replayed
+        self._open_segment()
+        ag_operations.add_listener(self._record)
+        return {"snapshot_seq": snapshot_seq, "replayed": replayed, "seconds": time.perf_counter() - start}
+
+    # Logging
+
+    def _record(self, operation, args):
+        """Mutation listener: appends one operation to the log and syncs/snapshots when due."""
+        with self._lock:
+            self.seq += 1
+            self._log.write(json.dumps([self.seq, operation, args], separators=(",", ":")) + "\n")
+            self._unsynced += 1
+            self._since_snapshot += 1
+
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self.sync()
+            if self.snapshot_every and self._since_snapshot >= self.snapshot_every and not self._snapshot_pending:
+                if ag_operations._locks is None:
+                    self.snapshot()
+                else:
+                    # The calling operation still holds record locks: snapshot from another thread
+                    # once all operations can be paused
+                    self._snapshot_pending = True
+                    threading.Thread(target=self.snapshot, daemon=True).start()
+
+    def sync(self):
+        """Flushes buffered log entries and fsyncs them to disk."""
+        with self._lock:
+            if self._log is not None and self._unsynced:
+                self._log.flush()
+                os.fsync(self._log.fileno())
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def _open_segment(self):
+        """Starts a new log segment for operations after the current seq."""
+        path = os.path.join(self.directory, f"log-{self.seq + 1:012d}.jsonl")
+        self._log = open(path, "a", encoding="utf-8")
+
+    # Snapshots and Compaction
+
+    def snapshot(self):
+        """
+        Writes the current state to a new snapshot, starts a new log segment and deletes the
+        snapshots and log segments the new snapshot makes obsolete.
+
+        Operations are paused (in thread-safe mode) only while a point-in-time view of the library is
+        taken (ag_operations.open_snapshot) and the log is rolled; the file is written from the view
+        while they continue.
+
+        :return: Path of the snapshot file (string).
+        """
+        try:
+            return self._snapshot()
+        finally:
+            # Also after a failed write, so later operations can schedule the next snapshot
+            with self._lock:
+                self._snapshot_pending = False
+
+    def _snapshot(self):
+        """snapshot without clearing the pending flag."""
+        # Pause all operations so the view matches the log exactly
+        with ag_operations._hold_all(), self._lock:
+            self.sync()
+            seq = self.seq
+            view = ag_operations._open_snapshot()
+            # Operations after seq go to a new segment, which compaction keeps
+            if self._log is not None:
+                self._log.close()
+                self._open_segment()
+            self._since_snapshot = 0
+
+        try:
+            state = {
+                "seq": seq,
+                "books": [[isbn, book.title, book.author, book.genre, book.total_copies]
+                          for isbn, book in view.iter_books()],
+                "members": [[member.member_id, member.name, member.email, member.borrowed_books]
+                            for member in view.iter_members()],
+                "loans": [list(loan) for loan in view.iter_loans()],
+            }
+        finally:
+            view.close()
+        path = os.path.join(self.directory, f"snapshot-{seq:012d}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        # Everything up to seq is now in the snapshot: compact
+        with self._lock:
+            self._compact(seq)
+        return path
+
+    def _compact(self, snapshot_seq):
+        """Deletes older snapshots and the log segments that only hold operations up to snapshot_seq."""
+        for seq, path in self._files("snapshot-", ".json"):
+            if seq < snapshot_seq:
+                os.remove(path)
+        for seq, path in self._files("log-", ".jsonl"):
+            if seq <= snapshot_seq:
+                os.remove(path)
+
+    def close(self):
+        """Syncs the log and stops recording mutations."""
+        if self._log is not None:
+            self.sync()
+            self._log.close()
+            self._log = None
+        if self._record in ag_operations._listeners:
+            ag_operations.remove_listener(self._record)
+
+    def _files(self, prefix, suffix):
+        """Returns (seq, path) pairs of the files with the given prefix/suffix, sorted by seq."""
+        found = []
+        for path in glob.glob(os.path.join(self.directory, prefix + "*" + suffix)):
+            name = os.path.basename(path)
+            found.append((int(name[len(prefix):-len(suffix)]), path))
+        return sorted(found)
+
+
+#function to read a log segment, tolerating a torn final line from a crash
+def _read_log(path):
+    """Yields (seq, operation, args) from a log segment, stopping at an incomplete trailing line."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            yield json.loads(line)
+
+
+#function to cut an incomplete final line off a log segment
+def _truncate_torn_tail(path, chunk_size=65536):
+    """Truncates the file after its last newline, removing a partially written final line."""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - chunk_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            f.truncate(position)
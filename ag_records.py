@@ -0,0 +1,179 @@
+# records.py
+
+from collections.abc import Mapping, MutableMapping, Sequence
+
+
+# Compact Record Types used by operations.py
+# Books and members are stored as __slots__ objects instead of dictionaries: no per-object
+# __dict__/hash table, and at most one small tuple for loans. They still support the dict-style
+# access the rest of the system uses (book["title"], member["borrowed_books"], book.get(...),
+# dict(book), and comparison with plain dictionaries).
+
+class _Record(MutableMapping):
+    """Base class giving a __slots__ record read/write dict-style access to its FIELDS."""
+
+    __slots__ = ()
+    FIELDS = ()
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError(f"{type(self).__name__} fields cannot be deleted.")
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+
+class Book(_Record):
+    """
+    A catalog entry. Dict-style keys: title, author, genre, total_copies.
+
+    genre should be the canonical string from GENRES so every book shares the same string object.
+    seq is the catalog insertion sequence number assigned by operations.py (not a dict-style key).
+    """
+
+    __slots__ = ("title", "author", "genre", "total_copies", "seq")
+    FIELDS = ("title", "author", "genre", "total_copies")
+
+    def __init__(self, title, author, genre, total_copies, seq=0):
+        self.title = title
+        self.author = author
+        self.genre = genre
+        self.total_copies = total_copies
+        self.seq = seq
+
+
+class Member(_Record):
+    """
+    A library member. Dict-style keys: member_id, name, email, borrowed_books.
+
+    borrowed_books is a tuple of ISBNs that is replaced (not mutated) on every borrow/return;
+    with the loan limit of 3 it never holds more than three entries.
+    """
+
+    __slots__ = ("member_id", "name", "email", "borrowed_books")
+    FIELDS = ("member_id", "name", "email", "borrowed_books")
+
+    def __init__(self, member_id, name, email, borrowed_books=()):
+        self.member_id = member_id
+        self.name = name
+        self.email = email
+        self.borrowed_books = tuple(borrowed_books)
+
+
+class BookView(Mapping):
+    """
+    Read-only view of a catalog entry together with its ISBN, as returned by paginated/lazy searches.
+    Dict-style keys: isbn, title, author, genre, total_copies. Nothing is copied: the view reads
+    the live Book, so it reflects later updates (e.g. total_copies after a borrow).
+    """
+
+    __slots__ = ("_isbn", "_book")
+    FIELDS = ("isbn", "title", "author", "genre", "total_copies")
+
+    def __init__(self, isbn, book):
+        self._isbn = isbn
+        self._book = book
+
+    isbn = property(lambda self: self._isbn)
+    title = property(lambda self: self._book.title)
+    author = property(lambda self: self._book.author)
+    genre = property(lambda self: self._book.genre)
+    total_copies = property(lambda self: self._book.total_copies)
+    seq = property(lambda self: self._book.seq)
+
+    def __getitem__(self, key):
+        if key == "isbn":
+            return self._isbn
+        if key in Book.FIELDS:
+            return getattr(self._book, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={self[field]!r}" for field in self.FIELDS)
+        return f"BookView({fields})"
+
+
+class MemberList(Sequence):
+    """
+    The members list of operations.py: the Member records of an insertion-ordered member_id -> Member
+    index, in the order they were added. append and remove update the index, so both take constant time
+    and removing keeps the order of the other members. Reading by position uses a list of the members
+    made on first use after a change. Compares equal to a list of the same members.
+    Callers serialize the changes (operations.py holds the index lock).
+    """
+
+    def __init__(self, index):
+        self._index = index
+        self._changes = 0
+        self._ordered = (0, [])  # (changes when built, members in order)
+
+    def _list(self):
+        """Returns the members in order, rebuilding the list if a change happened since it was built."""
+        changes = self._changes
+        built, ordered = self._ordered
+        if built != changes:
+            ordered = list(self._index.values())
+            self._ordered = (changes, ordered)
+        return ordered
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, index):
+        return self._list()[index]
+
+    def __iter__(self):
+        return iter(self._list())
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, Sequence)):
+            return self._list() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self._list())
+
+    def append(self, member):
+        """Adds a member at the end (its member_id must not be in the index)."""
+        self._index[member.member_id] = member
+        self._changes += 1
+
+    def remove(self, member):
+        """Removes a member, found by its member_id."""
+        del self._index[member.member_id]
+        self._changes += 1
+
+    def clear(self):
+        """Removes every member."""
+        self._index.clear()
+        self._changes += 1
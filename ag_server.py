@@ -0,0 +1,370 @@
+# server.py
+
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import time
+
+import ag_operations
+
+
+#function to apply a batch of loans with JSON-safe item results
+def _process_loans(transactions):
+    """process_loans, with each failed item's result as {"code": ..., "message": ...} instead of a Failure."""
+    batch = ag_operations.process_loans(transactions)
+    results = [result if result is True else {"code": result.code, "message": result.message}
+               for result in batch["results"]]
+    return {"applied": batch["applied"], "results": results}
+
+
+#function to return a search page with JSON-safe books
+def _search_page(*args, **kwargs):
+    """search_page, with the page's read-only views copied into book dictionaries."""
+    page = ag_operations.search_page(*args, **kwargs)
+    if not page:
+        return page
+    return {"total": page["total"], "books": [dict(view) for view in page["books"]], "cursor": page["cursor"]}
+
+
+# Operations exposed by the server. Reads are batched per event-loop tick and identical reads in a
+# batch are answered by a single call; writes are applied in arrival order by one writer task.
+READ_OPERATIONS = {
+    "search_books": ag_operations.search_books,
+    "search_page": _search_page,
+    "fuzzy_search": ag_operations.fuzzy_search,
+    "get_borrowers": ag_operations.get_borrowers,
+    "books_by_genre": ag_operations.books_by_genre,
+    "available_books": ag_operations.available_books,
+    "genre_counts": ag_operations.genre_counts,
+    "overdue_loans": ag_operations.overdue_loans,
+    "loans_due_next": ag_operations.loans_due_next,
+}
+WRITE_OPERATIONS = {
+    "add_book": ag_operations.add_book,
+    "add_member": ag_operations.add_member,
+    "update_book": ag_operations.update_book,
+    "update_member": ag_operations.update_member,
+    "delete_book": ag_operations.delete_book,
+    "delete_member": ag_operations.delete_member,
+    "borrow_book": ag_operations.borrow_book,
+    "return_book": ag_operations.return_book,
+    "process_loans": _process_loans,
+}
+
+
+#function to call an operation and unpack a failure
+def _call(function, args, kwargs):
+    """Calls an operation (in quiet mode), returning (result, error message or None, error code or None)."""
+    result = function(*args, **kwargs)
+    if result.__class__ is ag_operations.Failure:
+        return False, result.message, result.code
+    return result, None, None
+
+
+class LibraryServer:
+    """
+    Asyncio TCP server exposing ag_operations as line-delimited JSON.
+
+    Each request is one line: {"id": 1, "op": "borrow_book", "args": ["B001", "M001"], "kwargs": {}}.
+    Each response is one line: {"id": 1, "ok": true, "result": true, "message": null, "code": null}, where
+    a failed operation has result false, its error text in message and its error code (e.g. "unavailable")
+    in code, and ok is false only for malformed requests. The server runs operations in quiet mode.
+    Requests on one connection are handled concurrently and answered as they complete, so clients
+    match responses by id and wait for a write's response before relying on it.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, persistence=None, max_write_batch=256):
+        """
+        :param host: Interface to listen on (string).
+        :param port: TCP port to listen on, 0 for any free port (integer).
+        :param persistence: Optional ag_persistence.Persistence; its log is fsync'ed once per write batch
+                            before the batch is acknowledged.
+        :param max_write_batch: Maximum number of writes applied per writer iteration (integer).
+        """
+        self.host = host
+        self.port = port
+        self.persistence = persistence
+        self.max_write_batch = max_write_batch
+        self.stats = {"requests": 0, "reads": 0, "coalesced_reads": 0, "writes": 0, "write_batches": 0}
+        self._server = None
+        self._writer_task = None
+        self._writes = None
+        self._pending_reads = {}
+        self._was_quiet = False
+
+    async def start(self):
+        """Starts listening and the writer task, and enables quiet mode. Sets self.port to the bound port."""
+        self._was_quiet = ag_operations._quiet
+        ag_operations.enable_quiet_mode()
+        self._writes = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """Starts the server (if needed) and serves until cancelled."""
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """Stops accepting connections and the writer task, and restores the previous quiet mode setting."""
+        self._server.close()
+        await self._server.wait_closed()
+        self._writer_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._writer_task
+        if not self._was_quiet:
+            ag_operations.disable_quiet_mode()
+
+    # Connections
+
+    async def _handle_connection(self, reader, writer):
+        """Reads request lines and answers each one as soon as it completes."""
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _respond(self, line, writer):
+        """Handles one request line and writes its response line."""
+        self.stats["requests"] += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            result, message, code = await self._dispatch(request["op"], request.get("args", []),
+                                                         request.get("kwargs", {}))
+            response = {"id": request_id, "ok": True, "result": result, "message": message, "code": code}
+        except Exception as error:
+            response = {"id": request_id, "ok": False, "error": f"{type(error).__name__}: {error}"}
+        if not writer.is_closing():
+            writer.write(json.dumps(response, separators=(",", ":")).encode() + b"\n")
+
+    async def _dispatch(self, operation, args, kwargs):
+        """Routes an operation to the read batcher or the writer queue."""
+        if operation in READ_OPERATIONS:
+            return await self._read(operation, args, kwargs)
+        if operation in WRITE_OPERATIONS:
+            future = asyncio.get_running_loop().create_future()
+            self._writes.put_nowait((WRITE_OPERATIONS[operation], args, kwargs, future))
+            return await future
+        if operation == "server_stats":
+            return dict(self.stats), None, None
+        raise ValueError(f"Unknown operation '{operation}'.")
+
+    # Reads
+
+    def _read(self, operation, args, kwargs):
+        """Queues a read for the next batch, sharing the result with identical queued reads."""
+        self.stats["reads"] += 1
+        key = (operation, json.dumps([args, kwargs], sort_keys=True))
+        pending = self._pending_reads.get(key)
+        if pending is not None:
+            self.stats["coalesced_reads"] += 1
+            return pending[0]
+
+        loop = asyncio.get_running_loop()
+        if not self._pending_reads:
+            loop.call_soon(self._flush_reads)
+        future = loop.create_future()
+        self._pending_reads[key] = (future, READ_OPERATIONS[operation], args, kwargs)
+        return future
+
+    def _flush_reads(self):
+        """Runs every distinct read queued during this event-loop tick once."""
+        pending, self._pending_reads = self._pending_reads, {}
+        for future, function, args, kwargs in pending.values():
+            try:
+                future.set_result(_call(function, args, kwargs))
+            except Exception as error:
+                future.set_exception(error)
+
+    # Writes
+
+    async def _writer(self):
+        """Applies queued writes in order, in batches, acknowledging each batch after one log fsync."""
+        while True:
+            batch = [await self._writes.get()]
+            while len(batch) < self.max_write_batch and not self._writes.empty():
+                batch.append(self._writes.get_nowait())
+
+            outcomes = []
+            for function, args, kwargs, future in batch:
+                try:
+                    outcomes.append((future, _call(function, args, kwargs), None))
+                except Exception as error:
+                    outcomes.append((future, None, error))
+            if self.persistence is not None:
+                self.persistence.sync()
+
+            self.stats["writes"] += len(batch)
+            self.stats["write_batches"] += 1
+            for future, result, error in outcomes:
+                if future.cancelled():
+                    continue
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+
+async def _serve_with_metrics(server, path, interval):
+    """Serves with an ag_metrics.Metrics hook installed, exporting it to path every `interval` seconds."""
+    from ag_metrics import Metrics
+    metrics = Metrics()
+    ag_operations.set_instrumentation(metrics)
+    serving = asyncio.create_task(server.serve_forever())
+    try:
+        while not serving.done():
+            await asyncio.wait([serving], timeout=interval)
+            metrics.export_prometheus(path)
+    finally:
+        serving.cancel()
+        ag_operations.set_instrumentation(None)
+
+
+# Load Generator
+
+class _Client:
+    """Minimal pipelining client: sends request lines and matches responses by id."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._next_id = 0
+        self._waiting = {}
+        self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        """Resolves each waiting call with its response; responses with a null or unknown id are skipped."""
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self._waiting.pop(response.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result(response)
+
+    async def call(self, operation, *args, **kwargs):
+        """Sends one request and returns its response dictionary."""
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[self._next_id] = future
+        request = {"id": self._next_id, "op": operation, "args": args, "kwargs": kwargs}
+        self._writer.write(json.dumps(request, separators=(",", ":")).encode() + b"\n")
+        return await future
+
+    async def close(self):
+        self._writer.close()
+        self._listener.cancel()
+        with contextlib.suppress(asyncio.CancelledError, ConnectionError):
+            await self._listener
+
+
+async def connect(host="127.0.0.1", port=8765):
+    """Opens a client connection to a LibraryServer; use `await client.call(op, *args)`."""
+    reader, writer = await asyncio.open_connection(host, port)
+    return _Client(reader, writer)
+
+
+async def run_load(host="127.0.0.1", port=8765, clients=32, requests=20_000, catalog=10_000,
+                   read_share=0.7, seed=42):
+    """
+    Seeds the server with a synthetic catalog, then has `clients` concurrent connections issue
+    `requests` requests in total (searches from a small set of popular queries, borrows and returns).
+
+    :return: A result dictionary with requests/sec and p50/p99 latency in milliseconds.
+    """
+    rng = random.Random(seed)
+    seeder = await connect(host, port)
+    await asyncio.gather(*(seeder.call("add_book", f"L{i:07d}", f"Load Title {i}", f"Author {i % 500}", "Fiction", 5)
+                           for i in range(catalog)))
+    await asyncio.gather(*(seeder.call("add_member", f"N{i:07d}", f"Load Patron {i}", f"n{i}@lib.com")
+                           for i in range(catalog)))
+    await seeder.close()
+
+    popular = [f"title {rng.randrange(catalog)}" for _ in range(50)] + [f"author {i}" for i in range(10)]
+    latencies = []
+
+    async def client_loop(count, client_seed):
+        client_rng = random.Random(client_seed)
+        client = await connect(host, port)
+        loans = []
+        for _ in range(count):
+            roll = client_rng.random()
+            start = time.perf_counter()
+            if roll < read_share:
+                await client.call("search_books", client_rng.choice(popular))
+            elif loans and roll > (1 + read_share) / 2:
+                await client.call("return_book", *loans.pop())
+            else:
+                loan = (f"L{client_rng.randrange(catalog):07d}", f"N{client_rng.randrange(catalog):07d}")
+                if (await client.call("borrow_book", *loan))["result"]:
+                    loans.append(loan)
+            latencies.append(time.perf_counter() - start)
+        await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(requests // clients, seed + i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {"requests": len(latencies), "clients": clients, "seconds": elapsed,
+            "requests_per_sec": len(latencies) / elapsed,
+            "p50_ms": latencies[len(latencies) // 2] * 1e3,
+            "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3}
+
+
+def print_load(result):
+    """Prints the result of run_load."""
+    print(f"{result['requests']:,} requests from {result['clients']} clients in {result['seconds']:.1f}s: "
+          f"{result['requests_per_sec']:,.0f} req/s, p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Library service over line-delimited JSON.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--data", help="directory for durable storage (ag_persistence)")
+    serve.add_argument("--metrics", help="file to export operation metrics to in Prometheus text format")
+    serve.add_argument("--metrics-interval", type=float, default=15.0, help="seconds between metrics exports")
+    load = commands.add_parser("load", help="run the load generator against a running server")
+    load.add_argument("--host", default="127.0.0.1")
+    load.add_argument("--port", type=int, default=8765)
+    load.add_argument("--clients", type=int, default=32)
+    load.add_argument("--requests", type=int, default=20_000)
+    load.add_argument("--catalog", type=int, default=10_000)
+    options = parser.parse_args()
+
+    if options.command == "serve":
+        store = None
+        if options.data:
+            from ag_persistence import Persistence
+            store = Persistence(options.data)
+            store.recover()
+        server = LibraryServer(options.host, options.port, persistence=store)
+        if options.metrics:
+            asyncio.run(_serve_with_metrics(server, options.metrics, options.metrics_interval))
+        else:
+            asyncio.run(server.serve_forever())
+    else:
+        print_load(asyncio.run(run_load(options.host, options.port, options.clients, options.requests,
+                                        options.catalog)))
@@ -0,0 +1,300 @@
+# shards.py
+
+import heapq
+import itertools
+import multiprocessing
+import time
+import zlib
+
+import ag_operations
+from ag_operations import Failure, LOAN_LIMIT
+
+# Keys of the dictionaries returned by search_books, in order
+BOOK_FIELDS = ("isbn", "title", "author", "genre", "total_copies")
+
+
+#function to pick the shard that owns a book
+def shard_of(isbn, shards):
+    """Returns the index of the shard owning an ISBN (a stable hash, the same in every process)."""
+    return zlib.crc32(isbn.encode()) % shards
+
+
+class ShardedLibrary:
+    """
+    A catalog partitioned across worker processes, so searches use several cores.
+
+    Every book lives in exactly one shard, chosen by a hash of its ISBN (shard_of). Each shard is a
+    worker process running its own copy of operations.py. Book operations (add/update/delete, borrow,
+    return, get_borrowers) are routed to the owning shard. search_books, books_by_genre,
+    available_books, genre_counts and the due date queries run on all shards in parallel, and
+    their results are merged.
+    Members are replicated to every shard. This process keeps each member's loans, so the loan
+    limit holds across shards.
+
+    The methods take the same arguments and return the same values as the functions in
+    operations.py. Failures are printed or returned according to this process's quiet mode.
+    Use one ShardedLibrary from one thread at a time. It keeps data in memory only.
+    """
+
+    def __init__(self, workers=4):
+        """
+        Starts the worker processes with an empty catalog.
+
+        :param workers: Number of shards/worker processes (integer).
+        """
+        self.workers = workers
+        self._connections = []
+        self._processes = []
+        self._sequence = itertools.count()
+        self._loans = {}  # member_id -> ISBNs currently borrowed, across all shards
+        for _ in range(workers):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_shard, args=(worker_connection,), daemon=True)
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def close(self):
+        """Stops the worker processes."""
+        for connection in self._connections:
+            connection.send(None)
+            connection.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    # Messaging
+
+    def _call(self, shard, operation, *args):
+        """Runs an operation on one shard and returns its result."""
+        connection = self._connections[shard]
+        connection.send((operation, args))
+        return _unpack(connection.recv())
+
+    def _broadcast(self, operation, *args):
+        """Runs an operation on every shard in parallel and returns their results in shard order."""
+        for connection in self._connections:
+            connection.send((operation, args))
+        return [_unpack(connection.recv()) for connection in self._connections]
+
+    def _owner(self, isbn):
+        return shard_of(isbn, self.workers)
+
+    # Books
+
+    def add_book(self, isbn, title, author, genre, total_copies):
+        return _report(self._call(self._owner(isbn), "add_book", next(self._sequence),
+                                  isbn, title, author, genre, total_copies))
+
+    def load_books(self, rows):
+        """
+        Adds many books with one message per shard (e.g. to populate the shards from a catalog export).
+
+        :param rows: Iterable of (isbn, title, author, genre, total_copies) tuples.
+        :return: The number of books added (rows rejected by add_book are skipped silently).
+        """
+        batches = [[] for _ in range(self.workers)]
+        for row in rows:
+            batches[self._owner(row[0])].append((next(self._sequence), *row))
+        for connection, batch in zip(self._connections, batches):
+            connection.send(("load_books", (batch,)))
+        return sum(_unpack(connection.recv()) for connection in self._connections)
+
+    def update_book(self, isbn, title=None, author=None, genre=None, total_copies=None):
+        return _report(self._call(self._owner(isbn), "update_book", isbn, title, author, genre, total_copies))
+
+    def delete_book(self, isbn):
+        return _report(self._call(self._owner(isbn), "delete_book", isbn))
+
+    def get_borrowers(self, isbn):
+        return self._call(self._owner(isbn), "get_borrowers", isbn)
+
+    def search_books(self, query, by="title"):
+        """Searches every shard in parallel; results are merged into catalog (insertion) order."""
+        results = self._broadcast("search_books", query, by)
+        return [dict(zip(BOOK_FIELDS, row[1:])) for row in heapq.merge(*results)]
+
+    def books_by_genre(self, genre, available_only=False):
+        return _report(_concatenate(self._broadcast("books_by_genre", genre, available_only)))
+
+    def available_books(self, genre=None):
+        return _report(_concatenate(self._broadcast("available_books", genre)))
+
+    def genre_counts(self):
+        counts = {genre: {"books": 0, "available": 0} for genre in ag_operations.GENRES}
+        for shard_counts in self._broadcast("genre_counts"):
+            for genre, shard_count in shard_counts.items():
+                counts[genre]["books"] += shard_count["books"]
+                counts[genre]["available"] += shard_count["available"]
+        return counts
+
+    def configure_search_cache(self, capacity):
+        """Sets the search cache capacity of every shard (see ag_operations.configure_search_cache)."""
+        self._broadcast("configure_search_cache", capacity)
+
+    def overdue_loans(self, as_of=None):
+        """Collects the overdue loans of every shard, most overdue first."""
+        if as_of is None:
+            as_of = time.time()
+        return list(heapq.merge(*self._broadcast("overdue_loans", as_of), key=_due))
+
+    def loans_due_next(self, count):
+        """Collects the `count` loans that fall due first across all shards."""
+        return list(itertools.islice(heapq.merge(*self._broadcast("loans_due_next", count), key=_due), count))
+
+    # Members (replicated to every shard)
+
+    def add_member(self, member_id, name, email):
+        result = self._broadcast("add_member", member_id, name, email)[0]
+        if result is True:
+            self._loans[member_id.strip()] = ()
+        return _report(result)
+
+    def update_member(self, member_id, name=None, email=None):
+        return _report(self._broadcast("update_member", member_id, name, email)[0])
+
+    def delete_member(self, member_id):
+        # Shards only see their own loans, so the loan check uses the totals kept here
+        loans = self._loans.get(member_id)
+        if loans:
+            return ag_operations._fail(
+                "member_has_loans",
+                f"Error: Cannot delete member {member_id}. They currently have {len(loans)} book(s) borrowed.")
+        result = self._broadcast("delete_member", member_id)[0]
+        if result is True:
+            del self._loans[member_id]
+        return _report(result)
+
+    # Borrow/Return
+
+    def borrow_book(self, isbn, member_id, checked_out=None):
+        shard = self._owner(isbn)
+        loans = self._loans.get(member_id, ())
+        elsewhere = sum(1 for loan in loans if self._owner(loan) != shard)
+        result = self._call(shard, "borrow_book", isbn, member_id, checked_out, elsewhere)
+        if result is True:
+            self._loans[member_id] = loans + (isbn,)
+        return _report(result)
+
+    def return_book(self, isbn, member_id):
+        result = self._call(self._owner(isbn), "return_book", isbn, member_id)
+        if result is True:
+            loans = self._loans[member_id]
+            position = loans.index(isbn)
+            self._loans[member_id] = loans[:position] + loans[position + 1:]
+        return _report(result)
+
+
+#function to raise an exception sent back by a shard
+def _unpack(result):
+    """Returns a shard's result, re-raising it if the shard operation raised an exception."""
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+#function to report a shard's failure in this process
+def _report(result):
+    """Turns a Failure from a (quiet) shard into this process's failure result: printed False, or the Failure."""
+    if result.__class__ is Failure:
+        return ag_operations._fail(result.code, result.message)
+    return result
+
+
+#function to order loans by due date
+def _due(loan):
+    return loan["due"]
+
+
+#function to merge per-shard ISBN lists
+def _concatenate(results):
+    """Concatenates per-shard lists, or returns the first Failure (all shards fail the same way)."""
+    merged = []
+    for result in results:
+        if result.__class__ is Failure:
+            return result
+        merged.extend(result)
+    return merged
+
+
+# Shard Worker
+
+def _serve_shard(connection):
+    """Worker process main loop: runs the operations it receives on its own copy of operations.py."""
+    # Shards keep their books in memory even if the parent installed a storage backend. The backend's
+    # connections were inherited through fork: keep a reference so they are never closed (or used) here
+    inherited_storage = ag_operations._storage
+    ag_operations.set_storage(None)
+    ag_operations.enable_quiet_mode()
+    handlers = {
+        "add_book": _add_book,
+        "load_books": _load_books,
+        "update_book": ag_operations.update_book,
+        "delete_book": ag_operations.delete_book,
+        "get_borrowers": ag_operations.get_borrowers,
+        "search_books": _search_books,
+        "books_by_genre": ag_operations.books_by_genre,
+        "available_books": ag_operations.available_books,
+        "genre_counts": ag_operations.genre_counts,
+        "configure_search_cache": ag_operations.configure_search_cache,
+        "overdue_loans": ag_operations.overdue_loans,
+        "loans_due_next": ag_operations.loans_due_next,
+        "add_member": ag_operations.add_member,
+        "update_member": ag_operations.update_member,
+        "delete_member": ag_operations.delete_member,
+        "borrow_book": _borrow_book,
+        "return_book": ag_operations.return_book,
+    }
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        operation, args = request
+        try:
+            result = handlers[operation](*args)
+        except Exception as error:
+            result = error
+        connection.send(result)
+    connection.close()
+
+
+def _add_book(seq, isbn, title, author, genre, total_copies):
+    """add_book, numbering the book with the global catalog sequence so shard results merge in order."""
+    result = ag_operations.add_book(isbn, title, author, genre, total_copies)
+    if result is True:
+        ag_operations.books[isbn].seq = seq
+    return result
+
+
+def _load_books(rows):
+    """Adds a batch of (seq, isbn, title, author, genre, total_copies) rows; returns how many were added."""
+    return sum(_add_book(*row) is True for row in rows)
+
+
+def _search_books(query, by):
+    """search_books, as (seq, *BOOK_FIELDS) tuples: cheaper to send than dictionaries, and sortable by seq."""
+    books = ag_operations.books
+    return [(books[book["isbn"]].seq, *book.values()) for book in ag_operations.search_books(query, by)]
+
+
+def _borrow_book(isbn, member_id, checked_out, loans_elsewhere):
+    """
+    borrow_book, counting the member's loans held on other shards towards the loan limit.
+    The extra check runs only once the book, the member and a copy are known to exist, so
+    failures are reported in the same order as borrow_book reports them.
+    """
+    book = ag_operations.books.get(isbn)
+    member = ag_operations._find_member(member_id)
+    if (loans_elsewhere and book is not None and member is not None and book.total_copies > 0
+            and len(member.borrowed_books) + loans_elsewhere >= LOAN_LIMIT):
+        return Failure("loan_limit", f"Error: Member {member_id} has reached the loan limit ({LOAN_LIMIT} books).")
+    return ag_operations.borrow_book(isbn, member_id, checked_out)
@@ -0,0 +1,107 @@
+# snapshot.py
+
+from ag_records import Book, Member
+
+
+class Snapshot:
+    """
+    A point-in-time, read-only view of the books, members and loan dates, for reports and exports
+    that run while operations continue. Created by ag_operations.open_snapshot().
+
+    Copy-on-write: taking a snapshot copies no records, only the lists of ISBNs and member
+    records that existed at that moment (one reference each). While the snapshot is open,
+    operations.py saves a copy of each book, member and loan date in it the first time it is
+    changed or deleted; the snapshot reads the live record otherwise. Its memory therefore grows
+    only with the records changed while it is open. Close it (or use it as a context manager)
+    so operations stop saving copies for it.
+
+    Reads take no locks and never block borrow_book/return_book. Records are returned as copies,
+    so they stay valid after the snapshot is closed.
+    """
+
+    def __init__(self, live_books, live_loans, isbns, member_list, boundary, release):
+        """
+        :param live_books: The live catalog (operations.books).
+        :param live_loans: The live loan dates ((isbn, member_id) -> (due, isbn, member_id, checked_out)).
+        :param isbns: ISBNs in the catalog when the snapshot was taken, in catalog order (list).
+        :param member_list: Member records when the snapshot was taken, in list order (list).
+        :param boundary: Catalog sequence number after every book in the snapshot (integer).
+        :param release: Called with the snapshot when it is closed, to stop saving copies for it.
+        """
+        self._live_books = live_books
+        self._live_loans = live_loans
+        self._isbns = isbns
+        self._member_list = member_list
+        self.boundary = boundary
+        self.valid = True
+        self._release = release
+        # Records as they were when the snapshot was taken, saved by operations.py before changing them
+        self.saved_books = {}    # isbn -> Book
+        self.saved_members = {}  # member_id -> Member
+        self.saved_loans = {}    # (isbn, member_id) -> due date entry, or None if the loan was not open
+
+    @property
+    def book_count(self):
+        return len(self._isbns)
+
+    @property
+    def member_count(self):
+        return len(self._member_list)
+
+    @property
+    def copied(self):
+        """Number of records saved for this snapshot so far."""
+        return len(self.saved_books) + len(self.saved_members) + len(self.saved_loans)
+
+    def close(self):
+        """Stops operations from saving copies for this snapshot and frees them."""
+        self._release(self)
+        self.saved_books = {}
+        self.saved_members = {}
+        self.saved_loans = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def _check(self):
+        if not self.valid:
+            raise RuntimeError("The snapshot was invalidated by reset_library.")
+
+    def iter_books(self):
+        """Yields (isbn, Book) for every book in the snapshot, in catalog order."""
+        self._check()
+        saved = self.saved_books
+        for isbn in self._isbns:
+            # Read the live record first: operations.py saves a record before changing it, so if a
+            # change shows in the fields read, the saved copy is already there and takes precedence
+            book = self._live_books.get(isbn)
+            if book is not None:
+                book = Book(book.title, book.author, book.genre, book.total_copies, book.seq)
+            book = saved.get(isbn, book)
+            if book is None:
+                self._check()  # only a reset removes a book without saving it
+            yield isbn, book
+
+    def iter_members(self):
+        """Yields a Member for every member in the snapshot, in list order."""
+        self._check()
+        saved = self.saved_members
+        for member in self._member_list:
+            copy = Member(member.member_id, member.name, member.email, member.borrowed_books)
+            yield saved.get(member.member_id, copy)
+
+    def iter_loans(self):
+        """Yields (isbn, member_id, checked_out, due) for every loan in the snapshot, by member."""
+        saved = self.saved_loans
+        for member in self.iter_members():
+            for isbn in member.borrowed_books:
+                key = (isbn, member.member_id)
+                entry = self._live_loans.get(key)
+                entry = saved.get(key, entry)
+                if entry is not None:
+                    due, _, _, checked_out = entry
+                    yield isbn, member.member_id, checked_out, due
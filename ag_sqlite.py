@@ -0,0 +1,993 @@
+# sqlite.py
+
+import bisect
+import contextlib
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections.abc import ItemsView, Mapping, Sequence, ValuesView
+
+import ag_operations
+from ag_cache import VersionedLRUCache
+from ag_index import WordIndex, words
+from ag_records import Book, BookView, Member
+
+# Database Schema
+# books      One row per book. seq (the rowid) is the catalog order; AUTOINCREMENT never reuses the seq
+#            of a deleted book, so keyset pagination cursors stay valid.
+# book_text  FTS5 table with the trigram tokenizer over the lowercased title and author of every book
+#            (rowid = seq): substring searches of 3+ characters are answered from its index.
+# members    One row per member; position (the rowid) is the order of the members list.
+# loans      One row per open loan, in the order the loans were made (id), with their dates.
+# Indexes: ISBN and member_id (UNIQUE), books by genre (and a partial index of the available ones),
+# loans by book (UNIQUE (isbn, member_id)), by member and by due date.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    isbn TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    genre TEXT NOT NULL,
+    total_copies INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS books_by_genre ON books (genre);
+CREATE INDEX IF NOT EXISTS books_available ON books (genre) WHERE total_copies > 0;
+CREATE VIRTUAL TABLE IF NOT EXISTS book_text USING fts5 (title, author, tokenize = 'trigram');
+CREATE TABLE IF NOT EXISTS members (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    member_id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS loans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    isbn TEXT NOT NULL,
+    member_id TEXT NOT NULL,
+    checked_out REAL NOT NULL,
+    due REAL NOT NULL,
+    UNIQUE (isbn, member_id)
+);
+CREATE INDEX IF NOT EXISTS loans_by_member ON loans (member_id);
+CREATE INDEX IF NOT EXISTS loans_by_due ON loans (due, isbn, member_id);
+"""
+
+# Statements
+# Every statement is a constant with ? parameters: sqlite3 prepares it once per connection and reuses it
+# from the connection's statement cache (STATEMENT_CACHE entries) on every later call.
+STATEMENT_CACHE = 256
+BOOK_COLUMNS = "seq, isbn, title, author, genre, total_copies"
+SELECT_BOOK = f"SELECT {BOOK_COLUMNS} FROM books WHERE isbn = ?"
+SELECT_BOOK_FIELDS = "SELECT title, author, genre, total_copies FROM books WHERE seq = ?"
+SELECT_BOOK_PAGE = f"SELECT {BOOK_COLUMNS} FROM books WHERE seq > ? ORDER BY seq LIMIT ?"
+SELECT_BOOKS_BY_SEQ = f"SELECT {BOOK_COLUMNS} FROM books WHERE seq IN (SELECT value FROM json_each(?)) ORDER BY seq"
+BOOK_EXISTS = "SELECT 1 FROM books WHERE isbn = ?"
+COUNT_BOOKS = "SELECT COUNT(*) FROM books"
+INSERT_BOOK = "INSERT INTO books (isbn, title, author, genre, total_copies) VALUES (?, ?, ?, ?, ?)"
+UPDATE_BOOK = "UPDATE books SET title = ?, author = ?, genre = ?, total_copies = ? WHERE seq = ?"
+SET_COPIES = "UPDATE books SET total_copies = ? WHERE seq = ?"
+TAKE_COPY = "UPDATE books SET total_copies = total_copies - 1 WHERE seq = ?"
+PUT_BACK_COPY = "UPDATE books SET total_copies = total_copies + 1 WHERE seq = ?"
+DELETE_BOOK = "DELETE FROM books WHERE seq = ?"
+INSERT_TEXT = "INSERT INTO book_text (rowid, title, author) VALUES (?, ?, ?)"
+UPDATE_TEXT = "UPDATE book_text SET title = ?, author = ? WHERE rowid = ?"
+DELETE_TEXT = "DELETE FROM book_text WHERE rowid = ?"
+SELECT_TEXT = "SELECT rowid, title, author FROM book_text"
+# Search: the trigram index for queries of 3+ characters, a scan of the lowercased text for shorter ones;
+# instr() confirms every match with an exact substring test, like search_books in operations.py
+MATCH_BOOKS = {field: f"SELECT b.seq, b.isbn, b.title, b.author, b.genre, b.total_copies "
+                      f"FROM book_text JOIN books b ON b.seq = book_text.rowid "
+                      f"WHERE book_text MATCH ? AND instr(book_text.{field}, ?) > 0 ORDER BY b.seq"
+               for field in ("title", "author")}
+SCAN_BOOKS = {field: f"SELECT b.seq, b.isbn, b.title, b.author, b.genre, b.total_copies "
+                     f"FROM book_text JOIN books b ON b.seq = book_text.rowid "
+                     f"WHERE instr(book_text.{field}, ?) > 0 ORDER BY b.seq"
+              for field in ("title", "author")}
+BOOKS_IN_GENRE = "SELECT isbn FROM books WHERE genre = ?"
+AVAILABLE_IN_GENRE = "SELECT isbn FROM books WHERE genre = ? AND total_copies > 0"
+AVAILABLE_BOOKS = "SELECT isbn FROM books WHERE total_copies > 0"
+COUNT_BY_GENRE = "SELECT genre, COUNT(*) FROM books GROUP BY genre"
+COUNT_AVAILABLE_BY_GENRE = "SELECT genre, COUNT(*) FROM books WHERE total_copies > 0 GROUP BY genre"
+MEMBER_COLUMNS = "position, member_id, name, email"
+SELECT_MEMBER = f"SELECT {MEMBER_COLUMNS} FROM members WHERE member_id = ?"
+SELECT_MEMBER_AT = f"SELECT {MEMBER_COLUMNS} FROM members ORDER BY position LIMIT 1 OFFSET ?"
+SELECT_MEMBER_PAGE = f"SELECT {MEMBER_COLUMNS} FROM members WHERE position > ? ORDER BY position LIMIT ?"
+MEMBER_EXISTS = "SELECT 1 FROM members WHERE member_id = ?"
+COUNT_MEMBERS = "SELECT COUNT(*) FROM members"
+INSERT_MEMBER = "INSERT INTO members (member_id, name, email) VALUES (?, ?, ?)"
+UPDATE_MEMBER = "UPDATE members SET name = coalesce(?, name), email = coalesce(?, email) WHERE member_id = ?"
+DELETE_MEMBER = "DELETE FROM members WHERE member_id = ?"
+MEMBER_LOANS = "SELECT isbn FROM loans WHERE member_id = ? ORDER BY id"
+PAGE_LOANS = "SELECT member_id, isbn FROM loans WHERE member_id IN (SELECT value FROM json_each(?)) ORDER BY id"
+COUNT_MEMBER_LOANS = "SELECT COUNT(*) FROM loans WHERE member_id = ?"
+BOOK_BORROWERS = "SELECT member_id FROM loans WHERE isbn = ? ORDER BY member_id"
+COUNT_BOOK_LOANS = "SELECT COUNT(*) FROM loans WHERE isbn = ?"
+ALL_BORROWERS = "SELECT isbn, member_id FROM loans"
+BOOK_ON_LOAN = "SELECT 1 FROM loans WHERE isbn = ? LIMIT 1"
+LOAN_ID = "SELECT id FROM loans WHERE isbn = ? AND member_id = ?"
+INSERT_LOAN = "INSERT INTO loans (isbn, member_id, checked_out, due) VALUES (?, ?, ?, ?)"
+DELETE_LOAN_ID = "DELETE FROM loans WHERE id = ?"
+DELETE_LOAN = "DELETE FROM loans WHERE isbn = ? AND member_id = ?"
+OVERDUE_LOANS = "SELECT due, isbn, member_id, checked_out FROM loans WHERE due < ? ORDER BY due, isbn, member_id"
+NEXT_DUE_LOANS = "SELECT due, isbn, member_id, checked_out FROM loans ORDER BY due, isbn, member_id LIMIT ?"
+SNAPSHOT_LOANS = ("SELECT l.isbn, l.member_id, l.checked_out, l.due FROM members m "
+                  "JOIN loans l ON l.member_id = m.member_id ORDER BY m.position, l.id")
+CLEAR_TABLES = ("DELETE FROM loans", "DELETE FROM members", "DELETE FROM books", "DELETE FROM book_text")
+
+# Rows read per query when iterating over the books or members views
+PAGE_SIZE = 1000
+
+SEARCH_FIELDS = ("title", "author")
+
+
+class SQLiteStorage:
+    """
+    Storage backend keeping the library in an SQLite database file instead of in memory. Install it
+    with ag_operations.set_storage(SQLiteStorage(path)): every function in operations.py then runs
+    against the database, with the same arguments, results, error codes, listeners and statistics.
+
+    - The database is in WAL mode (synchronous=NORMAL): readers never block the writer and see the
+      last committed state, and a commit appends to the write-ahead log without waiting for fsync
+      (a power loss may undo the last commits, but never corrupts the file).
+    - Connections come from a pool of up to `pool_size`, so threads read in parallel. Each mutation
+      runs in one transaction started with BEGIN IMMEDIATE (validation included), so concurrent
+      writers queue for the write lock instead of interleaving; operations are atomic even without
+      enable_thread_safety(). In thread-safe mode they also take the record locks of operations.py,
+      so open_snapshot and Persistence can pause them.
+    - process_loans, bulk imports (ag_import) and _load_state (Persistence.recover) write all their
+      rows in a single transaction.
+    - search_books/search_page/iter_search use an FTS5 trigram index and the search cache (holding
+      book numbers, not rows); fuzzy_search builds its word index (ag_index.WordIndex) in memory on
+      first use and keeps it in sync with later writes.
+
+    One process should write the database: the search cache and the word index are kept per process.
+    books and members are read-only views (StoredBooks, StoredMembers); changing a record read from
+    them does not change the database.
+    """
+
+    def __init__(self, path, pool_size=4, timeout=30.0):
+        """
+        Opens (or creates) the database.
+
+        :param path: Database file (string).
+        :param pool_size: Maximum number of open connections (integer, at least 1).
+        :param timeout: Seconds a connection waits for another process's write lock (float).
+        """
+        self.path = path
+        self.pool_size = pool_size
+        self._timeout = timeout
+        self._pool = queue.LifoQueue()  # idle connections, most recently used first
+        self._opened = 0
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()  # the connection the current thread is using, if any
+        # Guards the search cache, the catalog version, the word indexes and the open snapshots. Taken
+        # after a connection (never the other way round), and held by commits that change titles/authors.
+        self._lock = threading.Lock()
+        self._search_cache = VersionedLRUCache(1024)
+        self._version = 0  # bumped when a commit changes a title or author, like operations._catalog_version
+        self._word_indexes = None  # field -> WordIndex keyed by seq, built by the first fuzzy_search
+        self._snapshots = set()
+        self.books = StoredBooks(self)
+        self.members = StoredMembers(self)
+        with self._connection() as db:
+            db.executescript(SCHEMA)
+
+    def close(self):
+        """Closes the idle connections of the pool. Call it once the storage is no longer installed."""
+        while True:
+            try:
+                db = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            db.close()
+            with self._pool_lock:
+                self._opened -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    # Connections and Transactions
+
+    def _open(self):
+        """Opens a new connection in autocommit mode (transactions are started explicitly)."""
+        db = sqlite3.connect(self.path, timeout=self._timeout, isolation_level=None, check_same_thread=False,
+                             cached_statements=STATEMENT_CACHE)
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        return db
+
+    def _acquire(self):
+        """Takes an idle connection from the pool, opens one if fewer than pool_size are open, or waits for one."""
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            opening = self._opened < self.pool_size
+            if opening:
+                self._opened += 1
+        if not opening:
+            return self._pool.get()
+        try:
+            return self._open()
+        except BaseException:
+            with self._pool_lock:
+                self._opened -= 1
+            raise
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """Yields the connection of the calling thread: the one it is already using, or one from the pool."""
+        local = self._local
+        db = getattr(local, "db", None)
+        if db is not None:
+            yield db
+            return
+        db = local.db = self._acquire()
+        try:
+            yield db
+        finally:
+            local.db = None
+            self._pool.put(db)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Yields (connection, text_changes) inside a write transaction, committed on exit and rolled back
+        if an exception is raised. Writers append (seq, old, new) to text_changes when they add, change or
+        delete a book's title/author, where old and new are its (title, author) lowercased, or None; or
+        (None, None, None) when every book was removed. The changes reach the word indexes and the catalog
+        version as the transaction commits, so searches never mix a new catalog with an old version.
+        """
+        with self._connection() as db:
+            db.execute("BEGIN IMMEDIATE")
+            text_changes = []
+            try:
+                yield db, text_changes
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            if text_changes:
+                with self._lock:
+                    db.execute("COMMIT")
+                    self._apply_text_changes(text_changes)
+            else:
+                db.execute("COMMIT")
+
+    def _apply_text_changes(self, text_changes):
+        """Brings the catalog version and the word indexes up to date (callers hold the lock)."""
+        self._version += 1
+        for seq, old, new in text_changes:
+            if seq is None:
+                self._search_cache.clear()
+                self._word_indexes = None  # rebuilt by the next fuzzy_search
+                return
+            if self._word_indexes is None:
+                return
+            for position, field in enumerate(SEARCH_FIELDS):
+                index = self._word_indexes[field]
+                if old is not None:
+                    index.remove(seq, old[position])
+                if new is not None:
+                    index.add(seq, new[position])
+
+    #function to write a validated book and its search text
+    def _insert(self, db, isbn, book):
+        """Inserts a Book (setting its seq) and returns its lowercased (title, author)."""
+        book.seq = db.execute(INSERT_BOOK, (isbn, book.title, book.author, book.genre, book.total_copies)).lastrowid
+        text = (book.title.lower(), book.author.lower())
+        db.execute(INSERT_TEXT, (book.seq, *text))
+        return text
+
+    def _clear(self, db, text_changes):
+        """Deletes every book, member and loan inside a transaction."""
+        for statement in CLEAR_TABLES:
+            db.execute(statement)
+        text_changes.append((None, None, None))
+
+    def _invalidate_snapshots(self):
+        """Marks the open snapshots as invalid after the library was reset or replaced."""
+        with self._lock:
+            for snapshot in self._snapshots:
+                snapshot.valid = False
+            self._snapshots = set()
+
+    # Create
+
+    def add_book(self, isbn, title, author, genre, total_copies):
+        with ag_operations._hold(isbn):
+            with self._transaction() as (db, text_changes):
+                if db.execute(BOOK_EXISTS, (isbn,)).fetchone() is not None:
+                    return ag_operations._fail("duplicate_isbn", f"Error: Book with ISBN {isbn} already exists.")
+
+                if not ag_operations._is_valid_genre(genre):
+                    return ag_operations._fail(
+                        "invalid_genre",
+                        f"Error: Invalid genre '{genre}'. Valid genres are {', '.join(ag_operations.GENRES)}.")
+
+                if not isinstance(total_copies, int) or total_copies < 1:
+                    return ag_operations._fail("invalid_copies", "Error: Total copies must be a positive integer.")
+
+                book = Book(title.strip(), author.strip(), ag_operations._canonical_genre(genre), total_copies)
+                text = self._insert(db, isbn, book)
+                text_changes.append((book.seq, None, text))
+            self._added(isbn, book)
+            return True
+
+    def insert_books(self, book_items):
+        """Stores validated (isbn, Book) pairs in one transaction (see ag_operations._insert_books)."""
+        book_items = list(book_items)
+        with self._transaction() as (db, text_changes):
+            for isbn, book in book_items:
+                text = self._insert(db, isbn, book)
+                text_changes.append((book.seq, None, text))
+        for isbn, book in book_items:
+            self._added(isbn, book)
+
+    def _added(self, isbn, book):
+        """Reports a committed new book to the statistics and the listeners."""
+        if ag_operations._statistics is not None:
+            ag_operations._statistics.book_added(isbn, book.genre, book.total_copies)
+        if ag_operations._listeners:
+            ag_operations._notify("add_book", isbn, book.title, book.author, book.genre, book.total_copies)
+
+    def add_member(self, member_id, name, email):
+        member_id = member_id.strip()
+        with ag_operations._hold(member_id=member_id):
+            with self._transaction() as (db, _):
+                if db.execute(MEMBER_EXISTS, (member_id,)).fetchone() is not None:
+                    return ag_operations._fail("duplicate_member", f"Error: Member with ID {member_id} already exists.")
+
+                member = Member(member_id, name.strip(), email.strip())
+                db.execute(INSERT_MEMBER, (member.member_id, member.name, member.email))
+            if ag_operations._listeners:
+                ag_operations._notify("add_member", member.member_id, member.name, member.email)
+            return True
+
+    def insert_members(self, member_items):
+        """Stores validated Member records in one transaction (see ag_operations._insert_members)."""
+        member_items = list(member_items)
+        with self._transaction() as (db, _):
+            db.executemany(INSERT_MEMBER, [(member.member_id, member.name, member.email) for member in member_items])
+        if ag_operations._listeners:
+            for member in member_items:
+                ag_operations._notify("add_member", member.member_id, member.name, member.email)
+
+    # Read
+
+    def search_books(self, query, by):
+        query = query.strip().lower()
+        search_key = ag_operations._search_field(by)
+        with self._connection() as db:
+            matches, rows = self._matching(db, query, search_key)
+            if rows is None:
+                rows = db.execute(SELECT_BOOKS_BY_SEQ, (_seq_list(matches),)).fetchall()
+        return [_book_dict(row) for row in rows]
+
+    def _matching(self, db, query, search_key):
+        """
+        Returns ((seq, isbn) of every book whose search_key field contains query (normalized), in catalog
+        order; their rows, or None if the matches came from the search cache). The list of matches may be
+        shared with the search cache and must not be modified.
+        """
+        with self._lock:
+            capacity = self._search_cache.capacity
+            if capacity:
+                key = (search_key, query)
+                version = self._version
+                matches = self._search_cache.get(key, version)
+                if matches is not None:
+                    return matches, None
+        if len(query) >= 3:
+            phrase = '{%s} : "%s"' % (search_key, query.replace('"', '""'))
+            rows = db.execute(MATCH_BOOKS[search_key], (phrase, query)).fetchall()
+        else:
+            rows = db.execute(SCAN_BOOKS[search_key], (query,)).fetchall()
+        matches = [(row[0], row[1]) for row in rows]
+        if capacity:
+            # Tagged with the version read before matching: if the catalog changed meanwhile, it is never served
+            with self._lock:
+                self._search_cache.put(key, version, matches)
+        return matches, rows
+
+    def fuzzy_search(self, query, by, limit):
+        search_key = ag_operations._search_field(by)
+        query_words = [word for word in words(query.lower()) if len(word) >= 3]
+        if not query_words or limit <= 0:
+            return []
+        with self._connection() as db:
+            with self._lock:
+                if self._word_indexes is None:
+                    self._word_indexes = {field: WordIndex() for field in SEARCH_FIELDS}
+                    for seq, title, author in db.execute(SELECT_TEXT):
+                        self._word_indexes["title"].add(seq, title)
+                        self._word_indexes["author"].add(seq, author)
+                ranked = ag_operations._rank_fuzzy(self._word_indexes[search_key], query_words, limit, None)
+            rows = {row[0]: row for row in db.execute(SELECT_BOOKS_BY_SEQ, (_seq_list(ranked),))}
+        results = []
+        for seq, score in ranked:
+            row = rows.get(seq)
+            if row is not None:  # deleted since it was ranked
+                results.append({**_book_dict(row), "score": score})
+        return results
+
+    def configure_search_cache(self, capacity):
+        with self._lock:
+            self._search_cache.resize(capacity)
+
+    def search_cache_stats(self):
+        with self._lock:
+            return self._search_cache.stats()
+
+    def iter_search(self, query, by):
+        query = query.strip().lower()
+        search_key = ag_operations._search_field(by)
+        with self._connection() as db:
+            matches, _ = self._matching(db, query, search_key)
+        return self._views(matches)
+
+    def _views(self, matches):
+        """Yields live BookViews of the (seq, isbn) matches still in the catalog, reading PAGE_SIZE rows at a time."""
+        for start in range(0, len(matches), PAGE_SIZE):
+            with self._connection() as db:
+                rows = db.execute(SELECT_BOOKS_BY_SEQ, (_seq_list(matches[start:start + PAGE_SIZE]),)).fetchall()
+            for row in rows:
+                yield BookView(row[1], _LiveBook(self, row))
+
+    def search_page(self, query, by, limit, offset, after):
+        query = query.strip().lower()
+        search_key = ag_operations._search_field(by)
+        end = offset + limit
+        with self._connection() as db:
+            matches, _ = self._matching(db, query, search_key)
+        start = 0 if after is None else bisect.bisect_right(matches, after, key=_first)
+        page = list(self._views(matches[start + offset:start + end]))
+        total = len(matches) - start
+        cursor = page[-1].seq if page and total > end else None
+        return {"total": total, "books": page, "cursor": cursor}
+
+    def books_by_genre(self, genre, available_only):
+        canonical = ag_operations._canonical_genre(genre)
+        if canonical is None:
+            return ag_operations._fail(
+                "invalid_genre", f"Error: Invalid genre '{genre}'. Valid genres are {', '.join(ag_operations.GENRES)}.")
+        with self._connection() as db:
+            return [isbn for isbn, in db.execute(AVAILABLE_IN_GENRE if available_only else BOOKS_IN_GENRE,
+                                                 (canonical,))]
+
+    def available_books(self):
+        with self._connection() as db:
+            return [isbn for isbn, in db.execute(AVAILABLE_BOOKS)]
+
+    def genre_counts(self):
+        counts = {genre: {"books": 0, "available": 0} for genre in ag_operations.GENRES}
+        with self._connection() as db:
+            db.execute("BEGIN")  # both counts from the same state
+            try:
+                for genre, count in db.execute(COUNT_BY_GENRE):
+                    counts[genre]["books"] = count
+                for genre, count in db.execute(COUNT_AVAILABLE_BY_GENRE):
+                    counts[genre]["available"] = count
+            finally:
+                db.execute("COMMIT")
+        return counts
+
+    def get_borrowers(self, isbn):
+        with self._connection() as db:
+            return [member_id for member_id, in db.execute(BOOK_BORROWERS, (isbn,))]
+
+    def find_member(self, member_id):
+        """Returns the Member record of a member_id (a copy, with its loans), or None."""
+        with self._connection() as db:
+            row = db.execute(SELECT_MEMBER, (member_id,)).fetchone()
+            if row is None:
+                return None
+            return Member(row[1], row[2], row[3], [isbn for isbn, in db.execute(MEMBER_LOANS, (member_id,))])
+
+    def loan_count(self, isbn):
+        """Returns the number of open loans of a book."""
+        with self._connection() as db:
+            return db.execute(COUNT_BOOK_LOANS, (isbn,)).fetchone()[0]
+
+    def borrowers(self):
+        """Returns {isbn: set of member_ids} for every book with open loans."""
+        borrowers = {}
+        with self._connection() as db:
+            for isbn, member_id in db.execute(ALL_BORROWERS):
+                borrowers.setdefault(isbn, set()).add(member_id)
+        return borrowers
+
+    # Update
+
+    def update_book(self, isbn, title, author, genre, total_copies):
+        with ag_operations._hold(isbn):
+            with self._transaction() as (db, text_changes):
+                row = db.execute(SELECT_BOOK, (isbn,)).fetchone()
+                if row is None:
+                    return ag_operations._fail("book_not_found", f"Error: Book with ISBN {isbn} not found.")
+
+                # Validate everything first so a failed update leaves the book unchanged
+                if genre is not None and not ag_operations._is_valid_genre(genre):
+                    return ag_operations._fail("invalid_genre", f"Error: Invalid genre '{genre}'. Update failed.")
+                if total_copies is not None and (not isinstance(total_copies, int) or total_copies < 0):
+                    return ag_operations._fail(
+                        "invalid_copies", "Error: Total copies must be a non-negative integer. Update failed.")
+
+                seq, _, old_title, old_author, old_genre, old_copies = row
+                new_title = old_title if title is None else title.strip()
+                new_author = old_author if author is None else author.strip()
+                new_genre = old_genre if genre is None else ag_operations._canonical_genre(genre)
+                new_copies = old_copies if total_copies is None else total_copies
+                db.execute(UPDATE_BOOK, (new_title, new_author, new_genre, new_copies, seq))
+                if title is not None or author is not None:
+                    text = (new_title.lower(), new_author.lower())
+                    db.execute(UPDATE_TEXT, (*text, seq))
+                    text_changes.append((seq, (old_title.lower(), old_author.lower()), text))
+                shelved = genre is not None or total_copies is not None
+                if shelved and ag_operations._statistics is not None:
+                    on_loan = db.execute(COUNT_BOOK_LOANS, (isbn,)).fetchone()[0]
+            if shelved and ag_operations._statistics is not None:
+                ag_operations._statistics.book_changed(_genre(old_genre), old_copies, _genre(new_genre), new_copies,
+                                                       on_loan)
+            if ag_operations._listeners:
+                ag_operations._notify("update_book", isbn, title, author, genre, total_copies)
+            return True
+
+    def update_member(self, member_id, name, email):
+        with ag_operations._hold(member_id=member_id):
+            with self._transaction() as (db, _):
+                changed = db.execute(UPDATE_MEMBER, (None if name is None else name.strip(),
+                                                     None if email is None else email.strip(), member_id))
+                if changed.rowcount == 0:
+                    return ag_operations._fail("member_not_found", f"Error: Member with ID {member_id} not found.")
+            if ag_operations._listeners:
+                ag_operations._notify("update_member", member_id, name, email)
+            return True
+
+    # Delete
+
+    def delete_book(self, isbn):
+        with ag_operations._hold(isbn):
+            with self._transaction() as (db, text_changes):
+                row = db.execute(SELECT_BOOK, (isbn,)).fetchone()
+                if row is None:
+                    return ag_operations._fail("book_not_found", f"Error: Book with ISBN {isbn} not found.")
+
+                if db.execute(BOOK_ON_LOAN, (isbn,)).fetchone() is not None:
+                    return ag_operations._fail(
+                        "book_on_loan",
+                        f"Error: Cannot delete book {isbn}. It is currently borrowed by at least one member.")
+
+                seq, _, title, author, genre, copies = row
+                db.execute(DELETE_BOOK, (seq,))
+                db.execute(DELETE_TEXT, (seq,))
+                text_changes.append((seq, (title.lower(), author.lower()), None))
+            if ag_operations._statistics is not None:
+                ag_operations._statistics.book_removed(isbn, _genre(genre), copies)
+            if ag_operations._listeners:
+                ag_operations._notify("delete_book", isbn)
+            return True
+
+    def delete_member(self, member_id):
+        with ag_operations._hold(member_id=member_id):
+            with self._transaction() as (db, _):
+                if db.execute(MEMBER_EXISTS, (member_id,)).fetchone() is None:
+                    return ag_operations._fail("member_not_found", f"Error: Member with ID {member_id} not found.")
+
+                loans = db.execute(COUNT_MEMBER_LOANS, (member_id,)).fetchone()[0]
+                if loans:
+                    return ag_operations._fail(
+                        "member_has_loans",
+                        f"Error: Cannot delete member {member_id}. They currently have {loans} book(s) borrowed.")
+
+                db.execute(DELETE_MEMBER, (member_id,))
+            if ag_operations._listeners:
+                ag_operations._notify("delete_member", member_id)
+            return True
+
+    # Borrow/Return
+
+    def borrow_book(self, isbn, member_id, checked_out):
+        with ag_operations._hold(isbn, member_id):
+            with self._transaction() as (db, _):
+                row = db.execute(SELECT_BOOK, (isbn,)).fetchone()
+                if row is None:
+                    return ag_operations._fail("book_not_found", f"Error: Book with ISBN {isbn} not found.")
+
+                if db.execute(MEMBER_EXISTS, (member_id,)).fetchone() is None:
+                    return ag_operations._fail("member_not_found", f"Error: Member with ID {member_id} not found.")
+
+                loans = [loan for loan, in db.execute(MEMBER_LOANS, (member_id,))]
+                error = ag_operations._borrow_error(isbn, member_id, row[2], row[5], loans)
+                if error is not None:
+                    return error
+
+                if checked_out is None:
+                    checked_out = time.time()
+                db.execute(TAKE_COPY, (row[0],))
+                db.execute(INSERT_LOAN, (isbn, member_id, checked_out, checked_out + ag_operations.LOAN_PERIOD))
+            if ag_operations._statistics is not None:
+                ag_operations._statistics.loan_opened(isbn, _genre(row[4]), member_id, len(loans) + 1)
+            if ag_operations._listeners:
+                ag_operations._notify("borrow_book", isbn, member_id, checked_out)
+            return True
+
+    def return_book(self, isbn, member_id):
+        with ag_operations._hold(isbn, member_id):
+            with self._transaction() as (db, _):
+                row = db.execute(SELECT_BOOK, (isbn,)).fetchone()
+                if row is None:
+                    return ag_operations._fail("book_not_found", f"Error: Book with ISBN {isbn} not found.")
+
+                if db.execute(MEMBER_EXISTS, (member_id,)).fetchone() is None:
+                    return ag_operations._fail("member_not_found", f"Error: Member with ID {member_id} not found.")
+
+                loan = db.execute(LOAN_ID, (isbn, member_id)).fetchone()
+                if loan is None:
+                    return ag_operations._fail("not_borrowed",
+                                               f"Error: Book {isbn} was not borrowed by member {member_id}.")
+
+                db.execute(DELETE_LOAN_ID, loan)
+                db.execute(PUT_BACK_COPY, (row[0],))
+                if ag_operations._statistics is not None:
+                    loans = db.execute(COUNT_MEMBER_LOANS, (member_id,)).fetchone()[0]
+            if ag_operations._statistics is not None:
+                ag_operations._statistics.loan_closed(isbn, _genre(row[4]), member_id, loans)
+            if ag_operations._listeners:
+                ag_operations._notify("return_book", isbn, member_id)
+            return True
+
+    def process_loans(self, transactions):
+        """process_loans (see operations.py): the batch is validated and written in one transaction."""
+        transactions = list(transactions)
+        with ag_operations._hold_many([item[1] for item in transactions], [item[2] for item in transactions]):
+            with self._transaction() as (db, _):
+                rows = {}    # isbn -> book row
+                copies = {}  # isbn -> copies left after the items validated so far
+                loans = {}   # member_id -> loans held after the items validated so far
+                results = []
+                applied = True
+                for operation, isbn, member_id in transactions:
+                    row = rows.get(isbn)
+                    if row is None:
+                        row = db.execute(SELECT_BOOK, (isbn,)).fetchone()
+                        if row is None:
+                            results.append(ag_operations._fail("book_not_found",
+                                                               f"Error: Book with ISBN {isbn} not found."))
+                            applied = False
+                            continue
+                        rows[isbn] = row
+
+                    member_loans = loans.get(member_id)
+                    if member_loans is None:
+                        if db.execute(MEMBER_EXISTS, (member_id,)).fetchone() is None:
+                            results.append(ag_operations._fail("member_not_found",
+                                                               f"Error: Member with ID {member_id} not found."))
+                            applied = False
+                            continue
+                        member_loans = loans[member_id] = [loan for loan, in db.execute(MEMBER_LOANS, (member_id,))]
+
+                    available = copies.get(isbn, row[5])
+                    if operation == "borrow_book":
+                        if available > 0 and len(member_loans) < ag_operations.LOAN_LIMIT and isbn not in member_loans:
+                            copies[isbn] = available - 1
+                            member_loans.append(isbn)
+                            results.append(True)
+                            continue
+                        error = ag_operations._borrow_error(isbn, member_id, row[2], available, member_loans)
+                    elif operation == "return_book":
+                        if isbn in member_loans:
+                            copies[isbn] = available + 1
+                            member_loans.remove(isbn)
+                            results.append(True)
+                            continue
+                        error = ag_operations._fail("not_borrowed",
+                                                    f"Error: Book {isbn} was not borrowed by member {member_id}.")
+                    else:
+                        error = ag_operations._fail("invalid_operation",
+                                                    f"Error: Unknown batch operation '{operation}'.")
+                    results.append(error)
+                    applied = False
+
+                if applied:
+                    checked_out = time.time()
+                    db.executemany(SET_COPIES, [(count, rows[isbn][0]) for isbn, count in copies.items()])
+                    for operation, isbn, member_id in transactions:
+                        if operation == "borrow_book":
+                            db.execute(INSERT_LOAN, (isbn, member_id, checked_out,
+                                                     checked_out + ag_operations.LOAN_PERIOD))
+                        else:
+                            db.execute(DELETE_LOAN, (isbn, member_id))
+
+            if applied:
+                if ag_operations._statistics is not None:
+                    statistics = ag_operations._statistics
+                    for operation, isbn, member_id in transactions:
+                        update = statistics.loan_opened if operation == "borrow_book" else statistics.loan_closed
+                        update(isbn, _genre(rows[isbn][4]), member_id, len(loans[member_id]))
+                if ag_operations._listeners:
+                    for operation, isbn, member_id in transactions:
+                        if operation == "borrow_book":
+                            ag_operations._notify(operation, isbn, member_id, checked_out)
+                        else:
+                            ag_operations._notify(operation, isbn, member_id)
+            return {"applied": applied, "results": results}
+
+    # Due Dates
+
+    def overdue_loans(self, as_of):
+        if as_of is None:
+            as_of = time.time()
+        with self._connection() as db:
+            return [ag_operations._loan_dict(row) for row in db.execute(OVERDUE_LOANS, (as_of,))]
+
+    def loans_due_next(self, count):
+        with self._connection() as db:
+            return [ag_operations._loan_dict(row) for row in db.execute(NEXT_DUE_LOANS, (max(count, 0),))]
+
+    # Whole Library
+
+    def reset(self):
+        """Deletes every book, member and loan (see ag_operations.reset_library)."""
+        with self._transaction() as (db, text_changes):
+            self._clear(db, text_changes)
+        self._invalidate_snapshots()
+
+    def load_state(self, book_items, member_items, loan_dates=()):
+        """Replaces the library in one transaction (see ag_operations._load_state)."""
+        member_items = list(member_items)
+        now = time.time()
+        dates = {(isbn, member_id): checked_out for isbn, member_id, checked_out, _ in loan_dates}
+        loans = []
+        for member in member_items:
+            for isbn in member.borrowed_books:
+                checked_out = dates.get((isbn, member.member_id), now)
+                loans.append((isbn, member.member_id, checked_out, checked_out + ag_operations.LOAN_PERIOD))
+        with self._transaction() as (db, text_changes):
+            self._clear(db, text_changes)
+            for isbn, book in book_items:
+                self._insert(db, isbn, book)
+            db.executemany(INSERT_MEMBER, [(member.member_id, member.name, member.email) for member in member_items])
+            db.executemany(INSERT_LOAN, loans)
+        self._invalidate_snapshots()
+
+    def open_snapshot(self):
+        """Returns a StoredSnapshot of the library (see ag_operations.open_snapshot)."""
+        snapshot = StoredSnapshot(self)
+        with self._lock:
+            self._snapshots.add(snapshot)
+        return snapshot
+
+
+class StoredBooks(Mapping):
+    """
+    Read-only mapping ISBN -> Book of the books in an SQLiteStorage, in catalog order (ag_operations.books
+    while the storage is installed). Every access queries the database and returns copies of the rows.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def __getitem__(self, isbn):
+        with self._storage._connection() as db:
+            row = db.execute(SELECT_BOOK, (isbn,)).fetchone()
+        if row is None:
+            raise KeyError(isbn)
+        return _book(row)
+
+    def __contains__(self, isbn):
+        with self._storage._connection() as db:
+            return db.execute(BOOK_EXISTS, (isbn,)).fetchone() is not None
+
+    def __len__(self):
+        with self._storage._connection() as db:
+            return db.execute(COUNT_BOOKS).fetchone()[0]
+
+    def __iter__(self):
+        for row in self._rows():
+            yield row[1]
+
+    def items(self):
+        return _BookItems(self)
+
+    def values(self):
+        return _BookValues(self)
+
+    def _rows(self):
+        """Yields every book row in catalog order, PAGE_SIZE rows per query."""
+        last = -1
+        while True:
+            with self._storage._connection() as db:
+                rows = db.execute(SELECT_BOOK_PAGE, (last, PAGE_SIZE)).fetchall()
+            yield from rows
+            if len(rows) < PAGE_SIZE:
+                return
+            last = rows[-1][0]
+
+
+class _BookItems(ItemsView):
+    """items() of StoredBooks, reading the rows a page at a time instead of one query per key."""
+
+    def __iter__(self):
+        for row in self._mapping._rows():
+            yield row[1], _book(row)
+
+
+class _BookValues(ValuesView):
+    """values() of StoredBooks, reading the rows a page at a time."""
+
+    def __iter__(self):
+        for row in self._mapping._rows():
+            yield _book(row)
+
+
+class StoredMembers(Sequence):
+    """
+    Read-only sequence of the Member records in an SQLiteStorage, in list order (ag_operations.members
+    while the storage is installed). Indexing reads one member (counting from the start of the table);
+    iterating reads PAGE_SIZE members per query. Compares equal to a list of the same members.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def __len__(self):
+        with self._storage._connection() as db:
+            return db.execute(COUNT_MEMBERS).fetchone()[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        with self._storage._connection() as db:
+            row = db.execute(SELECT_MEMBER_AT, (index,)).fetchone() if index >= 0 else None
+            if row is None:
+                raise IndexError("members index out of range")
+            return Member(row[1], row[2], row[3], [isbn for isbn, in db.execute(MEMBER_LOANS, (row[1],))])
+
+    def __iter__(self):
+        last = -1
+        while True:
+            with self._storage._connection() as db:
+                rows = db.execute(SELECT_MEMBER_PAGE, (last, PAGE_SIZE)).fetchall()
+                loans = {}
+                for member_id, isbn in db.execute(PAGE_LOANS, (json.dumps([row[1] for row in rows]),)):
+                    loans.setdefault(member_id, []).append(isbn)
+            for _, member_id, name, email in rows:
+                yield Member(member_id, name, email, loans.get(member_id, ()))
+            if len(rows) < PAGE_SIZE:
+                return
+            last = rows[-1][0]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, Sequence)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+
+class StoredSnapshot:
+    """
+    A point-in-time, read-only view of an SQLiteStorage with the interface of ag_snapshot.Snapshot,
+    returned by ag_operations.open_snapshot() while the storage is installed.
+
+    It is a read transaction on a connection of its own: in WAL mode a reader keeps seeing the
+    database as of its first read while writers go on committing, so nothing is copied (copied is
+    always 0). Close it to return the connection to the pool; until then the write-ahead log cannot
+    be checkpointed past the snapshot, and grows with the changes made meanwhile.
+    """
+
+    copied = 0
+
+    def __init__(self, storage):
+        self._storage = storage
+        self._db = storage._acquire()
+        self._db.execute("BEGIN")
+        # The first read fixes the state the snapshot sees
+        self.book_count = self._db.execute(COUNT_BOOKS).fetchone()[0]
+        self.member_count = self._db.execute(COUNT_MEMBERS).fetchone()[0]
+        self.valid = True
+
+    def close(self):
+        """Ends the read transaction and returns the connection to the pool."""
+        with self._storage._lock:
+            self._storage._snapshots.discard(self)
+        if self._db is not None:
+            self._db.execute("COMMIT")
+            self._storage._pool.put(self._db)
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def _check(self):
+        if not self.valid:
+            self.close()
+            raise RuntimeError("The snapshot was invalidated by reset_library.")
+        if self._db is None:
+            raise RuntimeError("The snapshot is closed.")
+
+    def iter_books(self):
+        """Yields (isbn, Book) for every book in the snapshot, in catalog order."""
+        self._check()
+        for row in self._db.execute(f"SELECT {BOOK_COLUMNS} FROM books ORDER BY seq"):
+            yield row[1], _book(row)
+
+    def iter_members(self):
+        """Yields a Member for every member in the snapshot, in list order."""
+        self._check()
+        loans = {}
+        for member_id, isbn in self._db.execute("SELECT member_id, isbn FROM loans ORDER BY id"):
+            loans.setdefault(member_id, []).append(isbn)
+        for _, member_id, name, email in self._db.execute(f"SELECT {MEMBER_COLUMNS} FROM members ORDER BY position"):
+            yield Member(member_id, name, email, loans.get(member_id, ()))
+
+    def iter_loans(self):
+        """Yields (isbn, member_id, checked_out, due) for every loan in the snapshot, by member."""
+        self._check()
+        yield from self._db.execute(SNAPSHOT_LOANS)
+
+
+class _LiveBook:
+    """
+    A stored book that reads its row again on every field access, so the BookViews returned by
+    search_page/iter_search stay live like views of the in-memory books. A deleted book keeps
+    showing its last values.
+    """
+
+    __slots__ = ("_storage", "seq", "_fields")
+
+    def __init__(self, storage, row):
+        self._storage = storage
+        self.seq = row[0]
+        self._fields = row[2:]
+
+    def _current(self):
+        with self._storage._connection() as db:
+            fields = db.execute(SELECT_BOOK_FIELDS, (self.seq,)).fetchone()
+        if fields is not None:
+            self._fields = fields
+        return self._fields
+
+    title = property(lambda self: self._current()[0])
+    author = property(lambda self: self._current()[1])
+    genre = property(lambda self: _genre(self._current()[2]))
+    total_copies = property(lambda self: self._current()[3])
+
+
+#function to map a stored genre to its shared GENRES string
+def _genre(name):
+    return ag_operations._CANONICAL_GENRES.get(name, name)
+
+
+#function to build a Book record from a book row
+def _book(row):
+    """Returns a Book for a (seq, isbn, title, author, genre, total_copies) row."""
+    return Book(row[2], row[3], _genre(row[4]), row[5], row[0])
+
+
+#function to build a search result from a book row
+def _book_dict(row):
+    """Returns the search_books dictionary for a (seq, isbn, title, author, genre, total_copies) row."""
+    return {"isbn": row[1], "title": row[2], "author": row[3], "genre": _genre(row[4]), "total_copies": row[5]}
+
+
+#function to pass a list of book numbers as one statement parameter (read with json_each)
+def _seq_list(pairs):
+    """Returns the first items of (seq, ...) pairs as a JSON array."""
+    return json.dumps([pair[0] for pair in pairs])
+
+
+def _first(pair):
+    return pair[0]
@@ -0,0 +1,255 @@
+# stats.py
+
+import json
+import threading
+
+import ag_operations
+from ag_operations import GENRES, LOAN_LIMIT
+
+
+class CirculationStats:
+    """
+    Circulation statistics for dashboards, kept up to date by operations.py instead of being
+    recomputed from books and members. Install it with ag_operations.set_statistics(CirculationStats()).
+
+    Counters (copies on the shelf and on loan per genre, members at the loan limit) are rebuilt
+    from the library once when installed, then adjusted by every add_book, update_book, delete_book,
+    borrow_book, return_book and process_loans. Borrow counts for most_borrowed start at zero when
+    installed. Queries read the counters: summary() and loans_by_genre() take time proportional
+    to the number of genres, most_borrowed(k) to k, and title_utilization to one book.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shelf = {genre: 0 for genre in GENRES}  # copies on the shelf per genre
+        self._loans = {genre: 0 for genre in GENRES}  # open loans per genre
+        self._at_limit = set()  # member_ids holding LOAN_LIMIT books
+        self._borrows = _Ranking()  # borrows per ISBN since installation
+
+    # Updates (called by operations.py, holding the locks of the records involved)
+
+    def rebuild(self, book_items, member_items, borrowers):
+        """
+        Recomputes the counters from a complete library state (borrow counts are kept).
+
+        :param book_items: Iterable of (isbn, Book) pairs.
+        :param member_items: Iterable of Member records.
+        :param borrowers: Mapping isbn -> member_ids currently borrowing it.
+        """
+        with self._lock:
+            self._shelf = {genre: 0 for genre in GENRES}
+            self._loans = {genre: 0 for genre in GENRES}
+            for isbn, book in book_items:
+                self._shelf[book.genre] += book.total_copies
+                self._loans[book.genre] += len(borrowers.get(isbn, ()))
+            self._at_limit = {member.member_id for member in member_items
+                              if len(member.borrowed_books) >= LOAN_LIMIT}
+
+    def clear(self):
+        """Resets every counter and borrow count (the library was emptied)."""
+        with self._lock:
+            self._shelf = {genre: 0 for genre in GENRES}
+            self._loans = {genre: 0 for genre in GENRES}
+            self._at_limit = set()
+            self._borrows = _Ranking()
+
+    def book_added(self, isbn, genre, copies):
+        with self._lock:
+            self._shelf[genre] += copies
+
+    def book_removed(self, isbn, genre, copies):
+        with self._lock:
+            self._shelf[genre] -= copies
+            self._borrows.remove(isbn)
+
+    def book_changed(self, old_genre, old_copies, genre, copies, on_loan):
+        """Moves a book's shelf copies (and its on_loan loans, if the genre changed) to its new genre and count."""
+        with self._lock:
+            self._shelf[old_genre] -= old_copies
+            self._shelf[genre] += copies
+            self._loans[old_genre] -= on_loan
+            self._loans[genre] += on_loan
+
+    def loan_opened(self, isbn, genre, member_id, member_loans):
+        """Counts a borrow; member_loans is the member's number of loans after it."""
+        with self._lock:
+            self._shelf[genre] -= 1
+            self._loans[genre] += 1
+            self._borrows.increment(isbn)
+            if member_loans >= LOAN_LIMIT:
+                self._at_limit.add(member_id)
+
+    def loan_closed(self, isbn, genre, member_id, member_loans):
+        """Counts a return; member_loans is the member's number of loans after it."""
+        with self._lock:
+            self._shelf[genre] += 1
+            self._loans[genre] -= 1
+            if member_loans < LOAN_LIMIT:
+                self._at_limit.discard(member_id)
+
+    # Dashboard queries
+
+    def loans_by_genre(self):
+        """:return: {genre: number of open loans} for every genre in GENRES."""
+        with self._lock:
+            return dict(self._loans)
+
+    def genre_utilization(self):
+        """:return: {genre: share of the genre's copies that are on loan (0.0 to 1.0)} for every genre."""
+        with self._lock:
+            return {genre: _share(self._loans[genre], self._shelf[genre]) for genre in GENRES}
+
+    def title_utilization(self, isbn):
+        """
+        :param isbn: ISBN of the book (string).
+        :return: The share of the book's copies currently on loan (0.0 to 1.0), or None if there is no such book.
+        """
+        with ag_operations._hold(isbn):
+            book = ag_operations.books.get(isbn)
+            if book is None:
+                return None
+            return _share(ag_operations._loan_count(isbn), book.total_copies)
+
+    def most_borrowed(self, count=10):
+        """
+        :param count: Number of books to return (integer).
+        :return: Up to `count` (isbn, borrows) pairs, most borrowed first. Books with the same count come in
+                 the order they reached it.
+        """
+        with self._lock:
+            return self._borrows.top(count)
+
+    def members_at_limit(self):
+        """:return: The IDs of the members holding LOAN_LIMIT books, in no particular order (list)."""
+        with self._lock:
+            return list(self._at_limit)
+
+    def summary(self):
+        """
+        :return: A dictionary with "on_shelf" and "on_loan" copies, "utilization" (share of copies on loan),
+                 "members_at_limit" (a count) and "loans_by_genre".
+        """
+        with self._lock:
+            on_shelf = sum(self._shelf.values())
+            on_loan = sum(self._loans.values())
+            return {"on_shelf": on_shelf, "on_loan": on_loan, "utilization": _share(on_loan, on_shelf),
+                    "members_at_limit": len(self._at_limit), "loans_by_genre": dict(self._loans)}
+
+    # Export
+
+    def export(self, f):
+        """
+        Streams the statistics and the full library state to a text file as JSON Lines, one record at a
+        time: a {"type": "summary"} line, then a {"type": "book"} line per book (with its borrow count)
+        and a {"type": "member"} line per member. Books and members are read from a consistent snapshot
+        (ag_operations.open_snapshot), so operations continue while the export runs.
+
+        :param f: Writable text file.
+        :return: The number of lines written (integer).
+        """
+        encode = json.JSONEncoder(separators=(",", ":")).encode
+        f.write(encode({"type": "summary", **self.summary()}) + "\n")
+        lines = 1
+        with ag_operations.open_snapshot() as snapshot:
+            borrows = self._borrows
+            for isbn, book in snapshot.iter_books():
+                f.write(encode({"type": "book", "isbn": isbn, "title": book.title, "author": book.author,
+                                "genre": book.genre, "on_shelf": book.total_copies,
+                                "borrows": borrows.count(isbn)}) + "\n")
+                lines += 1
+            for member in snapshot.iter_members():
+                f.write(encode({"type": "member", "member_id": member.member_id, "name": member.name,
+                                "borrowed_books": member.borrowed_books,
+                                "at_limit": len(member.borrowed_books) >= LOAN_LIMIT}) + "\n")
+                lines += 1
+        return lines
+
+
+#function to compute the share of copies on loan
+def _share(on_loan, on_shelf):
+    total = on_loan + on_shelf
+    return on_loan / total if total else 0.0
+
+
+class _Bucket:
+    """The keys that share one count in a _Ranking, linked to the buckets of the next lower/higher counts."""
+
+    __slots__ = ("count", "keys", "lower", "higher")
+
+    def __init__(self, count, lower, higher):
+        self.count = count
+        self.keys = {}  # used as an insertion-ordered set
+        self.lower = lower
+        self.higher = higher
+
+
+class _Ranking:
+    """
+    Counts per key, ordered by count (the bucket list of an O(1) LFU cache): incrementing a count moves
+    its key to the next bucket, and the top k keys are read from the highest buckets in O(k).
+    Only keys with a count of at least 1 are stored.
+    """
+
+    def __init__(self):
+        self._buckets = {}  # key -> its _Bucket
+        self._lowest = None
+        self._highest = None
+
+    def count(self, key):
+        bucket = self._buckets.get(key)
+        return 0 if bucket is None else bucket.count
+
+    def increment(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            lower, higher, count = None, self._lowest, 1
+        else:
+            lower, higher, count = bucket, bucket.higher, bucket.count + 1
+        if higher is not None and higher.count == count:
+            target = higher
+        else:
+            # Link a new bucket between the key's bucket (or the bottom) and the next higher one
+            target = _Bucket(count, lower, higher)
+            if lower is None:
+                self._lowest = target
+            else:
+                lower.higher = target
+            if higher is None:
+                self._highest = target
+            else:
+                higher.lower = target
+        if bucket is not None:
+            self._discard(bucket, key)
+        target.keys[key] = None
+        self._buckets[key] = target
+
+    def remove(self, key):
+        bucket = self._buckets.pop(key, None)
+        if bucket is not None:
+            self._discard(bucket, key)
+
+    def _discard(self, bucket, key):
+        """Removes a key from a bucket, unlinking the bucket once empty."""
+        del bucket.keys[key]
+        if bucket.keys:
+            return
+        if bucket.lower is None:
+            self._lowest = bucket.higher
+        else:
+            bucket.lower.higher = bucket.higher
+        if bucket.higher is None:
+            self._highest = bucket.lower
+        else:
+            bucket.higher.lower = bucket.lower
+
+    def top(self, count):
+        """Returns up to `count` (key, count) pairs, highest counts first."""
+        result = []
+        bucket = self._highest
+        while bucket is not None and len(result) < count:
+            for key in bucket.keys:
+                result.append((key, bucket.count))
+                if len(result) == count:
+                    break
+            bucket = bucket.lower
+        return result
@@ -0,0 +1,382 @@
+# trace.py
+
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from array import array
+from collections.abc import Mapping
+
+import ag_operations
+from ag_data import GENRE_WEIGHTS, misspell, random_author, random_title
+from ag_operations import Failure
+
+# Trace File
+# JSON Lines, gzip-compressed if the file name ends in ".gz". The first line is a header object:
+#   {"format": FORMAT, "started": wall-clock start (seconds since the epoch), "books": n, "members": n}
+# with the size of the library when recording started. Every other line is one public call:
+#   [offset, operation, args, result]
+# offset  Seconds since the start of the recording (microsecond precision).
+# args    The call's positional arguments, defaults filled in.
+# result  The result, in a compact, comparable form (see _summarize):
+#         true/false/null/a number or string as returned; {"error": code} for a failure;
+#         {"crc": crc32 of the canonical JSON} for lists and dictionaries (plus "cursor" for search_page);
+#         null for iter_search, whose generator is read by the caller after the call.
+FORMAT = "ag-trace/1"
+
+# Operations a TraceRecorder records (the instrumented public operations); replay runs no others
+OPERATIONS = {
+    "add_book", "update_book", "delete_book", "add_member", "update_member", "delete_member", "borrow_book",
+    "return_book", "process_loans", "get_borrowers", "search_books", "iter_search", "search_page",
+    "fuzzy_search", "books_by_genre", "available_books", "genre_counts", "overdue_loans", "loans_due_next",
+}
+# Operations whose list results come in no particular order (sorted before comparing)
+UNORDERED = {"books_by_genre", "available_books"}
+# Loan fields left out of comparisons: loans made without a checkout time are dated when they are replayed
+CLOCK_FIELDS = ("checked_out", "due")
+
+
+class TraceRecorder:
+    """
+    Instrumentation hook writing every public operation (with its arguments and result) to a trace file,
+    for replay. Install it with ag_operations.set_instrumentation(TraceRecorder("day.jsonl.gz")), and
+    uninstall it before closing it.
+
+    Results are summarized as they are recorded (see the trace file format above), so views returned
+    by search_page are read once, right after the call. Calls from several threads are written in the
+    order they finish. iter_search is recorded without its result, since its generator belongs to the
+    caller. open_snapshot is not instrumented, so it is not recorded.
+    """
+
+    def __init__(self, path, hook=None):
+        """
+        Creates the trace file and writes its header.
+
+        :param path: Trace file to write (string); compressed with gzip if it ends in ".gz".
+        :param hook: Instrumentation hook (e.g. ag_metrics.Metrics()) that still gets every record() call.
+        """
+        self.hook = hook
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._file = _open(path, "w")
+        self._encode = json.JSONEncoder(separators=(",", ":")).encode
+        self._file.write(self._encode({"format": FORMAT, "started": time.time(),
+                                       "books": len(ag_operations.books), "members": len(ag_operations.members)}))
+        self._file.write("\n")
+        self._start = time.perf_counter()
+
+    def record_call(self, operation, args, result, start, seconds, error):
+        """Writes one call to the trace (called by operations.py after every public operation)."""
+        line = self._encode([round(start - self._start, 6), operation, args,
+                             _summarize(operation, result, error)]) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self.calls += 1
+        if self.hook is not None:
+            self.hook.record(operation, seconds, error)
+
+    def close(self):
+        """Flushes and closes the trace file."""
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def replay(path, speed=None, verify=True, mismatch_limit=10):
+    """
+    Streams a trace back through the public operations of operations.py and reports throughput and
+    per-operation latency. Run it on a library in the state the recording started from (e.g. an empty
+    one after reset_library(), or the same Persistence snapshot). Calls run in quiet mode, one at a time.
+
+    search_page cursors from the trace are translated to the cursors of the replayed results, so keyset
+    paging replays across processes. The generators of replayed iter_search calls are read to the end
+    within the call's timing. Loan dates are not compared: loans made without a checkout time
+    are dated when they are replayed. Blank lines are skipped.
+
+    :param path: Trace file (string).
+    :param speed: None to replay as fast as possible, or the time scale: 1.0 replays at the recorded pace,
+                  2.0 twice as fast (calls wait for their recorded offset divided by speed).
+    :param verify: Compare every result with the recorded one (boolean). Also checks that the library has
+                   as many books and members as when the trace was recorded.
+    :param mismatch_limit: Number of mismatches to describe in the report (integer).
+    :return: A report dictionary: calls, seconds, calls_per_sec, mismatches (a count), first_mismatches
+             (list of {"line", "operation", "args", "expected", "actual"}), max_lag (seconds the replay
+             fell behind its schedule; 0.0 unless speed is given) and operations
+             ({operation: {"calls", "mean_us", "p50_us", "p99_us", "max_us"}}).
+    :raises ValueError: If the file is not a trace, (with verify) the library does not match its header, or a
+                        line names an operation outside OPERATIONS (the calls before it have been replayed).
+    """
+    latencies = {}  # operation -> array of seconds
+    mismatches = 0
+    first_mismatches = []
+    cursors = {}  # recorded search_page cursor -> replayed cursor
+    max_lag = 0.0
+    was_quiet = ag_operations._quiet
+    ag_operations.enable_quiet_mode()
+    try:
+        with _open(path, "r") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("format") != FORMAT:
+                raise ValueError(f"{path} is not a trace file.")
+            if verify and (len(ag_operations.books), len(ag_operations.members)) != (header["books"],
+                                                                                      header["members"]):
+                raise ValueError(f"The trace was recorded with {header['books']} books and {header['members']} "
+                                 f"members; the library has {len(ag_operations.books)} and "
+                                 f"{len(ag_operations.members)}.")
+            started = time.perf_counter()
+            for number, line in enumerate(f, 2):
+                if not line.strip():
+                    continue
+                offset, operation, args, expected = json.loads(line)
+                if operation not in OPERATIONS:
+                    raise ValueError(f"Line {number} of {path} names {operation!r}, which is not a recorded operation.")
+                if operation == "search_page" and args[4] is not None:
+                    args[4] = cursors.get(args[4], args[4])
+                if speed is not None:
+                    wait = offset / speed - (time.perf_counter() - started)
+                    if wait > 0:
+                        time.sleep(wait)
+                    else:
+                        max_lag = max(max_lag, -wait)
+
+                function = getattr(ag_operations, operation)
+                start = time.perf_counter()
+                try:
+                    result = function(*args)
+                    if operation == "iter_search":
+                        result = list(result)  # the search runs as the generator is read
+                except Exception as error:
+                    seconds = time.perf_counter() - start
+                    actual = {"exception": f"{error.__class__.__name__}: {error}"}
+                else:
+                    seconds = time.perf_counter() - start
+                    actual = _summarize(operation, result, None) if verify else None
+                timings = latencies.get(operation)
+                if timings is None:
+                    timings = latencies[operation] = array("d")
+                timings.append(seconds)
+
+                if operation == "search_page" and isinstance(expected, dict) and isinstance(actual, dict):
+                    if expected.get("cursor") is not None and actual.get("cursor") is not None:
+                        cursors[expected["cursor"]] = actual["cursor"]
+                if verify and not _same(expected, actual):
+                    mismatches += 1
+                    if len(first_mismatches) < mismatch_limit:
+                        first_mismatches.append({"line": number, "operation": operation, "args": args,
+                                                 "expected": expected, "actual": actual})
+            elapsed = time.perf_counter() - started
+    finally:
+        if not was_quiet:
+            ag_operations.disable_quiet_mode()
+
+    calls = sum(len(timings) for timings in latencies.values())
+    return {"calls": calls, "seconds": elapsed, "calls_per_sec": calls / elapsed if elapsed else 0.0,
+            "mismatches": mismatches, "first_mismatches": first_mismatches, "max_lag": max_lag,
+            "operations": {operation: _latency_summary(timings) for operation, timings in sorted(latencies.items())}}
+
+
+#function to compare a replayed result with the recorded one
+def _same(expected, actual):
+    """Compares result summaries; search_page cursors only need to agree on whether there is a next page."""
+    if isinstance(expected, dict) and "cursor" in expected and isinstance(actual, dict) and "cursor" in actual:
+        return expected["crc"] == actual["crc"] and (expected["cursor"] is None) == (actual["cursor"] is None)
+    return expected == actual
+
+
+#function to summarize the latencies of one operation
+def _latency_summary(timings):
+    ordered = sorted(timings)
+    count = len(ordered)
+    return {"calls": count, "mean_us": sum(ordered) / count * 1e6, "p50_us": ordered[count // 2] * 1e6,
+            "p99_us": ordered[min(count - 1, int(count * 0.99))] * 1e6, "max_us": ordered[-1] * 1e6}
+
+
+def print_replay(report, limit=5):
+    """Prints a replay report: totals, per-operation latency, and the first `limit` mismatches."""
+    print(f"Replayed {report['calls']:,} calls in {report['seconds']:.2f}s ({report['calls_per_sec']:,.0f} calls/sec), "
+          f"{report['mismatches']} mismatched, max lag {report['max_lag'] * 1e3:.1f} ms.")
+    print(f"{'operation':>16} | {'calls':>9} | {'mean us':>9} | {'p50 us':>9} | {'p99 us':>9} | {'max us':>10}")
+    print("-" * 78)
+    for operation, row in report["operations"].items():
+        print(f"{operation:>16} | {row['calls']:>9,} | {row['mean_us']:>9.1f} | {row['p50_us']:>9.1f} | "
+              f"{row['p99_us']:>9.1f} | {row['max_us']:>10.1f}")
+    for mismatch in report["first_mismatches"][:limit]:
+        print(f"  line {mismatch['line']}: {mismatch['operation']}{tuple(mismatch['args'])} "
+              f"expected {mismatch['expected']}, got {mismatch['actual']}")
+
+
+def generate_trace(path, calls=100_000, books=1_000, members=250, rate=1_000.0, seed=42):
+    """
+    Writes a synthetic trace for stress testing, by running a circulation mix on an empty library and
+    recording it: first `books` add_book and `members` add_member calls, then searches (exact and
+    misspelled), borrows and returns, kiosk batches, catalog updates and the browsing and due date
+    queries. Calls arrive as a Poisson process at `rate` calls per second, and the loans and due date
+    queries carry explicit times, so the trace replays identically. The generated library is left in
+    place; call reset_library() before replaying the trace.
+
+    :param path: Trace file to write (string); compressed with gzip if it ends in ".gz".
+    :param calls: Number of calls after the catalog and members are added (integer).
+    :param books: Number of books to add (integer).
+    :param members: Number of members to add (integer).
+    :param rate: Average calls per second in the recorded offsets (float).
+    :param seed: Seed for the workload (integer).
+    :return: The number of calls written (integer).
+    :raises ValueError: If the library is not empty.
+    """
+    if ag_operations.books or ag_operations.members:
+        raise ValueError(f"The library has {len(ag_operations.books)} books and {len(ag_operations.members)} "
+                         f"members; synthetic traces are generated on an empty library (see reset_library).")
+    rng = random.Random(seed)
+    arrivals = random.Random(seed + 1)  # drawn separately so the rate does not change the calls
+    genres = list(GENRE_WEIGHTS)
+    genre_weights = list(GENRE_WEIGHTS.values())
+    epoch = time.time()
+
+    def workload():
+        """Yields (offset, operation, args) and is sent each call's result."""
+        offset = 0.0
+        titles = []
+        for i in range(books):
+            titles.append(random_title(rng))
+            yield offset, "add_book", (f"T{i:08d}", titles[-1], random_author(rng),
+                                       rng.choices(genres, genre_weights)[0], rng.randint(1, 5))
+            offset += arrivals.expovariate(rate)
+        for i in range(members):
+            yield offset, "add_member", (f"U{i:08d}", f"Trace Reader {i}", f"u{i}@lib.com")
+            offset += arrivals.expovariate(rate)
+        loans = []
+        for _ in range(calls):
+            roll = rng.random()
+            now = epoch + offset
+            if roll < 0.35:
+                yield offset, "search_books", (rng.choice(rng.choice(titles).split()), "title")
+            elif roll < 0.36:
+                yield offset, "fuzzy_search", (misspell(" ".join(rng.choice(titles).split()[:2]), rng), "title", 10)
+            elif roll < 0.38:
+                yield offset, "search_page", (rng.choice(rng.choice(titles).split()), "title", 20, 0, None)
+            elif roll < 0.66 or not loans:
+                # Checked out up to two loan periods ago, so about half the loans are overdue
+                loan = (f"T{rng.randrange(books):08d}", f"U{rng.randrange(members):08d}")
+                result = yield offset, "borrow_book", (*loan, now - rng.uniform(0, 2 * ag_operations.LOAN_PERIOD))
+                if result is True:
+                    loans.append(loan)
+            elif roll < 0.87:
+                i = rng.randrange(len(loans))
+                loans[i], loans[-1] = loans[-1], loans[i]
+                yield offset, "return_book", loans.pop()
+            elif roll < 0.90:
+                yield offset, "get_borrowers", (f"T{rng.randrange(books):08d}",)
+            elif roll < 0.93:
+                yield offset, "books_by_genre", (rng.choice(genres), True)
+            elif roll < 0.95:
+                yield offset, "overdue_loans", (now,)
+            elif roll < 0.97:
+                yield offset, "update_book", (f"T{rng.randrange(books):08d}", None, None, None, rng.randint(0, 5))
+            else:
+                # A book drop batch: returns of up to three open loans, applied all or nothing
+                batch = [loans.pop() for _ in range(min(len(loans), 3))]
+                result = yield offset, "process_loans", ([("return_book", *loan) for loan in batch],)
+                if not result["applied"]:
+                    loans.extend(batch)
+            offset += arrivals.expovariate(rate)
+
+    was_quiet = ag_operations._quiet
+    ag_operations.enable_quiet_mode()
+    written = 0
+    try:
+        with _open(path, "w") as f:
+            encode = json.JSONEncoder(separators=(",", ":")).encode
+            f.write(encode({"format": FORMAT, "started": epoch, "books": 0, "members": 0}) + "\n")
+            generated = workload()
+            result = None
+            while True:
+                try:
+                    offset, operation, args = generated.send(result)
+                except StopIteration:
+                    break
+                result = getattr(ag_operations, operation)(*args)
+                f.write(encode([round(offset, 6), operation, args, _summarize(operation, result, None)]) + "\n")
+                written += 1
+    finally:
+        if not was_quiet:
+            ag_operations.disable_quiet_mode()
+    return written
+
+
+#function to open a trace file, compressed or not
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+#function to turn a result into its recorded form
+def _summarize(operation, result, error):
+    """Returns the recorded form of an operation's result (see the trace file format)."""
+    if error is None and result.__class__ is Failure:
+        error = result.code
+    if error is not None:
+        return {"error": error}
+    if operation == "iter_search":
+        return None
+    if result is None or isinstance(result, (bool, int, float, str)):
+        return result
+    if operation == "search_page":
+        return {"crc": _checksum(operation, [result["total"], result["books"]]), "cursor": result["cursor"]}
+    return {"crc": _checksum(operation, result)}
+
+
+#function to checksum a list or dictionary result
+def _checksum(operation, result):
+    """Returns the crc32 of a result's canonical JSON (sorted if its order is unspecified, without loan dates)."""
+    plain = _plain(result)
+    if operation in UNORDERED and isinstance(plain, list):
+        plain.sort()
+    return zlib.crc32(json.dumps(plain, separators=(",", ":")).encode())
+
+
+def _plain(value):
+    """Converts a result to JSON values: records and views to dictionaries, failures to their error code."""
+    if value.__class__ is Failure:
+        return {"error": value.code}
+    if isinstance(value, Mapping):
+        return {key: _plain(item) for key, item in value.items() if key not in CLOCK_FIELDS}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record, generate and replay operation traces.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="write a synthetic trace")
+    generate.add_argument("path")
+    generate.add_argument("--calls", type=int, default=100_000)
+    generate.add_argument("--books", type=int, default=1_000)
+    generate.add_argument("--members", type=int, default=250)
+    generate.add_argument("--rate", type=float, default=1_000.0, help="average calls per second")
+    generate.add_argument("--seed", type=int, default=42)
+    play = commands.add_parser("replay", help="replay a trace and report throughput and latency")
+    play.add_argument("path")
+    play.add_argument("--speed", type=float, help="time scale (1.0 = recorded pace); as fast as possible if omitted")
+    play.add_argument("--no-verify", action="store_true", help="do not compare results")
+    play.add_argument("--data", help="recover this ag_persistence directory before replaying")
+    options = parser.parse_args()
+
+    if options.command == "generate":
+        count = generate_trace(options.path, options.calls, options.books, options.members, options.rate, options.seed)
+        print(f"Wrote {count:,} calls to {options.path}.")
+    else:
+        if options.data:
+            from ag_persistence import Persistence
+            Persistence(options.data).recover()
+        print_replay(replay(options.path, options.speed, not options.no_verify))